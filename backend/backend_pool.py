@@ -0,0 +1,176 @@
+"""下载后端实例池
+
+一个下载插件可以对应多个后端实例（如多个 Metube 容器、多台 qBittorrent）。
+实例池按最少活动任务或实测吞吐量为新任务选择实例，定期健康检查，
+连续失败的实例暂时剔除，恢复后重新加入。
+
+任务分配到的实例记录在任务 metadata 的 instance 字段中；
+平台任务ID 以 "实例名|ID" 的形式携带实例，查询进度和取消时路由到同一个实例。
+"""
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, List, Any, Optional, Tuple
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# 未配置实例列表时，使用插件原有的单个地址配置作为默认实例
+DEFAULT_INSTANCE = 'default'
+ID_SEPARATOR = '|'
+
+ROUTING_STRATEGIES = ['least_active', 'throughput']
+
+
+class BackendInstance:
+    """单个后端实例"""
+    
+    def __init__(self, name: str, url: str, options: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.url = url
+        self.options = options or {}  # 实例的其他配置（如用户名、密码）
+        
+        self.healthy = True
+        self.failures = 0  # 连续失败次数
+        self.checked_at = 0.0
+        self.error: Optional[str] = None
+        
+        self.active = 0  # 最近一次刷新时后端报告的活动任务数
+        self.assigned = 0  # 上次刷新后新分配的任务数
+        self.task_speed: Optional[float] = None  # 活动任务的平均速度（字节/秒，指数平滑）
+    
+    @property
+    def load(self) -> int:
+        return self.active + self.assigned
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'url': self.url,
+            'healthy': self.healthy,
+            'error': self.error,
+            'active': self.load,
+            'task_speed': self.task_speed
+        }
+
+
+class InstancePool:
+    """后端实例池"""
+    
+    def __init__(self, plugin_name: str, max_failures: int = 2, check_interval: float = 30.0):
+        self.plugin_name = plugin_name
+        self.max_failures = max_failures
+        self.check_interval = check_interval
+        
+        self.instances: Dict[str, BackendInstance] = {}
+        self._check_task: Optional[asyncio.Task] = None
+    
+    def configure(self, specs: List[Tuple[str, str, Dict[str, Any]]]):
+        """更新实例列表 [(名称, 地址, 其他配置)]，名称和地址不变的实例保留健康状态和统计"""
+        instances = {}
+        for name, url, options in specs:
+            instance = self.instances.get(name)
+            if instance is None or instance.url != url:
+                instance = BackendInstance(name, url, options)
+            else:
+                instance.options = options
+            instances[name] = instance
+        self.instances = instances
+    
+    def get(self, name: Optional[str]) -> Optional[BackendInstance]:
+        """按名称获取实例；名称未知时返回第一个实例（兼容未记录实例的旧任务）"""
+        instance = self.instances.get(name or DEFAULT_INSTANCE)
+        if instance is None and self.instances:
+            instance = next(iter(self.instances.values()))
+        return instance
+    
+    def choose(self, strategy: str = 'least_active', count: int = 1) -> Optional[BackendInstance]:
+        """为新任务选择实例（批量提交时 count 为一次分配的任务数）
+        
+        least_active: 活动任务最少的实例
+        throughput: 预计新任务速度最高的实例（单任务平均速度 / (活动任务数 + 1)），
+                    还没有测量数据的实例优先，以便获得测量值
+        全部实例都不健康时仍在所有实例中选择（健康状态可能已过时）。
+        """
+        candidates = [i for i in self.instances.values() if i.healthy] or list(self.instances.values())
+        if not candidates:
+            return None
+        
+        if strategy == 'throughput':
+            def score(instance: BackendInstance) -> float:
+                if instance.task_speed is None:
+                    return float('inf')
+                return instance.task_speed / (instance.load + 1)
+            chosen = max(candidates, key=lambda i: (score(i), -i.load))
+        else:
+            chosen = min(candidates, key=lambda i: i.load)
+        
+        chosen.assigned += count
+        return chosen
+    
+    def report_load(self, name: str, active: int, total_speed: float):
+        """刷新后端任务列表后报告活动任务数和总下载速度"""
+        instance = self.instances.get(name)
+        if instance is None:
+            return
+        instance.active = active
+        instance.assigned = 0
+        if active:
+            speed = total_speed / active
+            if instance.task_speed is None:
+                instance.task_speed = speed
+            else:
+                instance.task_speed = instance.task_speed * 0.7 + speed * 0.3
+    
+    def mark_success(self, name: str):
+        instance = self.instances.get(name)
+        if instance is None:
+            return
+        if not instance.healthy:
+            logger.info(f"[{self.plugin_name}] 实例恢复: {name} ({instance.url})")
+        instance.healthy = True
+        instance.failures = 0
+        instance.error = None
+    
+    def mark_failure(self, name: str, error: str):
+        """记录一次失败，连续失败 max_failures 次后剔除实例"""
+        instance = self.instances.get(name)
+        if instance is None:
+            return
+        instance.failures += 1
+        instance.error = error
+        if instance.healthy and instance.failures >= self.max_failures:
+            instance.healthy = False
+            logger.warning(f"[{self.plugin_name}] 实例不可用，暂时剔除: {name} ({instance.url}) - {error}")
+    
+    def maybe_check(self, check: Callable[[BackendInstance], Awaitable[None]]):
+        """距离上次健康检查超过 check_interval 时在后台检查所有实例（不阻塞调用者）"""
+        if self._check_task is not None and not self._check_task.done():
+            return
+        now = time.monotonic()
+        due = [i for i in self.instances.values() if now - i.checked_at >= self.check_interval]
+        if due:
+            self._check_task = asyncio.ensure_future(self._check(due, check))
+    
+    async def _check(self, instances: List[BackendInstance], check: Callable[[BackendInstance], Awaitable[None]]):
+        async def check_one(instance: BackendInstance):
+            instance.checked_at = time.monotonic()
+            try:
+                await check(instance)
+                self.mark_success(instance.name)
+            except Exception as e:
+                self.mark_failure(instance.name, str(e) or type(e).__name__)
+        
+        await asyncio.gather(*(check_one(instance) for instance in instances))
+    
+    def compose_id(self, instance_name: Optional[str], platform_id: str) -> str:
+        """平台任务ID 加上实例名（默认实例不加，保持与单实例配置兼容）"""
+        if not instance_name or instance_name == DEFAULT_INSTANCE:
+            return platform_id
+        return f"{instance_name}{ID_SEPARATOR}{platform_id}"
+    
+    def split_id(self, platform_id: str) -> Tuple[Optional[BackendInstance], str]:
+        """拆分 compose_id 生成的ID，返回 (实例, 后端任务ID)"""
+        name, sep, rest = platform_id.partition(ID_SEPARATOR)
+        if sep and name in self.instances:
+            return self.instances[name], rest
+        return self.get(DEFAULT_INSTANCE), platform_id
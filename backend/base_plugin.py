@@ -1,5 +1,6 @@
 from abc import ABC, abstractmethod
 from typing import Dict, List, Any, Optional
+import asyncio
 from models import ConfigField, SearchResult, DownloadTask
 from logger import get_logger
 
@@ -134,6 +135,9 @@ class SearchPlugin(BasePlugin):
 class DownloadPlugin(BasePlugin):
     """下载插件基类"""
     
+    # download_batch 默认实现的最大并发提交数
+    batch_concurrency = 8
+    
     @property
     @abstractmethod
     def name(self) -> str:
@@ -158,10 +162,58 @@ class DownloadPlugin(BasePlugin):
     def get_config_schema(self) -> List[ConfigField]:
         pass
     
+    def _scheduling_config_fields(self) -> List[ConfigField]:
+        """下载调度相关的通用配置项（同时下载任务数、批量任务下载时段），插件可追加到配置定义中"""
+        return [
+            ConfigField(
+                name="max_active",
+                label="同时下载任务数",
+                type="number",
+                default=0,
+                description="同时提交到该平台的任务数上限，超出的任务排队等待，0 表示不限制"
+            ),
+            ConfigField(
+                name="bulk_window",
+                label="批量任务下载时段",
+                type="text",
+                default="",
+                description="低优先级（批量）任务只在该时段内开始，如 01:00-07:00，留空表示不限制"
+            )
+        ]
+    
+    def get_url_priority(self, url: str) -> int:
+        """自动选择下载插件时的优先级
+        
+        多个插件支持同一种链接时选择优先级最高的，默认 0。
+        插件可以对更擅长处理的链接返回更高的值（如直接文件链接）。
+        """
+        return 0
+    
     @abstractmethod
     async def download(self, task: DownloadTask) -> bool:
         pass
     
+    async def download_batch(self, tasks: List[DownloadTask]) -> Dict[str, bool]:
+        """批量提交下载任务
+        
+        默认实现以有限并发逐个调用 download()，插件可覆盖为后端原生的批量接口。
+        
+        Returns:
+            Dict[str, bool]: {task_id: 是否提交成功}
+        """
+        semaphore = asyncio.Semaphore(self.batch_concurrency)
+        
+        async def submit(task: DownloadTask) -> bool:
+            async with semaphore:
+                try:
+                    return await self.download(task)
+                except Exception as e:
+                    logger.error(f"[{self.name}] 批量提交任务异常: {task.id} - {e}", exc_info=True)
+                    return False
+        
+        results = await asyncio.gather(*(submit(task) for task in tasks))
+        return {task.id: success for task, success in zip(tasks, results)}
+    
     @abstractmethod
     async def get_progress(self, platform_id: str) -> dict:
         """获取下载进度
@@ -174,6 +226,28 @@ class DownloadPlugin(BasePlugin):
         """
         pass
     
+    async def get_progress_batch(self, platform_ids: List[str]) -> Dict[str, dict]:
+        """批量获取下载进度
+        
+        默认实现并发调用 get_progress()，插件可覆盖为后端原生的批量查询。
+        
+        Returns:
+            Dict[str, dict]: {platform_id: get_progress() 的返回值}
+        """
+        results = await asyncio.gather(
+            *(self.get_progress(platform_id) for platform_id in platform_ids),
+            return_exceptions=True
+        )
+        return {
+            platform_id: result
+            for platform_id, result in zip(platform_ids, results)
+            if isinstance(result, dict)
+        }
+    
+    def get_platform_id(self, metadata: Dict[str, Any]) -> Optional[str]:
+        """从任务 metadata 中取出下载平台的任务ID（用于进度同步）"""
+        return metadata.get('platform_id')
+    
     @abstractmethod
     async def cancel(self, platform_id: str) -> bool:
         """取消/删除下载任务
@@ -186,6 +260,38 @@ class DownloadPlugin(BasePlugin):
         """
         pass
     
+    async def cancel_batch(self, platform_ids: List[str]) -> Dict[str, bool]:
+        """批量取消下载任务
+        
+        默认实现并发调用 cancel()，插件可覆盖为后端原生的批量删除。
+        
+        Returns:
+            Dict[str, bool]: {platform_id: 是否成功取消}
+        """
+        results = await asyncio.gather(
+            *(self.cancel(platform_id) for platform_id in platform_ids),
+            return_exceptions=True
+        )
+        return {
+            platform_id: result is True
+            for platform_id, result in zip(platform_ids, results)
+        }
+    
+    async def prepare_retry(self, platform_ids: List[str]) -> Dict[str, bool]:
+        """重新提交前清理平台上这些任务的旧记录
+        
+        默认不做任何处理（重新提交时插件自行续传）；
+        平台会保留失败记录、或不允许重复添加的插件应重写此方法。
+        
+        Returns:
+            Dict[str, bool]: {platform_id: 是否可以重新提交}
+        """
+        return {platform_id: True for platform_id in platform_ids}
+    
+    async def close(self):
+        """释放插件持有的连接等资源（服务停止或插件被卸载时调用），默认不做任何处理"""
+        pass
+    
     @abstractmethod
     async def get_downloads(self) -> List[Dict[str, Any]]:
         """获取该平台的所有下载记录
@@ -198,12 +304,43 @@ class DownloadPlugin(BasePlugin):
                 - url: 下载链接
                 - status: 状态 (pending/downloading/completed/failed)
                 - progress: 进度 (0-100)
-                - speed: 下载速度（可选）
-                - eta: 预计剩余时间（可选）
+                - speed: 下载速度，格式化字符串（可选）
+                - eta: 预计剩余时间，格式化字符串（可选）
+                - speed_bps: 下载速度，字节/秒（可选，用于排序）
+                - eta_seconds: 预计剩余秒数（可选，用于排序）
                 - created_at: 创建时间（可选）
         """
         pass
     
+    def _format_speed(self, speed_bytes: Optional[float]) -> str:
+        """格式化速度（字节/秒 -> 可读格式）"""
+        if not speed_bytes:
+            return ''
+        
+        units = ['B/s', 'KB/s', 'MB/s', 'GB/s']
+        unit_index = 0
+        speed = float(speed_bytes)
+        
+        while speed >= 1024 and unit_index < len(units) - 1:
+            speed /= 1024
+            unit_index += 1
+        
+        return f"{speed:.1f} {units[unit_index]}"
+    
+    def _format_eta(self, eta_seconds: Optional[float]) -> str:
+        """格式化ETA（秒 -> 可读格式）"""
+        if not eta_seconds or eta_seconds <= 0 or eta_seconds == 8640000:  # 8640000 表示无限大
+            return ''
+        
+        eta_seconds = int(eta_seconds)
+        hours = eta_seconds // 3600
+        minutes = (eta_seconds % 3600) // 60
+        
+        if hours > 0:
+            return f"{hours}h {minutes}m"
+        else:
+            return f"{minutes}m"
+    
     @abstractmethod
     def get_web_ui_url(self) -> str:
         """获取该平台的 Web UI 地址
@@ -212,3 +349,11 @@ class DownloadPlugin(BasePlugin):
             str: Web UI 地址，如 "http://localhost:8081"
         """
         pass
+    
+    def get_backend_instances(self) -> List[Dict[str, Any]]:
+        """获取后端实例的健康状态和负载（配置了多个后端实例的插件重写）
+        
+        Returns:
+            List[Dict]: [{'name', 'url', 'healthy', 'error', 'active', 'task_speed'}]
+        """
+        return []
@@ -0,0 +1,95 @@
+"""数据库单次操作耗时基准
+
+比较两种连接方式下 Database 各操作的平均耗时（微秒/次）：
+  per-call:   每次操作打开新连接，默认 rollback 日志（常驻连接之前的实现方式）
+  persistent: 常驻 WAL 写连接和读连接池（当前实现）
+
+用法（在 backend 目录下运行）:
+    python benchmarks/bench_database.py [任务数，默认 2000]
+"""
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+logging.disable(logging.CRITICAL)
+
+from database import Database
+
+
+class PerCallDatabase(Database):
+    """每次操作打开新连接的 Database（用于对比）"""
+    
+    def __init__(self, db_path: str):
+        super().__init__(db_path, readers=1)
+        super().close()
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("PRAGMA journal_mode = DELETE")
+    
+    @contextmanager
+    def _write(self):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+    
+    @contextmanager
+    def _read(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+    
+    def close(self):
+        pass
+
+
+def run(db: Database, ids: list) -> dict:
+    """依次执行各操作，返回 {操作: 微秒/次}"""
+    results = {}
+    
+    def bench(name, fn, repeat=None):
+        items = ids if repeat is None else range(repeat)
+        started = time.perf_counter()
+        for item in items:
+            fn(item)
+        results[name] = (time.perf_counter() - started) / len(items) * 1e6
+    
+    bench('add_task', lambda i: db.add_task({
+        'id': i, 'title': 't', 'url': 'u' + i, 'status': 'pending', 'plugin_name': 'p', 'metadata': {'a': 1}
+    }))
+    bench('update_task', lambda i: db.update_task(i, {'status': 'downloading', 'progress': 50.0}))
+    bench('get_task', lambda i: db.get_task(i))
+    bench('by_status(50)', lambda _: db.get_tasks_by_status('downloading', 50), repeat=200)
+    return results
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    ids = [uuid.uuid4().hex for _ in range(count)]
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        before = PerCallDatabase(os.path.join(tmp, 'per_call.db'))
+        before_results = run(before, ids)
+        
+        after = Database(os.path.join(tmp, 'persistent.db'))
+        after_results = run(after, ids)
+        after.close()
+    
+    print(f"{count} 个任务，平均每次操作耗时 (us)")
+    print(f"{'':16s}{'per-call':>10s}{'persistent':>12s}")
+    for name, value in before_results.items():
+        print(f"{name:16s}{value:10.1f}{after_results[name]:12.1f}")
+
+
+if __name__ == '__main__':
+    main()
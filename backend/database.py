@@ -1,29 +1,183 @@
 """
 数据库模块
 使用 SQLite 存储下载任务
+
+数据库以 WAL 模式运行，保持常驻连接：一个写连接（加锁串行写入）和一个读连接池，
+读写互不阻塞，避免每次操作重新打开连接和默认日志模式下每次提交的 fsync。
+
+异步代码（接口、下载插件、后台服务）通过 AsyncDatabase 访问数据库，
+查询在专用的数据库线程中执行，磁盘 I/O 慢时也不会阻塞事件循环。
 """
+import asyncio
+import base64
 import sqlite3
 import json
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from collections.abc import MutableMapping
+from typing import Callable, Iterator, List, Dict, Any, Optional, Sequence, Tuple
 from datetime import datetime
+from torrent_utils import source_url_for
 from logger import get_logger
 
 logger = get_logger(__name__)
 
+ARCHIVE_TABLE = 'download_tasks_archive'
+# 已结束的任务状态（超过保留期后移入归档表）
+FINISHED_STATUSES = ('completed', 'failed', 'canceled')
+
+# 每个连接执行的 PRAGMA
+CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous = NORMAL",  # WAL 模式下只在检查点时 fsync，断电最多丢失最近的提交
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA cache_size = -16000",  # 16MB 页缓存
+    "PRAGMA mmap_size = 268435456",  # 256MB 内存映射读取
+    "PRAGMA temp_store = MEMORY",
+)
+CACHED_STATEMENTS = 128
+# 任务列可以直接写入的值类型（metadata 为可序列化为 JSON 的字典）
+BINDABLE_TYPES = (type(None), int, float, str, bytes)
+
+_UNSET = object()
+
+
+def encode_task_cursor(created_at: str, task_id: str) -> str:
+    """任务列表的分页游标（本页最后一个任务的 (created_at, id)）"""
+    return base64.urlsafe_b64encode(json.dumps([created_at, task_id]).encode()).decode()
+
+
+def decode_task_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        created_at, task_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (TypeError, ValueError):
+        raise ValueError(f"无效的分页游标: {cursor}")
+    return (str(created_at), str(task_id))
+
+
+class TaskRow(MutableMapping):
+    """查询返回的任务（兼容 dict 的访问方式）
+    
+    直接包装 sqlite3.Row，不为每一行复制字典；metadata 在第一次访问时才解析 JSON，
+    只读取其他字段的列表不需要解析。对任务的修改保存在行对象中，不会写回数据库。
+    """
+    __slots__ = ('_row', '_metadata', '_changes')
+    
+    def __init__(self, row: sqlite3.Row):
+        self._row = row
+        self._metadata = _UNSET
+        self._changes: Optional[Dict[str, Any]] = None
+    
+    def __getitem__(self, key: str) -> Any:
+        if self._changes is not None and key in self._changes:
+            return self._changes[key]
+        if key == 'metadata':
+            if self._metadata is _UNSET:
+                self._metadata = self._decode_metadata()
+            return self._metadata
+        try:
+            return self._row[key]
+        except IndexError:
+            raise KeyError(key) from None
+    
+    def _decode_metadata(self) -> Dict[str, Any]:
+        try:
+            raw = self._row['metadata']
+        except IndexError:
+            raise KeyError('metadata') from None
+        try:
+            return json.loads(raw) if raw else {}
+        except ValueError:
+            return {}
+    
+    def __setitem__(self, key: str, value: Any):
+        if self._changes is None:
+            self._changes = {}
+        self._changes[key] = value
+    
+    def __delitem__(self, key: str):
+        raise TypeError("不能删除任务的字段")
+    
+    def __contains__(self, key) -> bool:
+        return key in self._row.keys() or (self._changes is not None and key in self._changes)
+    
+    def __iter__(self) -> Iterator[str]:
+        keys = self._row.keys()
+        yield from keys
+        if self._changes:
+            yield from (key for key in self._changes if key not in keys)
+    
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+    
+    def __repr__(self) -> str:
+        return f"TaskRow({dict(self)!r})"
+
 
 class Database:
     """数据库管理类"""
     
-    def __init__(self, db_path: str = "data/downloads.db"):
+    def __init__(self, db_path: str = "data/downloads.db", readers: int = 4):
         self.db_path = Path(db_path)
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        
+        self._write_lock = threading.Lock()
+        self._writer = self._connect()
+        self._columns: set = set()  # 下载任务表的列（校验查询的列）
+        self._readers: queue.Queue = queue.Queue()
+        self._reader_count = readers
         self._init_db()
+        for _ in range(readers):
+            self._readers.put(self._connect(reader=True))
+    
+    def _connect(self, reader: bool = False) -> sqlite3.Connection:
+        """打开一个常驻连接（可在多个线程中使用，由调用方保证同一时间只有一个线程使用）"""
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, cached_statements=CACHED_STATEMENTS)
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        if reader:
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA query_only = 1")
+        return conn
+    
+    @contextmanager
+    def _write(self):
+        """获取写连接，代码块结束时提交事务（异常时回滚）"""
+        with self._write_lock:
+            with self._writer:
+                yield self._writer
+    
+    @contextmanager
+    def _read(self):
+        """从读连接池取出一个连接，用完放回"""
+        conn = self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put(conn)
+    
+    def close(self):
+        """关闭所有连接（关闭写连接时 SQLite 会执行检查点并删除 WAL 文件）"""
+        for _ in range(self._reader_count):
+            self._readers.get().close()
+        self._reader_count = 0
+        with self._write_lock:
+            self._writer.close()
+        logger.info("数据库连接已关闭")
     
     def _init_db(self):
         """初始化数据库表"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._write_lock:
+                conn = self._writer
+                self._ensure_incremental_vacuum(conn)
+                journal_mode = conn.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+                if journal_mode != 'wal':
+                    logger.warning(f"数据库无法启用 WAL 模式，当前日志模式: {journal_mode}")
                 cursor = conn.cursor()
                 
                 # 创建下载任务表
@@ -42,33 +196,184 @@ class Database:
                     )
                 """)
                 
-                # 创建索引
+                # 创建索引：列表按 (created_at, id) 倒序分页，按状态查询时使用 (status, created_at, id)，
+                # 排序和游标条件都由索引完成，不需要临时排序
+                cursor.execute("DROP INDEX IF EXISTS idx_status")
+                cursor.execute("DROP INDEX IF EXISTS idx_created_at")
+                
+                cursor.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_status_created 
+                    ON download_tasks(status, created_at DESC, id DESC)
+                """)
+                
+                cursor.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_created_id 
+                    ON download_tasks(created_at DESC, id DESC)
+                """)
+                
+                # 归档表：超过保留期的已结束任务，结构与下载任务表相同
+                cursor.execute(f"""
+                    CREATE TABLE IF NOT EXISTS {ARCHIVE_TABLE} (
+                        id TEXT PRIMARY KEY,
+                        title TEXT NOT NULL,
+                        url TEXT NOT NULL,
+                        status TEXT NOT NULL,
+                        progress REAL DEFAULT 0.0,
+                        plugin_name TEXT NOT NULL,
+                        save_path TEXT,
+                        metadata TEXT,
+                        created_at TIMESTAMP,
+                        updated_at TIMESTAMP,
+                        archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                """)
+                
+                cursor.execute(f"""
+                    CREATE INDEX IF NOT EXISTS idx_archived_at 
+                    ON {ARCHIVE_TABLE}(archived_at)
+                """)
+                
+                self._migrate(cursor)
+                self._columns = set(self._task_columns(cursor))
+                
+                # 按下载平台任务ID / 资源地址查找任务（进度同步、取消、去重）
                 cursor.execute("""
-                    CREATE INDEX IF NOT EXISTS idx_status 
-                    ON download_tasks(status)
+                    CREATE INDEX IF NOT EXISTS idx_platform_id 
+                    ON download_tasks(plugin_name, platform_id)
                 """)
                 
                 cursor.execute("""
-                    CREATE INDEX IF NOT EXISTS idx_created_at 
-                    ON download_tasks(created_at DESC)
+                    CREATE INDEX IF NOT EXISTS idx_source_url 
+                    ON download_tasks(source_url)
                 """)
                 
                 conn.commit()
                 logger.info(f"数据库初始化成功: {self.db_path}")
-                
+        
         except Exception as e:
             logger.error(f"数据库初始化失败: {e}", exc_info=True)
     
+    def _ensure_incremental_vacuum(self, conn: sqlite3.Connection):
+        """新数据库启用增量 VACUUM（auto_vacuum=INCREMENTAL，建表前设置即可生效）
+        
+        旧数据库需要执行一次完整 VACUUM 才能转换，耗时随数据库大小增长且期间阻塞写入，
+        不在启动时执行，由数据库维护显式触发（convert_incremental_vacuum）。
+        """
+        mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+        if mode == 2:
+            return
+        
+        page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+        if page_count == 0:
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        else:
+            logger.info("数据库未启用增量 VACUUM，可执行 POST /api/storage/maintenance?full_vacuum=true 转换（一次完整 VACUUM）")
+    
+    def convert_incremental_vacuum(self) -> bool:
+        """把旧数据库转换为增量 VACUUM 模式（执行一次完整 VACUUM），返回是否执行了转换"""
+        try:
+            with self._write_lock:
+                conn = self._writer
+                if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+                    return False
+                
+                logger.info("数据库维护: 启用增量 VACUUM（执行一次完整 VACUUM）")
+                started = time.time()
+                conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                conn.execute("VACUUM")
+            logger.info(f"数据库已转换为增量 VACUUM 模式，耗时 {time.time() - started:.1f}s")
+            return True
+        
+        except Exception as e:
+            logger.error(f"转换增量 VACUUM 模式失败: {e}", exc_info=True)
+            return False
+    
+    def _task_columns(self, cursor: sqlite3.Cursor, table: str = 'download_tasks') -> List[str]:
+        cursor.execute(f"PRAGMA table_info({table})")
+        return [row[1] for row in cursor.fetchall()]
+    
+    def _migrate(self, cursor: sqlite3.Cursor):
+        """为旧数据库补充新增的列（下载任务表和归档表保持相同的列）"""
+        new_columns = {
+            # 下载任务队列：已尝试提交次数和最近一次错误
+            'attempts': "INTEGER DEFAULT 0",
+            'error': "TEXT",
+            # 下载平台的任务ID（由插件的 get_platform_id 从 metadata 计算）和资源的规范化地址
+            'platform_id': "TEXT",
+            'source_url': "TEXT",
+        }
+        
+        for table in ('download_tasks', ARCHIVE_TABLE):
+            columns = set(self._task_columns(cursor, table))
+            for name, definition in new_columns.items():
+                if name not in columns:
+                    cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+                    logger.info(f"数据库迁移: 添加列 {table}.{name}")
+        
+        self._backfill_source_urls(cursor)
+    
+    def _backfill_source_urls(self, cursor: sqlite3.Cursor):
+        """为旧任务计算 source_url"""
+        cursor.execute("SELECT id, url, metadata FROM download_tasks WHERE source_url IS NULL")
+        rows = cursor.fetchall()
+        if not rows:
+            return
+        
+        updates = []
+        for task_id, url, metadata in rows:
+            try:
+                infohash = (json.loads(metadata) if metadata else {}).get('infohash')
+            except (ValueError, AttributeError):
+                infohash = None
+            updates.append((source_url_for(url, infohash), task_id))
+        cursor.executemany("UPDATE download_tasks SET source_url = ? WHERE id = ?", updates)
+        logger.info(f"数据库迁移: 计算 {len(updates)} 个任务的 source_url")
+    
+    def backfill_platform_ids(self, resolve: Callable[[str, Dict[str, Any]], Optional[str]]) -> int:
+        """为还没有 platform_id 的任务从 metadata 计算下载平台任务ID
+        
+        Args:
+            resolve: (插件名称, metadata) -> 平台任务ID，插件不存在或没有ID时返回 None
+        
+        Returns:
+            int: 更新的任务数
+        """
+        try:
+            with self._write() as conn:
+                rows = conn.execute("""
+                    SELECT id, plugin_name, metadata FROM download_tasks 
+                    WHERE platform_id IS NULL AND metadata IS NOT NULL AND metadata NOT IN ('', '{}')
+                """).fetchall()
+                
+                updates = []
+                for task_id, plugin_name, metadata in rows:
+                    try:
+                        platform_id = resolve(plugin_name, json.loads(metadata))
+                    except Exception:
+                        platform_id = None
+                    if platform_id:
+                        updates.append((platform_id, task_id))
+                
+                conn.executemany("UPDATE download_tasks SET platform_id = ? WHERE id = ?", updates)
+            
+            if updates:
+                logger.info(f"数据库迁移: 计算 {len(updates)} 个任务的 platform_id")
+            return len(updates)
+        
+        except Exception as e:
+            logger.error(f"计算任务 platform_id 失败: {e}", exc_info=True)
+            return 0
+    
     def add_task(self, task: Dict[str, Any]) -> bool:
         """添加下载任务"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._write() as conn:
                 cursor = conn.cursor()
                 
                 cursor.execute("""
                     INSERT INTO download_tasks 
-                    (id, title, url, status, progress, plugin_name, save_path, metadata)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    (id, title, url, status, progress, plugin_name, save_path, metadata, source_url)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
                 """, (
                     task['id'],
                     task['title'],
@@ -77,56 +382,72 @@ class Database:
                     task.get('progress', 0.0),
                     task['plugin_name'],
                     task.get('save_path', ''),
-                    json.dumps(task.get('metadata', {}))
+                    json.dumps(task.get('metadata', {})),
+                    source_url_for(task['url'], (task.get('metadata') or {}).get('infohash'))
                 ))
                 
-                conn.commit()
                 logger.info(f"任务已添加: {task['id']} - {task['title']}")
                 return True
-                
+        
         except Exception as e:
             logger.error(f"添加任务失败: {e}", exc_info=True)
             return False
     
-    def get_all_tasks(self, limit: int = 100) -> List[Dict[str, Any]]:
-        """获取所有任务"""
+    def add_tasks(self, tasks: List[Dict[str, Any]]) -> bool:
+        """批量添加下载任务（单个事务）"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.row_factory = sqlite3.Row
+            with self._write() as conn:
                 cursor = conn.cursor()
                 
-                cursor.execute("""
-                    SELECT * FROM download_tasks 
-                    ORDER BY created_at DESC 
-                    LIMIT ?
-                """, (limit,))
-                
-                rows = cursor.fetchall()
-                tasks = []
+                cursor.executemany("""
+                    INSERT INTO download_tasks 
+                    (id, title, url, status, progress, plugin_name, save_path, metadata, source_url)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, [
+                    (
+                        task['id'],
+                        task['title'],
+                        task['url'],
+                        task['status'],
+                        task.get('progress', 0.0),
+                        task['plugin_name'],
+                        task.get('save_path', ''),
+                        json.dumps(task.get('metadata', {})),
+                        source_url_for(task['url'], (task.get('metadata') or {}).get('infohash'))
+                    )
+                    for task in tasks
+                ])
                 
-                for row in rows:
-                    task = dict(row)
-                    # 解析 metadata JSON
-                    if task['metadata']:
-                        try:
-                            task['metadata'] = json.loads(task['metadata'])
-                        except:
-                            task['metadata'] = {}
-                    else:
-                        task['metadata'] = {}
-                    tasks.append(task)
+                logger.info(f"批量添加任务: {len(tasks)} 个")
+                return True
+        
+        except Exception as e:
+            logger.error(f"批量添加任务失败: {e}", exc_info=True)
+            return False
+    
+    def get_all_tasks(self, limit: int = 100, columns: Optional[Sequence[str]] = None) -> List[TaskRow]:
+        """获取所有任务（columns 为要读取的列，为空时读取全部列）"""
+        select = self._select_list(columns)
+        try:
+            with self._read() as conn:
+                cursor = conn.cursor()
                 
-                return tasks
+                cursor.execute(f"""
+                    SELECT {select} FROM download_tasks 
+                    ORDER BY created_at DESC, id DESC 
+                    LIMIT ?
+                """, (limit,))
                 
+                return [TaskRow(row) for row in cursor.fetchall()]
+        
         except Exception as e:
             logger.error(f"获取任务列表失败: {e}", exc_info=True)
             return []
     
-    def get_task(self, task_id: str) -> Optional[Dict[str, Any]]:
+    def get_task(self, task_id: str) -> Optional[TaskRow]:
         """获取单个任务"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.row_factory = sqlite3.Row
+            with self._read() as conn:
                 cursor = conn.cursor()
                 
                 cursor.execute("""
@@ -134,17 +455,8 @@ class Database:
                 """, (task_id,))
                 
                 row = cursor.fetchone()
-                if row:
-                    task = dict(row)
-                    if task['metadata']:
-                        try:
-                            task['metadata'] = json.loads(task['metadata'])
-                        except:
-                            task['metadata'] = {}
-                    return task
-                
-                return None
-                
+                return TaskRow(row) if row else None
+        
         except Exception as e:
             logger.error(f"获取任务失败: {e}", exc_info=True)
             return None
@@ -152,7 +464,7 @@ class Database:
     def update_task(self, task_id: str, updates: Dict[str, Any]) -> bool:
         """更新任务"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._write() as conn:
                 cursor = conn.cursor()
                 
                 # 构建更新语句
@@ -175,67 +487,562 @@ class Database:
                 """
                 
                 cursor.execute(sql, values)
-                conn.commit()
                 
                 logger.debug(f"任务已更新: {task_id}")
                 return True
-                
+        
         except Exception as e:
             logger.error(f"更新任务失败: {e}", exc_info=True)
             return False
     
+    def update_tasks(self, updates: Dict[str, Dict[str, Any]]) -> bool:
+        """批量更新任务（单个事务，更新字段相同的任务合并为一次 executemany）
+        
+        Args:
+            updates: {task_id: {字段: 值}}
+        """
+        if not updates:
+            return True
+        
+        # 按更新的字段分组
+        groups: Dict[tuple, List[list]] = {}
+        for task_id, fields in updates.items():
+            values = [json.dumps(value) if key == 'metadata' else value for key, value in fields.items()]
+            values.append(task_id)
+            groups.setdefault(tuple(fields), []).append(values)
+        
+        try:
+            with self._write() as conn:
+                cursor = conn.cursor()
+                
+                for keys, rows in groups.items():
+                    set_clauses = [f"{key} = ?" for key in keys]
+                    set_clauses.append("updated_at = CURRENT_TIMESTAMP")
+                    cursor.executemany(f"""
+                        UPDATE download_tasks 
+                        SET {', '.join(set_clauses)}
+                        WHERE id = ?
+                    """, rows)
+                
+                logger.debug(f"批量更新任务: {len(updates)} 个")
+                return True
+        
+        except Exception as e:
+            logger.error(f"批量更新任务失败: {e}", exc_info=True)
+            return False
+    
+    def update_tasks_each(self, updates: Dict[str, Dict[str, Any]]) -> List[str]:
+        """逐个更新任务（每个任务单独提交，一个任务失败不影响其他任务），返回写入失败的任务ID"""
+        return [task_id for task_id, fields in updates.items() if not self.update_task(task_id, fields)]
+    
     def delete_task(self, task_id: str) -> bool:
         """删除任务"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._write() as conn:
                 cursor = conn.cursor()
                 
                 cursor.execute("""
                     DELETE FROM download_tasks WHERE id = ?
                 """, (task_id,))
                 
-                conn.commit()
                 logger.info(f"任务已删除: {task_id}")
                 return True
-                
+        
         except Exception as e:
             logger.error(f"删除任务失败: {e}", exc_info=True)
             return False
     
-    def get_tasks_by_status(self, status: str) -> List[Dict[str, Any]]:
-        """根据状态获取任务"""
+    def get_tasks_by_status(self, status: str, limit: Optional[int] = None,
+                            columns: Optional[Sequence[str]] = None) -> List[TaskRow]:
+        """根据状态获取任务（按创建时间倒序，limit 为空时返回全部；columns 为要读取的列，为空时读取全部列）"""
+        select = self._select_list(columns)
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.row_factory = sqlite3.Row
+            with self._read() as conn:
                 cursor = conn.cursor()
                 
-                cursor.execute("""
-                    SELECT * FROM download_tasks 
+                cursor.execute(f"""
+                    SELECT {select} FROM download_tasks 
                     WHERE status = ?
-                    ORDER BY created_at DESC
-                """, (status,))
+                    ORDER BY created_at DESC, id DESC
+                    LIMIT ?
+                """, (status, limit if limit is not None else -1))
                 
-                rows = cursor.fetchall()
-                tasks = []
+                return [TaskRow(row) for row in cursor.fetchall()]
+        
+        except Exception as e:
+            logger.error(f"获取任务失败: {e}", exc_info=True)
+            return []
+    
+    def list_tasks(self, statuses=None, limit: int = 50, cursor: Optional[str] = None,
+                   columns: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+        """按 (created_at, id) 倒序分页列出任务（keyset 分页）
+        
+        cursor 为上一页返回的 next_cursor，从该任务之后继续读取。不过滤或只过滤一个状态时，
+        条件和排序都由索引完成，翻到多深都只读取一页的行（多个状态时需要合并排序）。
+        statuses 为空时不过滤状态；columns 为要读取的列（总是包含 created_at）。
+        返回 {'tasks': [...], 'next_cursor': 下一页的游标，没有下一页时为 None}。
+        """
+        select = self._select_list(('created_at', *columns) if columns else None)
+        after = decode_task_cursor(cursor) if cursor else None
+        
+        where, params = self._status_filter(statuses)
+        if after is not None:
+            where += " AND (created_at, id) < (?, ?)"
+            params += after
+        
+        try:
+            with self._read() as conn:
+                cursor = conn.cursor()
                 
-                for row in rows:
-                    task = dict(row)
-                    if task['metadata']:
-                        try:
-                            task['metadata'] = json.loads(task['metadata'])
-                        except:
-                            task['metadata'] = {}
-                    tasks.append(task)
+                # 多读一行判断是否还有下一页
+                cursor.execute(f"""
+                    SELECT {select} FROM download_tasks 
+                    WHERE 1 = 1{where}
+                    ORDER BY created_at DESC, id DESC
+                    LIMIT ?
+                """, (*params, limit + 1))
                 
-                return tasks
+                tasks = [TaskRow(row) for row in cursor.fetchall()]
+        
+        except Exception as e:
+            logger.error(f"分页获取任务失败: {e}", exc_info=True)
+            return {'tasks': [], 'next_cursor': None}
+        
+        next_cursor = None
+        if len(tasks) > limit:
+            tasks = tasks[:limit]
+            next_cursor = encode_task_cursor(tasks[-1]['created_at'], tasks[-1]['id'])
+        return {'tasks': tasks, 'next_cursor': next_cursor}
+    
+    def _select_list(self, columns: Optional[Sequence[str]]) -> str:
+        """SELECT 的列：columns 为空时为全部列，否则为指定的列（总是包含 id）"""
+        if not columns:
+            return '*'
+        unknown = set(columns) - self._columns
+        if unknown:
+            raise ValueError(f"未知的任务列: {', '.join(sorted(unknown))}")
+        return ', '.join(dict.fromkeys(('id', *columns)))
+    
+    def _status_filter(self, statuses) -> tuple:
+        """生成 status IN (...) 条件，statuses 为空时不过滤"""
+        if not statuses:
+            return '', ()
+        return f" AND status IN ({', '.join('?' for _ in statuses)})", tuple(statuses)
+    
+    def get_task_by_platform_id(self, plugin_name: str, platform_id: str) -> Optional[TaskRow]:
+        """根据下载平台任务ID获取任务（同一平台任务ID有多个任务时返回最新的）"""
+        tasks = self.get_tasks_by_platform_ids(plugin_name, [platform_id])
+        return tasks[0] if tasks else None
+    
+    def get_tasks_by_platform_ids(self, plugin_name: str, platform_ids: List[str],
+                                  statuses=None) -> List[TaskRow]:
+        """根据下载平台任务ID批量获取任务（按创建时间倒序，可按状态过滤）"""
+        if not platform_ids:
+            return []
+        
+        status_clause, status_values = self._status_filter(statuses)
+        try:
+            with self._read() as conn:
+                cursor = conn.cursor()
+                
+                cursor.execute(f"""
+                    SELECT * FROM download_tasks 
+                    WHERE plugin_name = ? AND platform_id IN ({', '.join('?' for _ in platform_ids)}){status_clause}
+                    ORDER BY created_at DESC, id DESC
+                """, (plugin_name, *platform_ids, *status_values))
+                
+                return [TaskRow(row) for row in cursor.fetchall()]
+        
+        except Exception as e:
+            logger.error(f"获取任务失败: {e}", exc_info=True)
+            return []
+    
+    def get_tasks_by_source_urls(self, source_urls: List[str], statuses=None) -> List[TaskRow]:
+        """根据资源地址（source_url）获取任务（按创建时间倒序，可按状态过滤）"""
+        if not source_urls:
+            return []
+        
+        status_clause, status_values = self._status_filter(statuses)
+        try:
+            with self._read() as conn:
+                cursor = conn.cursor()
+                
+                cursor.execute(f"""
+                    SELECT * FROM download_tasks 
+                    WHERE source_url IN ({', '.join('?' for _ in source_urls)}){status_clause}
+                    ORDER BY created_at DESC, id DESC
+                """, (*source_urls, *status_values))
                 
+                return [TaskRow(row) for row in cursor.fetchall()]
+        
         except Exception as e:
             logger.error(f"获取任务失败: {e}", exc_info=True)
             return []
+    
+    def archive_tasks(self, older_than_days: float, batch_size: int = 500) -> int:
+        """把更新时间早于 older_than_days 天的已结束任务分批移入归档表
+        
+        每批在一个短事务中复制并删除，不会长时间阻塞其他写入。
+        
+        Returns:
+            int: 归档的任务数
+        """
+        placeholders = ', '.join('?' for _ in FINISHED_STATUSES)
+        total = 0
+        
+        try:
+            while True:
+                with self._write() as conn:
+                    cursor = conn.cursor()
+                    
+                    cursor.execute(f"""
+                        SELECT id FROM download_tasks 
+                        WHERE status IN ({placeholders}) AND updated_at < datetime('now', ?)
+                        LIMIT ?
+                    """, (*FINISHED_STATUSES, f"-{older_than_days} days", batch_size))
+                    ids = [row[0] for row in cursor.fetchall()]
+                    if not ids:
+                        break
+                    
+                    columns = ', '.join(self._task_columns(cursor))
+                    id_placeholders = ', '.join('?' for _ in ids)
+                    cursor.execute(f"""
+                        INSERT OR REPLACE INTO {ARCHIVE_TABLE} ({columns}) 
+                        SELECT {columns} FROM download_tasks WHERE id IN ({id_placeholders})
+                    """, ids)
+                    cursor.execute(f"DELETE FROM download_tasks WHERE id IN ({id_placeholders})", ids)
+                
+                total += len(ids)
+                if len(ids) < batch_size:
+                    break
+            
+            if total:
+                logger.info(f"归档任务: {total} 个（早于 {older_than_days} 天）")
+            return total
+        
+        except Exception as e:
+            logger.error(f"归档任务失败: {e}", exc_info=True)
+            return total
+    
+    def purge_archive(self, older_than_days: float) -> int:
+        """删除归档时间早于 older_than_days 天的归档任务"""
+        try:
+            with self._write() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    f"DELETE FROM {ARCHIVE_TABLE} WHERE archived_at < datetime('now', ?)",
+                    (f"-{older_than_days} days",)
+                )
+                if cursor.rowcount:
+                    logger.info(f"清理归档任务: {cursor.rowcount} 个（早于 {older_than_days} 天）")
+                return cursor.rowcount
+        
+        except Exception as e:
+            logger.error(f"清理归档任务失败: {e}", exc_info=True)
+            return 0
+    
+    def optimize(self, analyze: bool = False, vacuum_pages: int = 0) -> Dict[str, Any]:
+        """数据库维护：ANALYZE（可选）、PRAGMA optimize 和增量 VACUUM
+        
+        Args:
+            analyze: 是否重新收集全部统计信息（大量归档后执行）
+            vacuum_pages: 最多回收的空闲页数，0 表示回收全部
+        
+        Returns:
+            dict: {'freed_pages': 回收的页数}
+        """
+        try:
+            with self._write() as conn:
+                if analyze:
+                    conn.execute("ANALYZE")
+                conn.execute("PRAGMA optimize")
+                
+                free_before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+                # executescript 才会执行完整个 incremental_vacuum（execute 只回收一页）
+                conn.executescript(f"PRAGMA incremental_vacuum({int(vacuum_pages)});")
+                free_after = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            
+            freed = free_before - free_after
+            logger.debug(f"数据库维护完成: ANALYZE={analyze}, 回收 {freed} 页")
+            return {'freed_pages': freed}
+        
+        except Exception as e:
+            logger.error(f"数据库维护失败: {e}", exc_info=True)
+            return {'freed_pages': 0}
+    
+    def get_storage_stats(self) -> Dict[str, Any]:
+        """存储统计：文件大小、页使用情况、各状态任务数和归档任务数"""
+        try:
+            with self._read() as conn:
+                page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+                page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+                freelist_count = conn.execute("PRAGMA freelist_count").fetchone()[0]
+                auto_vacuum = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+                journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+                
+                by_status = dict(conn.execute(
+                    "SELECT status, COUNT(*) FROM download_tasks GROUP BY status"
+                ).fetchall())
+                oldest = conn.execute("SELECT MIN(created_at) FROM download_tasks").fetchone()[0]
+                archived, oldest_archived = conn.execute(
+                    f"SELECT COUNT(*), MIN(archived_at) FROM {ARCHIVE_TABLE}"
+                ).fetchone()
+            
+            wal_path = self.db_path.with_name(self.db_path.name + '-wal')
+            return {
+                'path': str(self.db_path),
+                'file_size': self.db_path.stat().st_size,
+                'wal_size': wal_path.stat().st_size if wal_path.exists() else 0,
+                'page_size': page_size,
+                'page_count': page_count,
+                'free_pages': freelist_count,
+                'auto_vacuum': {0: 'none', 1: 'full', 2: 'incremental'}.get(auto_vacuum, auto_vacuum),
+                'journal_mode': journal_mode,
+                'tasks': sum(by_status.values()),
+                'tasks_by_status': by_status,
+                'oldest_task': oldest,
+                'archived_tasks': archived,
+                'oldest_archived': oldest_archived
+            }
+        
+        except Exception as e:
+            logger.error(f"获取存储统计失败: {e}", exc_info=True)
+            return {}
+
+
+class AsyncDatabase:
+    """数据库的异步接口：在专用线程中执行 Database 的方法
+    
+    线程数为读连接数 + 1，读操作可以并发执行，写操作由 Database 的写锁串行化。
+    
+    任务更新（update_task / update_tasks）先写入缓冲区，同一任务在 write_delay 秒内的多次更新
+    合并为一次，到期后在一个事务中写入，写入频率与下载状态同步的轮询频率无关。
+    读取任务时叠加缓冲区中尚未写入的更新；缓冲区中有状态变更时，按状态查询前先写入缓冲区。
+    """
+    
+    def __init__(self, db: Database, write_delay: float = 2.0, max_write_retries: int = 3):
+        self.db = db
+        self.write_delay = write_delay
+        self.max_write_retries = max_write_retries  # 单个任务的更新连续写入失败超过该次数后丢弃
+        self._executor = ThreadPoolExecutor(max_workers=db._reader_count + 1, thread_name_prefix='database')
+        
+        self._pending: Dict[str, Dict[str, Any]] = {}  # 等待写入的任务更新
+        self._flushing: Dict[str, Dict[str, Any]] = {}  # 正在写入的任务更新
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self.write_stats = {'updates': 0, 'flushes': 0, 'rows': 0, 'failed': 0, 'dropped': 0}
+        self._write_failures: Dict[str, int] = {}  # 任务ID -> 连续写入失败次数
+    
+    async def _call(self, method, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(method, *args, **kwargs))
+    
+    def _overlay(self, task: Optional[TaskRow]) -> Optional[TaskRow]:
+        """在读取的任务上叠加尚未写入数据库的更新（只叠加查询读取了的列）"""
+        if task is not None:
+            for buffer in (self._flushing, self._pending):
+                fields = buffer.get(task['id'])
+                if fields:
+                    for key, value in fields.items():
+                        if key in task:
+                            # 复制 metadata，调用方修改返回的任务时不影响缓冲区
+                            task[key] = dict(value) if isinstance(value, dict) else value
+        return task
+    
+    async def _flush_updates(self, columns=('status',)):
+        """缓冲区中有这些列（查询条件中的列）的变更时先写入，使查询结果准确"""
+        for buffer in (self._flushing, self._pending):
+            if any(column in fields for fields in buffer.values() for column in columns):
+                await self.flush()
+                return
+    
+    async def add_task(self, task: Dict[str, Any]) -> bool:
+        return await self._call(self.db.add_task, task)
+    
+    async def add_tasks(self, tasks: List[Dict[str, Any]]) -> bool:
+        return await self._call(self.db.add_tasks, tasks)
+    
+    async def get_all_tasks(self, limit: int = 100, columns: Optional[Sequence[str]] = None) -> List[TaskRow]:
+        tasks = await self._call(self.db.get_all_tasks, limit, columns)
+        return [self._overlay(task) for task in tasks]
+    
+    async def get_task(self, task_id: str) -> Optional[TaskRow]:
+        return self._overlay(await self._call(self.db.get_task, task_id))
+    
+    async def update_task(self, task_id: str, updates: Dict[str, Any]) -> bool:
+        """更新任务（写入缓冲区，稍后合并写入；更新了未知的列时返回 False）"""
+        return await self.update_tasks({task_id: updates})
+    
+    async def update_tasks(self, updates: Dict[str, Dict[str, Any]]) -> bool:
+        """批量更新任务（写入缓冲区，稍后合并写入）
+        
+        写入缓冲区前检查列名和值，无法写入的更新不进入缓冲区（返回 False），
+        避免一个错误的更新使整批更新的事务回滚。
+        """
+        accepted = True
+        for task_id, fields in updates.items():
+            error = self._check_update(fields)
+            if error:
+                logger.error(f"更新任务失败: {task_id} {error}")
+                accepted = False
+                continue
+            self._pending.setdefault(task_id, {}).update(fields)
+            self.write_stats['updates'] += 1
+        
+        if self._pending and self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_later())
+        return accepted
+    
+    def _check_update(self, fields: Dict[str, Any]) -> Optional[str]:
+        """检查更新的列和值能否写入数据库，返回错误信息"""
+        unknown = set(fields) - self.db._columns - {'id'}
+        if unknown:
+            return f"未知的任务列: {', '.join(sorted(unknown))}"
+        for key, value in fields.items():
+            if key == 'metadata':
+                try:
+                    json.dumps(value)
+                except (TypeError, ValueError) as e:
+                    return f"metadata 无法序列化: {e}"
+            elif not isinstance(value, BINDABLE_TYPES):
+                return f"列 {key} 的值类型不支持: {type(value).__name__}"
+        return None
+    
+    async def _flush_later(self):
+        try:
+            while self._pending:
+                await asyncio.sleep(self.write_delay)
+                await self.flush()
+        finally:
+            self._flush_task = None
+    
+    async def flush(self) -> bool:
+        """立即把缓冲区中的更新写入数据库（单个事务）"""
+        async with self._flush_lock:
+            if not self._pending:
+                return True
+            
+            self._flushing, self._pending = self._pending, {}
+            try:
+                success = await self._call(self.db.update_tasks, self._flushing)
+                failed = []
+                if not success:
+                    # 整批写入失败：逐个任务重新写入，找出写入失败的任务
+                    self.write_stats['failed'] += 1
+                    failed = await self._call(self.db.update_tasks_each, self._flushing)
+                    logger.error(f"批量写入任务更新失败，逐个写入后仍失败 {len(failed)} 个")
+                self._requeue_failed(failed)
+                for task_id in self._flushing:
+                    if task_id not in failed:
+                        self._write_failures.pop(task_id, None)
+                
+                self.write_stats['flushes'] += 1
+                self.write_stats['rows'] += len(self._flushing) - len(failed)
+                return not failed
+            except BaseException:
+                # 写入过程被中断：整批放回缓冲区
+                self._requeue_failed(list(self._flushing))
+                raise
+            finally:
+                self._flushing = {}
+    
+    def _requeue_failed(self, task_ids: List[str]):
+        """写入失败的更新放回缓冲区稍后重试（缓冲区中更新的值优先），连续失败 max_write_retries 次后丢弃"""
+        for task_id in task_ids:
+            fields = self._flushing[task_id]
+            failures = self._write_failures.get(task_id, 0) + 1
+            if failures >= self.max_write_retries:
+                self._write_failures.pop(task_id, None)
+                self.write_stats['dropped'] += 1
+                logger.error(f"任务更新连续写入失败 {failures} 次，已丢弃: {task_id} {fields}")
+                continue
+            self._write_failures[task_id] = failures
+            self._pending[task_id] = {**fields, **self._pending.get(task_id, {})}
+    
+    async def delete_task(self, task_id: str) -> bool:
+        # 等待正在进行的写入完成，避免写入在删除之后把任务的更新写回
+        async with self._flush_lock:
+            self._pending.pop(task_id, None)
+            self._write_failures.pop(task_id, None)
+            return await self._call(self.db.delete_task, task_id)
+    
+    async def get_tasks_by_status(self, status: str, limit: Optional[int] = None,
+                                  columns: Optional[Sequence[str]] = None) -> List[TaskRow]:
+        await self._flush_updates()
+        tasks = await self._call(self.db.get_tasks_by_status, status, limit, columns)
+        return [self._overlay(task) for task in tasks]
+    
+    async def list_tasks(self, statuses=None, limit: int = 50, cursor: Optional[str] = None,
+                         columns: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+        await self._flush_updates()
+        result = await self._call(self.db.list_tasks, statuses, limit, cursor, columns)
+        result['tasks'] = [self._overlay(task) for task in result['tasks']]
+        return result
+    
+    async def get_tasks_by_statuses(self, statuses, limit: Optional[int] = None,
+                                    columns: Optional[Sequence[str]] = None) -> List[TaskRow]:
+        """依次查询多个状态的任务（在同一个数据库线程调用中完成）"""
+        def query():
+            return [task for status in statuses for task in self.db.get_tasks_by_status(status, limit, columns)]
+        
+        await self._flush_updates()
+        return [self._overlay(task) for task in await self._call(query)]
+    
+    async def get_task_by_platform_id(self, plugin_name: str, platform_id: str) -> Optional[TaskRow]:
+        await self._flush_updates(('platform_id',))
+        return self._overlay(await self._call(self.db.get_task_by_platform_id, plugin_name, platform_id))
+    
+    async def get_tasks_by_platform_ids(self, plugin_name: str, platform_ids: List[str],
+                                        statuses=None) -> List[TaskRow]:
+        await self._flush_updates(('status', 'platform_id'))
+        tasks = await self._call(self.db.get_tasks_by_platform_ids, plugin_name, platform_ids, statuses)
+        return [self._overlay(task) for task in tasks]
+    
+    async def get_tasks_by_source_urls(self, source_urls: List[str], statuses=None) -> List[TaskRow]:
+        await self._flush_updates(('status', 'source_url'))
+        tasks = await self._call(self.db.get_tasks_by_source_urls, source_urls, statuses)
+        return [self._overlay(task) for task in tasks]
+    
+    async def backfill_platform_ids(self, resolve: Callable[[str, Dict[str, Any]], Optional[str]]) -> int:
+        await self.flush()
+        return await self._call(self.db.backfill_platform_ids, resolve)
+    
+    async def archive_tasks(self, older_than_days: float, batch_size: int = 500) -> int:
+        await self.flush()
+        return await self._call(self.db.archive_tasks, older_than_days, batch_size)
+    
+    async def purge_archive(self, older_than_days: float) -> int:
+        return await self._call(self.db.purge_archive, older_than_days)
+    
+    async def optimize(self, analyze: bool = False, vacuum_pages: int = 0) -> Dict[str, Any]:
+        return await self._call(self.db.optimize, analyze, vacuum_pages)
+    
+    async def convert_incremental_vacuum(self) -> bool:
+        await self.flush()
+        return await self._call(self.db.convert_incremental_vacuum)
+    
+    async def get_storage_stats(self) -> Dict[str, Any]:
+        stats = await self._call(self.db.get_storage_stats)
+        stats['write_buffer'] = {**self.write_stats, 'pending': len(self._pending), 'delay': self.write_delay}
+        return stats
+    
+    async def close(self):
+        """写入缓冲区中的更新，等待进行中的查询完成后关闭数据库线程和连接"""
+        await self.flush()
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+        await self.flush()
+        
+        self._executor.shutdown(wait=True)
+        self.db.close()
+        logger.info(f"数据库已关闭: 合并写入 {self.write_stats['updates']} 次更新 -> "
+                    f"{self.write_stats['flushes']} 个事务 / {self.write_stats['rows']} 行")
 
 
 # 全局数据库实例
 _db = None
+_async_db = None
 
 
 def get_database() -> Database:
@@ -244,3 +1051,11 @@ def get_database() -> Database:
     if _db is None:
         _db = Database()
     return _db
+
+
+def get_async_database() -> AsyncDatabase:
+    """获取数据库异步接口实例（单例）"""
+    global _async_db
+    if _async_db is None:
+        _async_db = AsyncDatabase(get_database())
+    return _async_db
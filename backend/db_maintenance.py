@@ -0,0 +1,104 @@
+"""数据库维护
+
+定期把超过保留期的已结束任务（completed/failed/canceled）分批移入归档表，
+使下载任务表只保留近期的任务，状态查询不随运行时间变慢；
+随后执行 PRAGMA optimize 和增量 VACUUM 回收空间，大量归档后重新 ANALYZE。
+尚未启用增量 VACUUM 的旧数据库只在显式请求时（run_once(full_vacuum=True)）执行一次完整 VACUUM 转换。
+"""
+import asyncio
+import time
+from typing import Dict, Any, Optional
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class DatabaseMaintenance:
+    """数据库定期维护"""
+    
+    def __init__(self, retention_days: float = 30.0, archive_retention_days: float = 0.0,
+                 interval: float = 6 * 3600.0, batch_size: int = 500,
+                 vacuum_pages: int = 2000, analyze_threshold: int = 1000):
+        self.retention_days = retention_days  # 已结束任务在下载任务表中保留的天数，0 表示不归档
+        self.archive_retention_days = archive_retention_days  # 归档任务保留的天数，0 表示永久保留
+        self.interval = interval
+        self.batch_size = batch_size
+        self.vacuum_pages = vacuum_pages  # 每次维护最多回收的空闲页数
+        self.analyze_threshold = analyze_threshold  # 归档任务数达到该值时重新 ANALYZE
+        
+        self.last_run: Optional[Dict[str, Any]] = None
+        self._loop_task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+    
+    def start(self):
+        if self._loop_task is None:
+            self._loop_task = asyncio.create_task(self._run())
+            logger.info(f"数据库维护已启动: 保留 {self.retention_days} 天, 间隔 {self.interval}s")
+    
+    async def stop(self):
+        if self._loop_task:
+            self._loop_task.cancel()
+            await asyncio.gather(self._loop_task, return_exceptions=True)
+            self._loop_task = None
+            logger.info("数据库维护已停止")
+    
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"数据库维护异常: {e}", exc_info=True)
+            await asyncio.sleep(self.interval)
+    
+    async def run_once(self, full_vacuum: bool = False) -> Dict[str, Any]:
+        """执行一次维护（在数据库线程中执行，不阻塞事件循环）
+        
+        Args:
+            full_vacuum: 数据库尚未启用增量 VACUUM 时，先执行一次完整 VACUUM 转换（期间阻塞写入）
+        """
+        async with self._lock:
+            self.last_run = await self._maintain(full_vacuum)
+            return self.last_run
+    
+    async def _maintain(self, full_vacuum: bool = False) -> Dict[str, Any]:
+        from database import get_async_database
+        db = get_async_database()
+        
+        started = time.time()
+        converted = await db.convert_incremental_vacuum() if full_vacuum else False
+        archived = 0
+        if self.retention_days > 0:
+            archived = await db.archive_tasks(self.retention_days, self.batch_size)
+        
+        purged = 0
+        if self.archive_retention_days > 0:
+            purged = await db.purge_archive(self.archive_retention_days)
+        
+        analyze = archived + purged >= self.analyze_threshold or self.last_run is None
+        result = await db.optimize(analyze=analyze, vacuum_pages=self.vacuum_pages)
+        
+        summary = {
+            'started_at': started,
+            'duration': round(time.time() - started, 3),
+            'archived': archived,
+            'purged': purged,
+            'analyzed': analyze,
+            'freed_pages': result['freed_pages'],
+            'converted_incremental_vacuum': converted
+        }
+        logger.info(f"数据库维护完成: 归档 {archived} 个, 清理归档 {purged} 个, 回收 {result['freed_pages']} 页")
+        return summary
+
+
+# 全局数据库维护实例
+_maintenance: Optional[DatabaseMaintenance] = None
+
+
+def get_maintenance() -> DatabaseMaintenance:
+    """获取数据库维护实例（单例）"""
+    global _maintenance
+    if _maintenance is None:
+        _maintenance = DatabaseMaintenance()
+    return _maintenance
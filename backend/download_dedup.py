@@ -0,0 +1,158 @@
+"""下载任务去重
+
+新任务的去重键（规范化 URL 或 BT infohash）对应下载任务表中带索引的 source_url 列，
+在进行中和最近完成的任务中按索引查找重复任务，不需要扫描任务或在内存中维护索引。
+磁力链接直接从 xt=urn:btih 解析 infohash，.torrent 链接下载种子后在本地计算 infohash，
+因此同一资源以不同链接形式、或提交到不同下载平台时都能识别为重复任务。
+"查找重复任务 - 写入新任务"需要在 lock(keys) 内执行，同一资源的并发请求串行化，避免都通过检查。
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import Dict, List, Any, Optional
+import httpx
+from torrent_utils import magnet_infohash, normalize_url, source_url_for, torrent_infohash, BencodeError
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# 进行中的任务状态（始终参与去重）
+ACTIVE_STATUSES = ('queued', 'pending', 'submitting', 'downloading', 'paused')
+# 最近完成的任务在 recent_hours 内参与去重
+RECENT_STATUSES = ('completed',)
+
+
+def infohash_from_keys(keys: List[str]) -> Optional[str]:
+    """从去重键中取出 infohash"""
+    for key in keys:
+        if key.startswith('btih:'):
+            return key[5:]
+    return None
+
+
+class DuplicateIndex:
+    """下载任务去重"""
+    
+    def __init__(self, recent_hours: float = 72.0, fetch_timeout: float = 10.0,
+                 max_torrent_size: int = 10 * 1024 * 1024, max_cached_torrents: int = 1024):
+        self.recent_hours = recent_hours
+        self.fetch_timeout = fetch_timeout
+        self.max_torrent_size = max_torrent_size
+        self.max_cached_torrents = max_cached_torrents
+        
+        # 种子链接 -> infohash（LRU），避免重复下载同一个种子文件；只缓存成功的结果，失败的下次重新下载
+        self._torrent_hashes: "OrderedDict[str, str]" = OrderedDict()
+        # 去重键 -> [锁, 使用者数]，没有使用者时移除
+        self._locks: Dict[str, list] = {}
+    
+    @asynccontextmanager
+    async def lock(self, keys: List[str]):
+        """锁定这些去重键，在锁内查找重复任务并写入新任务
+        
+        按键排序加锁，同时锁定多个键（批量创建）时不会死锁。
+        """
+        keys = sorted(set(keys))
+        for key in keys:
+            self._locks.setdefault(key, [asyncio.Lock(), 0])[1] += 1
+        
+        acquired = []
+        try:
+            for key in keys:
+                await self._locks[key][0].acquire()
+                acquired.append(key)
+            yield
+        finally:
+            for key in acquired:
+                self._locks[key][0].release()
+            for key in keys:
+                entry = self._locks[key]
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._locks[key]
+    
+    def _is_live(self, task: Optional[Dict[str, Any]]) -> bool:
+        """任务是否仍参与去重（进行中，或在 recent_hours 内完成）"""
+        if task is None:
+            return False
+        if task['status'] in ACTIVE_STATUSES:
+            return True
+        if task['status'] not in RECENT_STATUSES:
+            return False
+        try:
+            updated_at = datetime.strptime(task.get('updated_at') or '', '%Y-%m-%d %H:%M:%S')
+        except ValueError:
+            return False
+        age = time.time() - updated_at.replace(tzinfo=timezone.utc).timestamp()
+        return age <= self.recent_hours * 3600
+    
+    def _url_keys(self, url: str) -> List[str]:
+        infohash = magnet_infohash(url)
+        if infohash:
+            return [f"btih:{infohash}"]
+        return [f"url:{normalize_url(url)}"]
+    
+    async def keys_for_url(self, url: str) -> List[str]:
+        """计算新提交 URL 的去重键（.torrent 链接会下载种子计算 infohash）"""
+        keys = self._url_keys(url)
+        if keys[0].startswith('url:') and self._is_torrent_url(url):
+            infohash = await self._fetch_torrent_infohash(url)
+            if infohash:
+                keys.append(f"btih:{infohash}")
+        return keys
+    
+    def _is_torrent_url(self, url: str) -> bool:
+        return url.startswith(('http://', 'https://')) and url.split('?', 1)[0].lower().endswith('.torrent')
+    
+    async def _fetch_torrent_infohash(self, url: str) -> Optional[str]:
+        key = normalize_url(url)
+        if key in self._torrent_hashes:
+            self._torrent_hashes.move_to_end(key)
+            return self._torrent_hashes[key]
+        
+        infohash = None
+        try:
+            async with httpx.AsyncClient(timeout=self.fetch_timeout, follow_redirects=True) as client:
+                response = await client.get(url)
+                if response.status_code == 200 and len(response.content) <= self.max_torrent_size:
+                    infohash = torrent_infohash(response.content)
+                else:
+                    logger.debug(f"下载种子文件失败: HTTP {response.status_code}, {url}")
+        except (httpx.HTTPError, BencodeError) as e:
+            logger.debug(f"解析种子文件失败: {url} - {e}")
+        
+        if infohash:
+            self._torrent_hashes[key] = infohash
+            while len(self._torrent_hashes) > self.max_cached_torrents:
+                self._torrent_hashes.popitem(last=False)
+        return infohash
+    
+    def _source_url(self, key: str) -> str:
+        """去重键对应的 source_url（与 torrent_utils.source_url_for 的结果一致）"""
+        if key.startswith('btih:'):
+            return source_url_for('', key[5:])
+        return key[4:]
+    
+    async def find(self, keys: List[str]) -> Optional[Dict[str, Any]]:
+        """查找与这些键重复的进行中或最近完成的任务，返回任务数据"""
+        from database import get_async_database
+        db = get_async_database()
+        
+        source_urls = [self._source_url(key) for key in keys]
+        for task in await db.get_tasks_by_source_urls(source_urls, ACTIVE_STATUSES + RECENT_STATUSES):
+            if self._is_live(task):
+                return task
+        return None
+
+
+# 全局去重索引实例
+_duplicate_index: Optional[DuplicateIndex] = None
+
+
+def get_duplicate_index() -> DuplicateIndex:
+    """获取下载去重索引实例（单例）"""
+    global _duplicate_index
+    if _duplicate_index is None:
+        _duplicate_index = DuplicateIndex()
+    return _duplicate_index
@@ -0,0 +1,187 @@
+"""下载进度事件流
+
+下载记录视图每次刷新平台后，把新记录与上一次的记录逐条比较，只把变化的字段作为事件
+推送给 /api/downloads/events 的订阅者（Server-Sent Events）。所有浏览器标签页共享
+同一份视图刷新结果，后端请求量与打开的页面数量无关。
+
+同一个任务的更新事件限制在 min_interval 秒内最多一次，期间的变化合并后再发送。
+订阅者的事件队列写满时（页面处理不过来）丢弃积压的事件，改为发送 resync 通知页面重新加载。
+"""
+import asyncio
+import json
+import time
+from typing import Dict, List, Any, Optional, Tuple
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# 平台级别推送的字段（updated_at 每次刷新都会变化，不推送）
+PLATFORM_FIELDS = ('stale', 'error', 'web_ui_url', 'instances')
+
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    """格式化为一条 SSE 消息"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class EventSubscriber:
+    """单个事件流订阅者"""
+    
+    def __init__(self, max_queue: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.overflowed = False
+    
+    def put(self, event: str, data: Dict[str, Any]):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait((event, data))
+        except asyncio.QueueFull:
+            # 积压的事件已经没有意义，清空后让页面重新加载
+            self.overflowed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(('resync', {}))
+
+
+class DownloadEventHub:
+    """下载进度事件中心"""
+    
+    def __init__(self, min_interval: float = 1.0, max_queue: int = 500, keepalive: float = 15.0):
+        self.min_interval = min_interval  # 同一任务两次更新事件的最小间隔（秒）
+        self.max_queue = max_queue
+        self.keepalive = keepalive
+        
+        self.subscribers: List[EventSubscriber] = []
+        # 平台 -> {下载ID: 上一次的下载记录}
+        self._records: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._platforms: Dict[str, Dict[str, Any]] = {}
+        # 限流：(平台, 下载ID) -> 上次发送时间 / 等待合并发送的变化
+        self._sent_at: Dict[Tuple[str, str], float] = {}
+        self._pending: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+    
+    def subscribe(self) -> EventSubscriber:
+        subscriber = EventSubscriber(self.max_queue)
+        self.subscribers.append(subscriber)
+        logger.debug(f"下载事件流订阅者 +1，当前 {len(self.subscribers)} 个")
+        return subscriber
+    
+    def unsubscribe(self, subscriber: EventSubscriber):
+        if subscriber in self.subscribers:
+            self.subscribers.remove(subscriber)
+            logger.debug(f"下载事件流订阅者 -1，当前 {len(self.subscribers)} 个")
+    
+    def _broadcast(self, event: str, data: Dict[str, Any]):
+        for subscriber in self.subscribers:
+            subscriber.put(event, data)
+    
+    def publish_platform(self, name: str, platform: Dict[str, Any]):
+        """下载记录视图刷新平台后调用（platform 为 PlatformSnapshot.to_dict() 的结果）"""
+        previous = self._records.get(name)
+        current = {str(d.get('id')): d for d in platform.get('downloads', [])}
+        self._records[name] = current
+        
+        info = {field: platform.get(field) for field in PLATFORM_FIELDS}
+        previous_info = self._platforms.get(name)
+        self._platforms[name] = info
+        
+        if not self.subscribers:
+            return
+        
+        if previous_info is not None:
+            changed = {k: v for k, v in info.items() if previous_info.get(k) != v}
+            if changed:
+                self._broadcast('platform', {'platform': name, 'changes': changed})
+        
+        if previous is None:
+            return
+        
+        for download_id, download in current.items():
+            old = previous.get(download_id)
+            if old is None:
+                self._broadcast('added', {'platform': name, 'download': download})
+                continue
+            changes = {k: v for k, v in download.items() if old.get(k) != v}
+            if changes:
+                self._queue_update(name, download_id, changes)
+        
+        for download_id in previous.keys() - current.keys():
+            self._pending.pop((name, download_id), None)
+            self._sent_at.pop((name, download_id), None)
+            self._broadcast('removed', {'platform': name, 'id': download_id})
+    
+    def forget_platform(self, name: str):
+        """平台被禁用或卸载时清除缓存的记录，通知页面重新加载"""
+        if self._records.pop(name, None) is not None:
+            self._platforms.pop(name, None)
+            for key in [key for key in self._sent_at if key[0] == name]:
+                self._sent_at.pop(key, None)
+                self._pending.pop(key, None)
+            self._broadcast('resync', {})
+    
+    def _queue_update(self, platform: str, download_id: str, changes: Dict[str, Any]):
+        """发送更新事件；距离上次发送不足 min_interval 时合并到待发送的变化中"""
+        key = (platform, download_id)
+        now = time.monotonic()
+        
+        if key in self._pending:
+            self._pending[key].update(changes)
+            return
+        
+        if now - self._sent_at.get(key, 0.0) >= self.min_interval:
+            self._send_update(key, changes, now)
+            return
+        
+        self._pending[key] = dict(changes)
+        if self._flush_handle is None:
+            delay = self.min_interval - (now - self._sent_at[key])
+            self._flush_handle = asyncio.get_event_loop().call_later(delay, self._flush)
+    
+    def _send_update(self, key: Tuple[str, str], changes: Dict[str, Any], now: float):
+        self._sent_at[key] = now
+        self._broadcast('updated', {'platform': key[0], 'id': key[1], 'changes': changes})
+    
+    def _flush(self):
+        """发送已到达最小间隔的合并更新，其余的继续等待"""
+        self._flush_handle = None
+        now = time.monotonic()
+        
+        next_due = None
+        for key in list(self._pending):
+            due = self._sent_at.get(key, 0.0) + self.min_interval
+            if due <= now:
+                self._send_update(key, self._pending.pop(key), now)
+            elif next_due is None or due < next_due:
+                next_due = due
+        
+        if next_due is not None:
+            self._flush_handle = asyncio.get_event_loop().call_later(next_due - now, self._flush)
+    
+    async def stream(self, subscriber: EventSubscriber):
+        """生成订阅者的 SSE 消息流；空闲时定期发送注释行保持连接"""
+        yield "retry: 3000\n\n"
+        yield format_sse('ready', {})
+        
+        while True:
+            try:
+                event, data = await asyncio.wait_for(subscriber.queue.get(), timeout=self.keepalive)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            
+            if event == 'resync':
+                subscriber.overflowed = False
+            yield format_sse(event, data)
+
+
+# 全局事件中心实例
+_event_hub: Optional[DownloadEventHub] = None
+
+
+def get_event_hub() -> DownloadEventHub:
+    """获取下载进度事件中心实例（单例）"""
+    global _event_hub
+    if _event_hub is None:
+        _event_hub = DownloadEventHub()
+    return _event_hub
@@ -0,0 +1,271 @@
+"""下载任务队列
+
+调度器放行的任务（pending 状态）由后台工作协程提交到下载插件。
+提交失败时按带抖动的指数退避重试；服务重启后从数据库恢复未完成的任务，
+重启前正在提交（submitting）的任务先向下载平台确认是否已提交，避免重复提交。
+"""
+import asyncio
+import random
+from collections import deque
+from typing import Dict, Deque, List, Optional
+from models import DownloadTask
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# 等待提交 / 正在提交中的任务状态
+PENDING_STATUSES = ('pending', 'submitting')
+
+
+class DownloadQueue:
+    """下载任务队列（有界工作池 + 每插件并发限制 + 重试）"""
+    
+    def __init__(self, workers: int = 4, plugin_concurrency: int = 2,
+                 max_attempts: int = 5, base_delay: float = 2.0, max_delay: float = 300.0):
+        self.workers = workers
+        self.plugin_concurrency = plugin_concurrency
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        
+        self.plugin_manager = None
+        self._ready: Optional[asyncio.Queue] = None
+        self._worker_tasks: List[asyncio.Task] = []
+        self._recover_task: Optional[asyncio.Task] = None
+        self._retry_handles: Dict[str, asyncio.TimerHandle] = {}
+        # 每个插件正在提交的任务数，以及因超出并发限制而等待的任务
+        self._active: Dict[str, int] = {}
+        self._waiting: Dict[str, Deque[str]] = {}
+        # 已在队列中的任务，避免重复入队
+        self._queued: set = set()
+    
+    async def start(self, plugin_manager):
+        """启动工作协程，并恢复数据库中未完成的任务"""
+        if self._worker_tasks:
+            return
+        
+        self.plugin_manager = plugin_manager
+        self._ready = asyncio.Queue()
+        
+        for i in range(self.workers):
+            self._worker_tasks.append(asyncio.create_task(self._worker(i)))
+        logger.info(f"下载队列已启动: {self.workers} 个工作协程, 每插件并发 {self.plugin_concurrency}")
+        
+        from database import get_async_database
+        db = get_async_database()
+        pending = await db.get_tasks_by_statuses(('pending',), columns=('id',))
+        for task in pending:
+            self.enqueue(task['id'])
+        if pending:
+            logger.info(f"从数据库恢复 {len(pending)} 个未完成的下载任务")
+        
+        submitting = await db.get_tasks_by_statuses(
+            ('submitting',), columns=('id', 'plugin_name', 'platform_id', 'metadata')
+        )
+        if submitting:
+            # 查询下载平台可能较慢，在后台确认
+            self._recover_task = asyncio.create_task(self._recover_submitting(submitting))
+    
+    async def _recover_submitting(self, tasks: list):
+        """确认重启前正在提交的任务是否已提交到下载平台
+        
+        平台上已有的任务同步为平台的状态；有平台任务ID但平台上找不到的任务重新提交；
+        没有平台任务ID、无法确认的任务标记为失败，由用户决定是否重试。
+        """
+        from database import get_async_database
+        from download_reconciler import STATUS_MAP
+        db = get_async_database()
+        
+        updates = {}
+        resubmit = []
+        groups: Dict[str, Dict[str, str]] = {}  # 插件名 -> {平台任务ID: 任务ID}
+        for task in tasks:
+            plugin = self.plugin_manager.get_download_plugin(task['plugin_name'])
+            if plugin is None:
+                # 提交时会标记为失败（插件未找到）
+                resubmit.append(task['id'])
+                continue
+            platform_id = task.get('platform_id') or plugin.get_platform_id(task.get('metadata') or {})
+            if platform_id:
+                groups.setdefault(plugin.name, {})[platform_id] = task['id']
+            else:
+                updates[task['id']] = {'status': 'failed', 'error': '服务重启时任务正在提交，无法确认是否已提交到下载平台'}
+        
+        for plugin_name, task_ids in groups.items():
+            plugin = self.plugin_manager.get_download_plugin(plugin_name)
+            try:
+                progress = await plugin.get_progress_batch(list(task_ids))
+            except Exception as e:
+                logger.warning(f"确认提交中的任务失败，重新提交: {plugin_name} - {e}")
+                progress = {}
+            for platform_id, task_id in task_ids.items():
+                status = STATUS_MAP.get((progress.get(platform_id) or {}).get('status'))
+                if status:
+                    updates[task_id] = {'status': status, 'error': None}
+                else:
+                    resubmit.append(task_id)
+        
+        if updates:
+            await db.update_tasks(updates)
+        for task_id in resubmit:
+            self.enqueue(task_id)
+        unconfirmed = sum(1 for update in updates.values() if update['status'] == 'failed')
+        logger.info(f"确认重启前正在提交的 {len(tasks)} 个任务: 已在下载平台 {len(updates) - unconfirmed} 个, "
+                    f"重新提交 {len(resubmit)} 个, 无法确认（标记为失败） {unconfirmed} 个")
+        if updates:
+            from download_scheduler import get_scheduler
+            get_scheduler().notify()
+    
+    async def stop(self):
+        """停止工作协程（未完成的任务保留在数据库中，下次启动时恢复）"""
+        for handle in self._retry_handles.values():
+            handle.cancel()
+        self._retry_handles.clear()
+        
+        if self._recover_task is not None:
+            self._recover_task.cancel()
+            await asyncio.gather(self._recover_task, return_exceptions=True)
+            self._recover_task = None
+        
+        for worker in self._worker_tasks:
+            worker.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks.clear()
+        logger.info("下载队列已停止")
+    
+    def enqueue(self, task_id: str, delay: float = 0.0):
+        """将任务加入队列（delay 秒后可执行）"""
+        if delay > 0:
+            # 同一任务只保留最新的一次延迟重试
+            previous = self._retry_handles.pop(task_id, None)
+            if previous is not None:
+                previous.cancel()
+            loop = asyncio.get_running_loop()
+            self._retry_handles[task_id] = loop.call_later(delay, self._release_retry, task_id)
+            return
+        
+        if task_id in self._queued:
+            return
+        self._queued.add(task_id)
+        self._ready.put_nowait(task_id)
+    
+    def _release_retry(self, task_id: str):
+        self._retry_handles.pop(task_id, None)
+        self.enqueue(task_id)
+    
+    def _retry_delay(self, attempts: int) -> float:
+        """指数退避，保留一半延迟并对另一半加随机抖动，避免后端恢复时集中重试"""
+        delay = min(self.max_delay, self.base_delay * (2 ** (attempts - 1)))
+        return delay / 2 + random.uniform(0, delay / 2)
+    
+    async def _worker(self, index: int):
+        while True:
+            task_id = await self._ready.get()
+            try:
+                await self._dispatch(task_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"下载队列处理任务异常: {task_id} - {e}", exc_info=True)
+            finally:
+                self._ready.task_done()
+    
+    async def _dispatch(self, task_id: str):
+        from database import get_async_database
+        db = get_async_database()
+        
+        task_data = await db.get_task(task_id)
+        if task_data is None or task_data['status'] not in PENDING_STATUSES:
+            # 任务已被删除或已处理
+            self._queued.discard(task_id)
+            return
+        
+        plugin_name = task_data['plugin_name']
+        if self._active.get(plugin_name, 0) >= self.plugin_concurrency:
+            # 超出该插件并发限制，等待同插件的任务完成后再执行（不占用工作协程）
+            self._waiting.setdefault(plugin_name, deque()).append(task_id)
+            return
+        
+        self._active[plugin_name] = self._active.get(plugin_name, 0) + 1
+        try:
+            await self._run(task_data)
+        finally:
+            self._active[plugin_name] -= 1
+            waiting = self._waiting.get(plugin_name)
+            if waiting:
+                self._ready.put_nowait(waiting.popleft())
+    
+    async def _run(self, task_data: dict):
+        from database import get_async_database
+        db = get_async_database()
+        
+        task_id = task_data['id']
+        self._queued.discard(task_id)
+        
+        plugin = self.plugin_manager.get_download_plugin(task_data['plugin_name'])
+        if not plugin:
+            logger.error(f"下载插件未找到: {task_data['plugin_name']}，任务 {task_id} 失败")
+            await db.update_task(task_id, {'status': 'failed', 'error': 'Plugin not found'})
+            return
+        
+        attempts = (task_data.get('attempts') or 0) + 1
+        await db.update_task(task_id, {'status': 'submitting', 'attempts': attempts})
+        
+        task = DownloadTask(
+            id=task_id,
+            url=task_data['url'],
+            title=task_data['title'],
+            status='submitting',
+            progress=task_data.get('progress') or 0.0,
+            plugin_name=task_data['plugin_name'],
+            save_path=task_data.get('save_path') or '',
+            metadata=task_data.get('metadata') or {}
+        )
+        
+        logger.info(f"提交下载任务: {task_id} -> {plugin.name} (第 {attempts} 次)")
+        
+        error = None
+        try:
+            success = await plugin.download(task)
+        except Exception as e:
+            logger.error(f"提交下载任务异常: {task_id} - {e}", exc_info=True)
+            success = False
+            error = str(e)
+        
+        if success:
+            logger.info(f"✓ 下载任务已提交: {task_id}")
+            await db.update_task(task_id, {'error': None})
+            return
+        
+        await self.retry(task_id, attempts, error or 'Download failed')
+    
+    async def retry(self, task_id: str, attempts: int, error: str):
+        """第 attempts 次提交失败后安排重试，超过最大次数则标记为失败"""
+        from database import get_async_database
+        db = get_async_database()
+        
+        if attempts >= self.max_attempts:
+            logger.error(f"✗ 下载任务重试 {attempts} 次后仍失败: {task_id}")
+            await db.update_task(task_id, {'status': 'failed', 'attempts': attempts, 'error': error})
+            # 释放该插件的下载名额
+            from download_scheduler import get_scheduler
+            get_scheduler().notify()
+            return
+        
+        delay = self._retry_delay(attempts)
+        logger.warning(f"下载任务提交失败，{delay:.1f} 秒后重试: {task_id}")
+        # 插件失败时会把状态置为 failed，这里恢复为 pending 以便重试和重启后恢复
+        await db.update_task(task_id, {'status': 'pending', 'attempts': attempts, 'error': error})
+        self.enqueue(task_id, delay)
+
+
+# 全局下载队列实例
+_download_queue: Optional[DownloadQueue] = None
+
+
+def get_download_queue() -> DownloadQueue:
+    """获取下载队列实例（单例）"""
+    global _download_queue
+    if _download_queue is None:
+        _download_queue = DownloadQueue()
+    return _download_queue
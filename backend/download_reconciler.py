@@ -0,0 +1,184 @@
+"""下载状态同步
+
+后台定期向各下载插件批量查询已提交任务的进度，把变化的进度和状态写回 download_tasks。
+进度有变化的任务按快速间隔轮询，没有变化的任务逐步退避到慢速间隔。
+"""
+import asyncio
+import time
+from typing import Callable, Dict, List, Any, Optional
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# 已提交到下载平台、需要同步进度的任务状态
+ACTIVE_STATUSES = ('downloading', 'paused')
+
+# 下载平台返回的状态 -> 写入数据库的状态
+# 平台内部排队（pending）的任务已经提交成功，仍记为 downloading，
+# 避免与尚未提交的 pending 任务混淆（下载队列会重新提交 pending 任务）
+STATUS_MAP = {
+    'pending': 'downloading',
+    'downloading': 'downloading',
+    'paused': 'paused',
+    'completed': 'completed',
+    'failed': 'failed',
+}
+
+
+class DownloadReconciler:
+    """下载状态同步器"""
+    
+    def __init__(self, fast_interval: float = 3.0, slow_interval: float = 60.0):
+        self.fast_interval = fast_interval
+        self.slow_interval = slow_interval
+        
+        self.plugin_manager = None
+        self._loop_task: Optional[asyncio.Task] = None
+        # task_id -> (下次轮询时间, 当前轮询间隔)
+        self._schedule: Dict[str, tuple] = {}
+        # 变更回调，每轮同步写入数据库后以 {task_id: {字段: 值}} 调用
+        self._listeners: List[Callable[[Dict[str, Dict[str, Any]]], None]] = []
+    
+    def start(self, plugin_manager):
+        """启动同步循环"""
+        if self._loop_task is None:
+            self.plugin_manager = plugin_manager
+            self._loop_task = asyncio.create_task(self._run())
+            logger.info(f"下载状态同步已启动: 快速间隔 {self.fast_interval}s, 慢速间隔 {self.slow_interval}s")
+    
+    async def stop(self):
+        if self._loop_task:
+            self._loop_task.cancel()
+            await asyncio.gather(self._loop_task, return_exceptions=True)
+            self._loop_task = None
+            logger.info("下载状态同步已停止")
+    
+    def add_listener(self, callback: Callable[[Dict[str, Dict[str, Any]]], None]):
+        """订阅任务进度/状态变更"""
+        if callback not in self._listeners:
+            self._listeners.append(callback)
+    
+    def remove_listener(self, callback: Callable[[Dict[str, Dict[str, Any]]], None]):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+    
+    async def _run(self):
+        while True:
+            try:
+                await self.reconcile_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"下载状态同步异常: {e}", exc_info=True)
+            await asyncio.sleep(self.fast_interval)
+    
+    def _reschedule(self, task_id: str, now: float, changed: bool):
+        """进度有变化时使用快速间隔，否则间隔翻倍直到慢速间隔"""
+        if changed:
+            interval = self.fast_interval
+        else:
+            _, interval = self._schedule.get(task_id, (now, self.fast_interval))
+            interval = min(self.slow_interval, interval * 2)
+        self._schedule[task_id] = (now + interval, interval)
+    
+    async def reconcile_once(self) -> Dict[str, Dict[str, Any]]:
+        """执行一轮同步，返回写入数据库的变更 {task_id: {字段: 值}}"""
+        from database import get_async_database
+        db = get_async_database()
+        
+        tasks = await db.get_tasks_by_statuses(ACTIVE_STATUSES)
+        
+        # 清理已结束任务的调度信息
+        active_ids = {task['id'] for task in tasks}
+        for task_id in list(self._schedule):
+            if task_id not in active_ids:
+                del self._schedule[task_id]
+        
+        now = time.monotonic()
+        groups: Dict[str, Dict[str, dict]] = {}
+        for task in tasks:
+            next_poll, _ = self._schedule.get(task['id'], (0, self.fast_interval))
+            if next_poll > now:
+                continue
+            
+            plugin_name = task['plugin_name']
+            plugin = self.plugin_manager.get_download_plugin(plugin_name)
+            if not plugin or not self.plugin_manager.config_storage.is_enabled("download", plugin_name):
+                self._reschedule(task['id'], now, False)
+                continue
+            
+            platform_id = task.get('platform_id') or plugin.get_platform_id(task.get('metadata') or {})
+            if not platform_id:
+                self._reschedule(task['id'], now, False)
+                continue
+            
+            groups.setdefault(plugin_name, {})[platform_id] = task
+        
+        if not groups:
+            return {}
+        
+        plugin_names = list(groups)
+        results = await asyncio.gather(
+            *(self._poll_plugin(name, list(groups[name])) for name in plugin_names)
+        )
+        
+        changes: Dict[str, Dict[str, Any]] = {}
+        for plugin_name, progress_map in zip(plugin_names, results):
+            for platform_id, task in groups[plugin_name].items():
+                update = self._diff(task, progress_map.get(platform_id))
+                if update:
+                    changes[task['id']] = update
+                self._reschedule(task['id'], now, bool(update))
+        
+        if changes:
+            await db.update_tasks(changes)
+            logger.debug(f"下载状态同步: 更新 {len(changes)} 个任务")
+            for listener in list(self._listeners):
+                try:
+                    listener(changes)
+                except Exception as e:
+                    logger.error(f"下载状态变更回调异常: {e}", exc_info=True)
+        
+        return changes
+    
+    async def _poll_plugin(self, plugin_name: str, platform_ids: List[str]) -> Dict[str, dict]:
+        plugin = self.plugin_manager.get_download_plugin(plugin_name)
+        try:
+            return await plugin.get_progress_batch(platform_ids)
+        except Exception as e:
+            logger.error(f"同步 {plugin_name} 下载进度失败: {e}")
+            return {}
+    
+    def _diff(self, task: Dict[str, Any], info: Optional[dict]) -> Dict[str, Any]:
+        """比较平台返回的进度和数据库中的值，只返回有变化的字段"""
+        if not info:
+            return {}
+        
+        status = STATUS_MAP.get(info.get('status'))
+        if status is None:
+            # unknown：平台中找不到任务或查询失败，保持原状态
+            return {}
+        
+        update = {}
+        progress = round(float(info.get('progress') or 0.0), 1)
+        if status == 'completed':
+            progress = 100.0
+        if progress != round(task.get('progress') or 0.0, 1):
+            update['progress'] = progress
+        if status != task['status']:
+            update['status'] = status
+        if status == 'failed' and info.get('error') and info['error'] != task.get('error'):
+            update['error'] = info['error']
+        return update
+
+
+# 全局同步器实例
+_reconciler: Optional[DownloadReconciler] = None
+
+
+def get_reconciler() -> DownloadReconciler:
+    """获取下载状态同步器实例（单例）"""
+    global _reconciler
+    if _reconciler is None:
+        _reconciler = DownloadReconciler()
+    return _reconciler
@@ -0,0 +1,208 @@
+"""下载任务调度
+
+新任务先以 queued 状态保存在 download_tasks 中，由调度器按优先级放行给下载队列提交。
+每个下载插件可以配置同时进行的任务数（max_active），以及低优先级（批量）任务的
+下载时段（bulk_window）。下载状态同步发现任务完成或失败后通知调度器放行后续任务。
+绕过排队直接提交的任务（批量接口）通过 try_acquire 预留名额，与调度器放行共用同一把锁，
+不会在名额检查和写入任务状态之间被其他请求抢占。
+"""
+import asyncio
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+QUEUED_STATUS = 'queued'
+
+# 优先级 -> 排序权重（越小越先放行）；low 为批量任务，受下载时段限制
+PRIORITIES = {'high': 0, 'normal': 1, 'low': 2}
+DEFAULT_PRIORITY = 'normal'
+
+# 占用插件下载名额的任务状态
+SLOT_STATUSES = ('pending', 'submitting', 'downloading')
+
+
+def parse_window(window: str) -> Optional[tuple]:
+    """解析下载时段 "HH:MM-HH:MM"，返回 (开始分钟, 结束分钟)；为空或格式错误时返回 None"""
+    try:
+        start, end = window.split('-', 1)
+        start_h, start_m = (int(x) for x in start.strip().split(':'))
+        end_h, end_m = (int(x) for x in end.strip().split(':'))
+    except (AttributeError, ValueError):
+        return None
+    return (start_h * 60 + start_m, end_h * 60 + end_m)
+
+
+def in_window(window: str, now: Optional[datetime] = None) -> bool:
+    """当前时间是否在下载时段内（支持跨午夜，如 23:00-07:00）；未配置时段时始终为 True"""
+    parsed = parse_window(window) if window else None
+    if parsed is None:
+        return True
+    start, end = parsed
+    now = now or datetime.now()
+    minute = now.hour * 60 + now.minute
+    if start <= end:
+        return start <= minute < end
+    return minute >= start or minute < end
+
+
+def task_priority(task: Dict[str, Any]) -> str:
+    priority = (task.get('metadata') or {}).get('priority', DEFAULT_PRIORITY)
+    return priority if priority in PRIORITIES else DEFAULT_PRIORITY
+
+
+class DownloadScheduler:
+    """下载任务调度器"""
+    
+    def __init__(self, tick_interval: float = 30.0):
+        self.tick_interval = tick_interval  # 定期检查（下载时段开始时放行批量任务）
+        
+        self.plugin_manager = None
+        self._loop_task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        # 名额检查和占用名额之间加锁；_reserved 为已预留、尚未写入数据库的名额
+        self._lock = asyncio.Lock()
+        self._reserved: Dict[str, int] = {}
+    
+    def start(self, plugin_manager):
+        """启动调度循环，并订阅下载状态同步的变更通知"""
+        if self._loop_task is None:
+            self.plugin_manager = plugin_manager
+            self._wakeup = asyncio.Event()
+            self._loop_task = asyncio.create_task(self._run())
+            
+            from download_reconciler import get_reconciler
+            get_reconciler().add_listener(self._on_changes)
+            logger.info("下载调度器已启动")
+    
+    async def stop(self):
+        if self._loop_task:
+            from download_reconciler import get_reconciler
+            get_reconciler().remove_listener(self._on_changes)
+            
+            self._loop_task.cancel()
+            await asyncio.gather(self._loop_task, return_exceptions=True)
+            self._loop_task = None
+            logger.info("下载调度器已停止")
+    
+    async def _run(self):
+        while True:
+            try:
+                await self.release()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"下载调度异常: {e}", exc_info=True)
+            
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.tick_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+    
+    def notify(self):
+        """有新任务或名额释放时唤醒调度循环"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+    
+    def _on_changes(self, changes: Dict[str, Dict[str, Any]]):
+        """下载状态同步的回调：有任务离开下载中状态时放行排队的任务"""
+        if any(update.get('status') not in (None, 'downloading') for update in changes.values()):
+            self.notify()
+    
+    def _plugin_limits(self, plugin_name: str) -> tuple:
+        """插件的 (同时下载任务数上限, 批量任务下载时段)，上限为 0 表示不限制"""
+        plugin = self.plugin_manager.get_download_plugin(plugin_name) if self.plugin_manager else None
+        if not plugin:
+            return 0, ''
+        return plugin._get_config_int('max_active', 0), plugin._get_config_str('bulk_window', '')
+    
+    async def _active_counts(self) -> Dict[str, int]:
+        """各插件占用的下载名额（数据库中的任务 + 已预留的名额）"""
+        from database import get_async_database
+        db = get_async_database()
+        
+        counts: Dict[str, int] = dict(self._reserved)
+        for task in await db.get_tasks_by_statuses(SLOT_STATUSES, columns=('plugin_name',)):
+            counts[task['plugin_name']] = counts.get(task['plugin_name'], 0) + 1
+        return counts
+    
+    async def try_acquire(self, plugin_name: str, count: int) -> int:
+        """为直接提交的任务预留最多 count 个下载名额，返回预留到的数量
+        
+        调用者把任务以占用名额的状态写入数据库后（或放弃提交时）调用 release_reserved 释放预留。
+        """
+        if count <= 0:
+            return 0
+        async with self._lock:
+            max_active, _ = self._plugin_limits(plugin_name)
+            if max_active > 0:
+                count = min(count, max(0, max_active - (await self._active_counts()).get(plugin_name, 0)))
+            if count:
+                self._reserved[plugin_name] = self._reserved.get(plugin_name, 0) + count
+            return count
+    
+    def release_reserved(self, plugin_name: str, count: int):
+        """释放 try_acquire 预留的名额"""
+        remaining = self._reserved.get(plugin_name, 0) - count
+        if remaining > 0:
+            self._reserved[plugin_name] = remaining
+        else:
+            self._reserved.pop(plugin_name, None)
+    
+    def can_start(self, task: Dict[str, Any]) -> bool:
+        """任务的优先级是否允许现在开始（低优先级任务需在下载时段内）"""
+        if task_priority(task) != 'low':
+            return True
+        _, window = self._plugin_limits(task['plugin_name'])
+        return in_window(window)
+    
+    async def release(self) -> List[str]:
+        """按优先级和创建时间放行排队的任务，返回放行的任务ID"""
+        async with self._lock:
+            return await self._release()
+    
+    async def _release(self) -> List[str]:
+        from database import get_async_database
+        from download_queue import get_download_queue
+        db = get_async_database()
+        
+        queued = await db.get_tasks_by_status(QUEUED_STATUS, columns=('plugin_name', 'metadata', 'created_at'))
+        if not queued:
+            return []
+        
+        queued.sort(key=lambda task: (PRIORITIES[task_priority(task)], task.get('created_at') or ''))
+        counts = await self._active_counts()
+        
+        released = []
+        for task in queued:
+            plugin_name = task['plugin_name']
+            max_active, _ = self._plugin_limits(plugin_name)
+            if max_active > 0 and counts.get(plugin_name, 0) >= max_active:
+                continue
+            if not self.can_start(task):
+                continue
+            counts[plugin_name] = counts.get(plugin_name, 0) + 1
+            released.append(task['id'])
+        
+        if released:
+            await db.update_tasks({task_id: {'status': 'pending'} for task_id in released})
+            queue = get_download_queue()
+            for task_id in released:
+                queue.enqueue(task_id)
+            logger.info(f"下载调度: 放行 {len(released)} 个任务，仍在排队 {len(queued) - len(released)} 个")
+        
+        return released
+
+
+# 全局调度器实例
+_scheduler: Optional[DownloadScheduler] = None
+
+
+def get_scheduler() -> DownloadScheduler:
+    """获取下载调度器实例（单例）"""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = DownloadScheduler()
+    return _scheduler
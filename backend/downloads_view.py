@@ -0,0 +1,260 @@
+"""下载记录视图
+
+后台定期并发刷新各下载平台的下载记录并缓存在内存中，/api/downloads 直接读取缓存。
+每个平台的刷新有独立超时，刷新失败或超时的平台保留上一次的数据并标记为过期，
+不会拖慢其他平台或整个页面。每次刷新后把变化推送给下载进度事件流（download_events）。
+"""
+import asyncio
+import base64
+import binascii
+import json
+import time
+from typing import Dict, List, Any, Optional, Tuple
+from download_events import get_event_hub
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# 支持的排序字段 -> 下载记录中的数值字段
+SORT_FIELDS = {
+    'progress': 'progress',
+    'speed': 'speed_bps',
+    'created_at': 'created_at',
+}
+
+
+class PlatformSnapshot:
+    """单个下载平台的下载记录快照"""
+    
+    def __init__(self, name: str):
+        self.name = name
+        self.web_ui_url = ''
+        self.instances: List[Dict[str, Any]] = []  # 后端实例状态（多实例时）
+        self.downloads: List[Dict[str, Any]] = []
+        self.updated_at: Optional[float] = None  # 最近一次刷新成功的时间（Unix时间戳）
+        self.error: Optional[str] = None  # 最近一次刷新失败的原因
+    
+    def is_stale(self, stale_after: float) -> bool:
+        if self.updated_at is None or self.error:
+            return True
+        return time.time() - self.updated_at > stale_after
+    
+    def to_dict(self, stale_after: float) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'web_ui_url': self.web_ui_url,
+            'instances': self.instances,
+            'downloads': self.downloads,
+            'updated_at': self.updated_at,
+            'stale': self.is_stale(stale_after),
+            'error': self.error
+        }
+
+
+class DownloadsView:
+    """下载记录视图（按平台缓存）"""
+    
+    def __init__(self, refresh_interval: float = 5.0, timeout: float = 8.0, stale_after: float = 30.0):
+        self.refresh_interval = refresh_interval
+        self.timeout = timeout
+        self.stale_after = stale_after
+        
+        self.plugin_manager = None
+        self.snapshots: Dict[str, PlatformSnapshot] = {}
+        self._refreshing: Dict[str, asyncio.Task] = {}
+        self._loop_task: Optional[asyncio.Task] = None
+    
+    def start(self, plugin_manager):
+        """启动后台刷新循环"""
+        if self._loop_task is None:
+            self.plugin_manager = plugin_manager
+            self._loop_task = asyncio.create_task(self._run())
+            logger.info(f"下载记录视图已启动: 刷新间隔 {self.refresh_interval}s, 超时 {self.timeout}s")
+    
+    async def stop(self):
+        if self._loop_task:
+            self._loop_task.cancel()
+            await asyncio.gather(self._loop_task, return_exceptions=True)
+            self._loop_task = None
+            logger.info("下载记录视图已停止")
+    
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"刷新下载记录异常: {e}", exc_info=True)
+            await asyncio.sleep(self.refresh_interval)
+    
+    def enabled_platforms(self) -> List[str]:
+        return self.plugin_manager.get_enabled_plugins("download")
+    
+    async def refresh(self):
+        """并发刷新所有启用的平台"""
+        names = self.enabled_platforms()
+        
+        # 移除已禁用或已卸载的平台
+        for name in list(self.snapshots):
+            if name not in names:
+                del self.snapshots[name]
+                get_event_hub().forget_platform(name)
+        
+        await asyncio.gather(*(self.refresh_platform(name) for name in names))
+    
+    async def refresh_platform(self, name: str) -> Optional[PlatformSnapshot]:
+        """刷新单个平台（同一平台同时只有一个刷新请求）"""
+        task = self._refreshing.get(name)
+        if task is None or task.done():
+            task = asyncio.create_task(self._refresh_platform(name))
+            self._refreshing[name] = task
+        return await asyncio.shield(task)
+    
+    async def _refresh_platform(self, name: str) -> Optional[PlatformSnapshot]:
+        plugin = self.plugin_manager.get_download_plugin(name)
+        if not plugin:
+            self.snapshots.pop(name, None)
+            get_event_hub().forget_platform(name)
+            return None
+        
+        snapshot = self.snapshots.setdefault(name, PlatformSnapshot(name))
+        try:
+            downloads = await asyncio.wait_for(plugin.get_downloads(), timeout=self.timeout)
+            snapshot.downloads = downloads
+            snapshot.web_ui_url = plugin.get_web_ui_url()
+            snapshot.instances = plugin.get_backend_instances()
+            snapshot.updated_at = time.time()
+            snapshot.error = None
+        except asyncio.TimeoutError:
+            snapshot.error = f"刷新超时（{self.timeout}s）"
+            logger.warning(f"刷新 {name} 下载记录超时")
+        except Exception as e:
+            snapshot.error = str(e)
+            logger.error(f"刷新 {name} 下载记录失败: {e}")
+        
+        get_event_hub().publish_platform(name, snapshot.to_dict(self.stale_after))
+        return snapshot
+    
+    def _is_cold(self, name: str) -> bool:
+        """平台是否还没有完成过任何一次刷新"""
+        snapshot = self.snapshots.get(name)
+        return snapshot is None or (snapshot.updated_at is None and snapshot.error is None)
+    
+    async def get_platform(self, name: str) -> Optional[Dict[str, Any]]:
+        """读取平台快照；尚未刷新过的平台先等待第一次刷新"""
+        if self._is_cold(name):
+            await self.refresh_platform(name)
+        snapshot = self.snapshots.get(name)
+        if snapshot is None:
+            return None
+        return snapshot.to_dict(self.stale_after)
+    
+    async def get_all(self) -> List[Dict[str, Any]]:
+        """读取所有启用平台的快照"""
+        names = self.enabled_platforms()
+        missing = [name for name in names if self._is_cold(name)]
+        if missing:
+            await asyncio.gather(*(self.refresh_platform(name) for name in missing))
+        return [
+            self.snapshots[name].to_dict(self.stale_after)
+            for name in names
+            if name in self.snapshots
+        ]
+
+
+def _sort_key(download: Dict[str, Any], field: str) -> Tuple[float, str, str]:
+    """排序键：(数值, 平台, ID)，平台和ID保证排序稳定、游标唯一"""
+    value = download.get(field)
+    try:
+        value = float(value) if value is not None else 0.0
+    except (TypeError, ValueError):
+        value = 0.0
+    return (value, str(download.get('platform') or ''), str(download.get('id') or ''))
+
+
+def encode_cursor(key: Tuple[float, str, str]) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[float, str, str]:
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(key, list) or len(key) != 3:
+            raise ValueError
+        value, platform, download_id = key
+        return (float(value), str(platform), str(download_id))
+    except (TypeError, ValueError, binascii.Error):
+        raise ValueError(f"无效的分页游标: {cursor}")
+
+
+def filter_downloads(downloads: List[Dict[str, Any]], status: Optional[str] = None,
+                     q: Optional[str] = None) -> List[Dict[str, Any]]:
+    """按状态（多个用逗号分隔）和标题/URL关键词（不区分大小写）过滤下载记录"""
+    items = downloads
+    if status:
+        statuses = {s.strip() for s in status.split(',') if s.strip()}
+        items = [d for d in items if d.get('status') in statuses]
+    if q:
+        keyword = q.lower()
+        items = [
+            d for d in items
+            if keyword in (d.get('title') or '').lower() or keyword in (d.get('url') or '').lower()
+        ]
+    return items
+
+
+def query_downloads(downloads: List[Dict[str, Any]], status: Optional[str] = None, q: Optional[str] = None,
+                    sort: str = 'created_at', order: str = 'desc', limit: int = 50,
+                    cursor: Optional[str] = None) -> Dict[str, Any]:
+    """过滤、排序并按游标分页下载记录
+    
+    Args:
+        status: 状态过滤，多个状态用逗号分隔
+        q: 标题/URL 关键词（不区分大小写）
+        sort: 排序字段 (progress/speed/created_at)
+        order: asc/desc
+        limit: 每页数量
+        cursor: 上一页返回的 next_cursor（keyset 分页，翻页期间列表变化不会导致重复或遗漏）
+    
+    Returns:
+        dict: {'items': [...], 'total': 过滤后的总数, 'next_cursor': str|None}
+    """
+    field = SORT_FIELDS.get(sort)
+    if field is None:
+        raise ValueError(f"不支持的排序字段: {sort}")
+    if order not in ('asc', 'desc'):
+        raise ValueError(f"不支持的排序方向: {order}")
+    
+    items = filter_downloads(downloads, status, q)
+    
+    descending = order == 'desc'
+    keyed = sorted(((_sort_key(d, field), d) for d in items), key=lambda kd: kd[0], reverse=descending)
+    
+    if cursor:
+        after = decode_cursor(cursor)
+        if descending:
+            keyed = [kd for kd in keyed if kd[0] < after]
+        else:
+            keyed = [kd for kd in keyed if kd[0] > after]
+    
+    page = keyed[:limit]
+    next_cursor = encode_cursor(page[-1][0]) if len(keyed) > limit else None
+    
+    return {
+        'items': [d for _, d in page],
+        'total': len(items),
+        'next_cursor': next_cursor
+    }
+
+
+# 全局下载记录视图实例
+_downloads_view: Optional[DownloadsView] = None
+
+
+def get_downloads_view() -> DownloadsView:
+    """获取下载记录视图实例（单例）"""
+    global _downloads_view
+    if _downloads_view is None:
+        _downloads_view = DownloadsView()
+    return _downloads_view
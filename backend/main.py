@@ -1,7 +1,8 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List
 import uuid
 import argparse
 import os
@@ -28,6 +29,14 @@ parser.add_argument('--port',
                     type=int,
                     default=8000,
                     help='服务器端口 (默认: 8000)')
+parser.add_argument('--retention-days',
+                    type=float,
+                    default=float(os.getenv('RETENTION_DAYS', '30')),
+                    help='已结束任务保留天数，超过后移入归档表，0 表示不归档 (默认: 30)')
+parser.add_argument('--archive-retention-days',
+                    type=float,
+                    default=float(os.getenv('ARCHIVE_RETENTION_DAYS', '0')),
+                    help='归档任务保留天数，0 表示永久保留 (默认: 0)')
 
 args, unknown = parser.parse_known_args()
 
@@ -57,6 +66,52 @@ try:
 except Exception as e:
     logger.error(f"插件自动加载失败: {e}", exc_info=True)
 
+def resolve_platform_id(plugin_name: str, metadata: Dict[str, Any]) -> Optional[str]:
+    """通过下载插件从任务 metadata 计算平台任务ID（为旧任务补充 platform_id 列）"""
+    plugin = plugin_manager.get_download_plugin(plugin_name)
+    return plugin.get_platform_id(metadata) if plugin else None
+
+
+@app.on_event("startup")
+async def on_startup():
+    """启动后台服务：下载任务队列（恢复未完成的任务）、下载状态同步、下载调度、下载记录视图、数据库维护"""
+    from download_queue import get_download_queue
+    from download_reconciler import get_reconciler
+    from download_scheduler import get_scheduler
+    from downloads_view import get_downloads_view
+    from db_maintenance import get_maintenance
+    from database import get_async_database
+    await get_async_database().backfill_platform_ids(resolve_platform_id)
+    await get_download_queue().start(plugin_manager)
+    get_reconciler().start(plugin_manager)
+    get_scheduler().start(plugin_manager)
+    get_downloads_view().start(plugin_manager)
+    
+    maintenance = get_maintenance()
+    maintenance.retention_days = args.retention_days
+    maintenance.archive_retention_days = args.archive_retention_days
+    maintenance.start()
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    """停止后台服务，关闭下载插件的连接，最后关闭数据库连接"""
+    from download_queue import get_download_queue
+    from download_reconciler import get_reconciler
+    from download_scheduler import get_scheduler
+    from downloads_view import get_downloads_view
+    from db_maintenance import get_maintenance
+    await get_maintenance().stop()
+    await get_downloads_view().stop()
+    await get_scheduler().stop()
+    await get_reconciler().stop()
+    await get_download_queue().stop()
+    await plugin_manager.close_download_plugins()
+    
+    from database import get_async_database
+    await get_async_database().close()
+
+
 @app.get("/")
 async def root():
     logger.debug("访问根路径")
@@ -214,6 +269,19 @@ class DownloadRequest(BaseModel):
     title: str
     plugin_name: Optional[str] = None
     metadata: Optional[Dict[str, Any]] = None
+    force: bool = False  # 为 True 时即使存在重复任务也创建新任务
+    priority: str = "normal"  # high/normal/low，low 为批量任务，只在插件配置的下载时段内开始
+
+class BatchDownloadItem(BaseModel):
+    url: str
+    title: str
+    metadata: Optional[Dict[str, Any]] = None
+
+class BatchDownloadRequest(BaseModel):
+    items: List[BatchDownloadItem]
+    plugin_name: Optional[str] = None  # 为空时按每个URL自动选择
+    force: bool = False  # 为 True 时跳过重复检查
+    priority: str = "normal"  # 批量任务通常使用 low
 
 
 @app.post("/api/video-info")
@@ -247,60 +315,90 @@ async def get_video_info(request: VideoInfoRequest):
         raise HTTPException(status_code=500, detail=f"获取视频详情失败: {str(e)}")
 
 
+def check_priority(priority: str):
+    from download_scheduler import PRIORITIES
+    if priority not in PRIORITIES:
+        raise HTTPException(status_code=400, detail=f"Invalid priority: {priority}")
+
+
+def select_download_plugin(url: str, plugin_name: Optional[str] = None):
+    """选择下载插件（未指定时根据URL自动选择）"""
+    if not plugin_name:
+        logger.debug("自动选择下载插件...")
+        plugin = plugin_manager.get_suitable_download_plugin(url)
+        if not plugin:
+            logger.error(f"未找到合适的下载插件，URL: {url}")
+            raise HTTPException(status_code=400, detail="No suitable download plugin found")
+        logger.info(f"自动选择插件: {plugin.name}")
+    else:
+        logger.debug(f"使用指定插件: {plugin_name}")
+        plugin = plugin_manager.get_download_plugin(plugin_name)
+        if not plugin:
+            logger.error(f"插件未找到: {plugin_name}")
+            raise HTTPException(status_code=404, detail="Plugin not found")
+    return plugin
+
+
 @app.post("/api/download")
 async def create_download_task(request: DownloadRequest):
-    """创建下载任务"""
+    """创建下载任务
+    
+    任务以 queued 状态保存，由下载调度器按优先级和插件名额放行后提交。
+    如果已有相同资源（规范化 URL 或 BT infohash 相同）的进行中或最近完成的任务，
+    直接返回该任务（status 为 duplicate），除非 force 为 True。
+    """
     logger.info(f"创建下载任务: {request.title}")
     logger.debug(f"下载请求详情: url={request.url[:100]}..., plugin={request.plugin_name}")
     
     try:
-        # 选择下载插件
-        if not request.plugin_name:
-            logger.debug("自动选择下载插件...")
-            plugin = plugin_manager.get_suitable_download_plugin(request.url)
-            if not plugin:
-                logger.error(f"未找到合适的下载插件，URL: {request.url}")
-                raise HTTPException(status_code=400, detail="No suitable download plugin found")
-            logger.info(f"自动选择插件: {plugin.name}")
-        else:
-            logger.debug(f"使用指定插件: {request.plugin_name}")
-            plugin = plugin_manager.get_download_plugin(request.plugin_name)
-            if not plugin:
-                logger.error(f"插件未找到: {request.plugin_name}")
-                raise HTTPException(status_code=404, detail="Plugin not found")
-        
-        # 创建任务
-        task = DownloadTask(
-            id=str(uuid.uuid4()),
-            url=request.url,
-            title=request.title,
-            status="pending",
-            plugin_name=plugin.name,
-            save_path=plugin.config.get('download_path', '/downloads'),
-            metadata=request.metadata or {}
-        )
+        check_priority(request.priority)
         
-        logger.info(f"任务ID: {task.id}, 使用插件: {plugin.name}")
-        logger.debug(f"保存路径: {task.save_path}")
+        from download_dedup import get_duplicate_index, infohash_from_keys
+        index = get_duplicate_index()
+        keys = await index.keys_for_url(request.url)
         
-        # 保存任务到数据库
-        from database import get_database
-        db = get_database()
-        db.add_task(task.model_dump())
+        # 锁内查找重复任务并写入新任务，同一资源的并发请求不会都通过检查
+        async with index.lock(keys):
+            if not request.force:
+                existing = await index.find(keys)
+                if existing:
+                    logger.info(f"下载任务已存在，返回已有任务: {existing['id']} ({existing['plugin_name']})")
+                    return {"status": "duplicate", "task": dict(existing)}
+            
+            plugin = select_download_plugin(request.url, request.plugin_name)
+            
+            metadata = dict(request.metadata or {})
+            metadata['priority'] = request.priority
+            infohash = infohash_from_keys(keys)
+            if infohash:
+                metadata.setdefault('infohash', infohash)
+            
+            # 创建任务
+            task = DownloadTask(
+                id=str(uuid.uuid4()),
+                url=request.url,
+                title=request.title,
+                status="queued",
+                plugin_name=plugin.name,
+                save_path=plugin.config.get('download_path', '/downloads'),
+                metadata=metadata
+            )
+            
+            logger.info(f"任务ID: {task.id}, 使用插件: {plugin.name}")
+            logger.debug(f"保存路径: {task.save_path}")
+            
+            # 保存任务到数据库，由调度器放行后交给下载队列在后台提交（插件内部会更新任务状态）
+            from database import get_async_database
+            from download_scheduler import get_scheduler
+            db = get_async_database()
+            if not await db.add_task(task.model_dump()):
+                raise HTTPException(status_code=500, detail="保存下载任务失败")
         
-        # 执行下载（插件内部会更新任务状态）
-        logger.debug("开始执行下载...")
-        success = await plugin.download(task)
+        get_scheduler().notify()
+        logger.info(f"下载任务已加入队列: {task.id}")
         
-        if success:
-            logger.info(f"下载任务创建成功: {task.id}")
-            # 重新获取任务以获取最新状态
-            updated_task = db.get_task(task.id)
-            return {"status": "success", "task": updated_task or task.model_dump()}
-        else:
-            logger.error(f"下载失败: {task.id}")
-            raise HTTPException(status_code=500, detail="Download failed")
-            
+        return {"status": "success", "task": task.model_dump()}
+    
     except HTTPException:
         raise
     except Exception as e:
@@ -308,69 +406,242 @@ async def create_download_task(request: DownloadRequest):
         raise HTTPException(status_code=500, detail=f"创建下载任务失败: {str(e)}")
 
 
+@app.post("/api/download/batch")
+async def create_download_batch(request: BatchDownloadRequest):
+    """批量创建下载任务（如下载整部剧集）
+    
+    所有任务在一个事务中写入数据库，插件有空闲名额的任务按插件分组通过后端原生的批量接口提交，
+    其余任务以 queued 状态等待调度器放行；提交失败的任务交给下载队列重试。
+    与已有任务（或同批次中前面的项）重复的项不会创建新任务（除非 force 为 True）。返回每一项的结果。
+    """
+    logger.info(f"批量创建下载任务: {len(request.items)} 项")
+    check_priority(request.priority)
+    
+    from database import get_async_database
+    from download_queue import get_download_queue
+    from download_dedup import get_duplicate_index, infohash_from_keys
+    from download_scheduler import get_scheduler
+    db = get_async_database()
+    queue = get_download_queue()
+    dedup = get_duplicate_index()
+    scheduler = get_scheduler()
+    
+    outcomes: List[Dict[str, Any]] = []
+    groups: Dict[str, List[DownloadTask]] = {}
+    plugins = {}
+    item_keys = await asyncio.gather(*(dedup.keys_for_url(item.url) for item in request.items))
+    batch_keys: Dict[str, str] = {}  # 同批次内的去重键 -> 任务ID
+    
+    # 锁内查找重复任务并写入新任务（锁定本批次所有的去重键），同一资源的并发请求不会都通过检查
+    async with dedup.lock([key for keys in item_keys for key in keys]):
+        for index, (item, keys) in enumerate(zip(request.items, item_keys)):
+            if not request.force:
+                existing_id = next((batch_keys[key] for key in keys if key in batch_keys), None)
+                if existing_id is None:
+                    existing = await dedup.find(keys)
+                    existing_id = existing['id'] if existing else None
+                if existing_id:
+                    outcomes.append({
+                        "index": index,
+                        "id": existing_id,
+                        "title": item.title,
+                        "url": item.url,
+                        "status": "duplicate"
+                    })
+                    continue
+            
+            try:
+                plugin = select_download_plugin(item.url, request.plugin_name)
+            except HTTPException as e:
+                outcomes.append({
+                    "index": index,
+                    "title": item.title,
+                    "url": item.url,
+                    "status": "error",
+                    "error": e.detail
+                })
+                continue
+            
+            metadata = dict(item.metadata or {})
+            metadata['priority'] = request.priority
+            infohash = infohash_from_keys(keys)
+            if infohash:
+                metadata.setdefault('infohash', infohash)
+            
+            task = DownloadTask(
+                id=str(uuid.uuid4()),
+                url=item.url,
+                title=item.title,
+                status="queued",
+                plugin_name=plugin.name,
+                save_path=plugin.config.get('download_path', '/downloads'),
+                metadata=metadata
+            )
+            for key in keys:
+                batch_keys[key] = task.id
+            plugins[plugin.name] = plugin
+            groups.setdefault(plugin.name, []).append(task)
+            outcomes.append({
+                "index": index,
+                "id": task.id,
+                "title": task.title,
+                "url": task.url,
+                "plugin_name": plugin.name
+            })
+        
+        # 按下载时段和预留到的插件名额决定立即提交的任务，其余保持排队
+        submit_groups: Dict[str, List[DownloadTask]] = {}
+        try:
+            for plugin_name, group in groups.items():
+                startable = [task for task in group if scheduler.can_start(task.model_dump())]
+                granted = await scheduler.try_acquire(plugin_name, len(startable))
+                for task in startable[:granted]:
+                    task.status = "submitting"
+                    submit_groups.setdefault(plugin_name, []).append(task)
+            
+            tasks = [task for group in groups.values() for task in group]
+            if tasks and not await db.add_tasks([task.model_dump() for task in tasks]):
+                raise HTTPException(status_code=500, detail="保存下载任务失败")
+        finally:
+            # 任务已以 submitting 状态写入数据库（或写入失败），释放预留的名额
+            for plugin_name, group in submit_groups.items():
+                scheduler.release_reserved(plugin_name, len(group))
+    
+    async def submit_group(plugin_name: str, group: List[DownloadTask]) -> Dict[str, bool]:
+        try:
+            return await plugins[plugin_name].download_batch(group)
+        except Exception as e:
+            logger.error(f"批量提交到 {plugin_name} 失败: {e}", exc_info=True)
+            return {task.id: False for task in group}
+    
+    results: Dict[str, bool] = {}
+    for group_result in await asyncio.gather(*(
+        submit_group(plugin_name, group) for plugin_name, group in submit_groups.items()
+    )):
+        results.update(group_result)
+    
+    for outcome in outcomes:
+        task_id = outcome.get("id")
+        if task_id is None or outcome.get("status") == "duplicate":
+            continue
+        if task_id not in results:
+            # 没有空闲名额，等待调度器放行
+            outcome["status"] = "queued"
+        elif results[task_id]:
+            outcome["status"] = "submitted"
+        else:
+            # 提交失败的任务交给下载队列按退避策略重试
+            await queue.retry(task_id, 1, "Batch submission failed")
+            outcome["status"] = "queued"
+    
+    if len(results) < len(tasks):
+        scheduler.notify()
+    
+    submitted = sum(1 for o in outcomes if o["status"] == "submitted")
+    duplicates = sum(1 for o in outcomes if o["status"] == "duplicate")
+    logger.info(f"批量下载完成: 提交 {submitted}, 排队/重试 {len(tasks) - submitted}, 重复 {duplicates}, "
+                f"失败 {len(outcomes) - len(tasks) - duplicates}")
+    
+    return {
+        "status": "success",
+        "total": len(outcomes),
+        "submitted": submitted,
+        "duplicates": duplicates,
+        "items": outcomes
+    }
+
+
 @app.get("/api/downloads")
-async def get_downloads(platform: str = "all"):
-    """获取下载记录（从下载插件查询）
+async def get_downloads(platform: str = "all", status: Optional[str] = None, q: Optional[str] = None,
+                        sort: Optional[str] = None, order: str = "desc",
+                        limit: Optional[int] = None, cursor: Optional[str] = None):
+    """获取下载记录（读取后台维护的下载记录视图，不等待下载平台）
     
     Args:
         platform: 平台名称 (all/metube/qbittorrent)
+        status: 状态过滤，多个状态用逗号分隔 (pending/downloading/completed/failed/paused)
+        q: 标题/URL 关键词
+        sort: 排序字段 (progress/speed/created_at)
+        order: 排序方向 (asc/desc)
+        limit: 每页数量；指定 sort/limit/cursor 时返回分页的扁平列表 items
+        cursor: 上一页返回的 next_cursor
     """
-    logger.info(f"查询下载记录: platform={platform}")
+    logger.info(f"查询下载记录: platform={platform}, status={status}, q={q}, sort={sort}, limit={limit}")
     
     try:
+        from downloads_view import get_downloads_view, filter_downloads, query_downloads
+        view = get_downloads_view()
+        
         if platform == "all":
-            # 聚合所有平台的下载记录（只查询启用的插件）
-            all_downloads = []
-            platforms_info = []
+            platforms_info = await view.get_all()
+        else:
+            platform_info = await view.get_platform(platform)
+            if platform_info is None:
+                raise HTTPException(status_code=404, detail=f"Platform {platform} not found")
+            platforms_info = [platform_info]
+        
+        stale_platforms = [p['name'] for p in platforms_info if p['stale']]
+        
+        if sort or limit or cursor:
+            # 分页模式：合并所有平台的记录后过滤、排序、分页
+            downloads = [d for p in platforms_info for d in p['downloads']]
+            try:
+                result = query_downloads(
+                    downloads,
+                    status=status,
+                    q=q,
+                    sort=sort or 'created_at',
+                    order=order,
+                    limit=max(1, min(limit or 50, 500)),
+                    cursor=cursor
+                )
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
             
-            for plugin_info in plugin_manager.list_plugins()['download']:
-                plugin_name = plugin_info['name']
-                
-                # 跳过禁用的插件
-                if not plugin_info.get('enabled', True):
-                    logger.debug(f"跳过禁用的插件: {plugin_name}")
-                    continue
-                
-                plugin = plugin_manager.get_download_plugin(plugin_name)
-                if plugin:
-                    try:
-                        downloads = await plugin.get_downloads()
-                        web_ui_url = plugin.get_web_ui_url()
-                        
-                        platforms_info.append({
-                            'name': plugin_name,
-                            'web_ui_url': web_ui_url,
-                            'downloads': downloads
-                        })
-                        
-                        all_downloads.extend(downloads)
-                    except Exception as e:
-                        logger.error(f"获取 {plugin_name} 下载记录失败: {e}")
+            logger.info(f"分页查询完成，共 {result['total']} 条记录，本页 {len(result['items'])} 条")
+            
+            return {
+                "platform": platform,
+                "platforms": [
+                    {key: value for key, value in p.items() if key != 'downloads'}
+                    for p in platforms_info
+                ],
+                "items": result['items'],
+                "total": result['total'],
+                "next_cursor": result['next_cursor'],
+                "stale_platforms": stale_platforms
+            }
+        
+        for p in platforms_info:
+            p['downloads'] = filter_downloads(p['downloads'], status, q)
+        
+        if platform == "all":
+            # 聚合所有启用平台的下载记录
+            total = sum(len(p['downloads']) for p in platforms_info)
             
-            logger.info(f"聚合查询完成，共 {len(all_downloads)} 条记录")
+            logger.info(f"聚合查询完成，共 {total} 条记录" +
+                        (f"，过期平台: {stale_platforms}" if stale_platforms else ""))
             
             return {
                 "platform": "all",
                 "platforms": platforms_info,
-                "total": len(all_downloads)
+                "total": total,
+                "stale_platforms": stale_platforms
             }
         else:
             # 查询指定平台
-            plugin = plugin_manager.get_download_plugin(platform)
-            if not plugin:
-                raise HTTPException(status_code=404, detail=f"Platform {platform} not found")
-            
-            downloads = await plugin.get_downloads()
-            web_ui_url = plugin.get_web_ui_url()
-            
-            logger.info(f"查询 {platform} 完成，共 {len(downloads)} 条记录")
+            platform_info = platforms_info[0]
+            logger.info(f"查询 {platform} 完成，共 {len(platform_info['downloads'])} 条记录")
             
             return {
                 "platform": platform,
-                "web_ui_url": web_ui_url,
-                "downloads": downloads
+                "web_ui_url": platform_info['web_ui_url'],
+                "instances": platform_info['instances'],
+                "downloads": platform_info['downloads'],
+                "updated_at": platform_info['updated_at'],
+                "stale": platform_info['stale']
             }
-            
+    
     except HTTPException:
         raise
     except Exception as e:
@@ -378,11 +649,91 @@ async def get_downloads(platform: str = "all"):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-class CancelDownloadRequest(BaseModel):
+@app.get("/api/downloads/events")
+async def download_events():
+    """下载进度事件流（Server-Sent Events）
+    
+    事件:
+        ready: 连接建立
+        updated: {platform, id, changes} 下载记录中变化的字段
+        added: {platform, download} 新的下载记录
+        removed: {platform, id} 下载记录已删除
+        platform: {platform, changes} 平台状态（过期、错误、实例）变化
+        resync: 事件积压或平台列表变化，页面应重新加载
+    """
+    from download_events import get_event_hub
+    hub = get_event_hub()
+    subscriber = hub.subscribe()
+    
+    async def event_stream():
+        try:
+            async for message in hub.stream(subscriber):
+                yield message
+        finally:
+            hub.unsubscribe(subscriber)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+class DownloadRef(BaseModel):
     platform: str
     download_id: str
 
 
+class CancelDownloadRequest(BaseModel):
+    platform: Optional[str] = None
+    download_id: Optional[str] = None
+    items: List[DownloadRef] = []  # 批量取消
+
+
+class RetryDownloadRequest(BaseModel):
+    items: List[DownloadRef]
+
+
+# 可以重试的本地任务状态
+RETRYABLE_STATUSES = ('failed', 'canceled', 'completed')
+# 重试时清除的 metadata 字段（指向平台上的旧记录，重新提交后由插件重新写入）
+RETRY_RESET_KEYS = ('metube_id', 'metube_prefix', 'torrent_hash', 'instance')
+
+
+def group_download_refs(items: List[DownloadRef]) -> Dict[str, List[str]]:
+    """按平台分组下载ID（去重并保持顺序）"""
+    groups: Dict[str, List[str]] = {}
+    for item in items:
+        ids = groups.setdefault(item.platform, [])
+        if item.download_id not in ids:
+            ids.append(item.download_id)
+    return groups
+
+
+async def find_platform_tasks(plugin, platform_ids: List[str], statuses) -> Dict[str, Dict[str, Any]]:
+    """查找这些平台任务ID对应的本地任务 {platform_id: task}"""
+    from database import get_async_database
+    db = get_async_database()
+    
+    found = {}
+    for task in await db.get_tasks_by_platform_ids(plugin.name, platform_ids, statuses):
+        # 同一平台任务ID有多个本地任务时取最新的
+        found.setdefault(task['platform_id'], task)
+    return found
+
+
+async def mark_tasks_canceled(plugin, platform_ids: List[str]):
+    """把已在下载平台取消的任务标记为 canceled，并释放调度名额"""
+    from database import get_async_database
+    from download_scheduler import get_scheduler, SLOT_STATUSES
+    db = get_async_database()
+    
+    tasks = await find_platform_tasks(plugin, platform_ids, SLOT_STATUSES + ('paused',))
+    if tasks:
+        await db.update_tasks({task['id']: {'status': 'canceled'} for task in tasks.values()})
+        get_scheduler().notify()
+
+
 @app.post("/api/downloads/cancel")
 async def cancel_download(request: CancelDownloadRequest):
     """取消下载任务
@@ -390,24 +741,71 @@ async def cancel_download(request: CancelDownloadRequest):
     Args:
         platform: 平台名称 (metube/qbittorrent)
         download_id: 平台的下载ID
+        items: 批量取消 [{platform, download_id}]，按平台分组后通过后端原生的批量删除接口一次提交
     """
-    logger.info(f"取消下载任务: platform={request.platform}, id={request.download_id}")
+    if not request.items:
+        if not request.platform or not request.download_id:
+            raise HTTPException(status_code=400, detail="需要 platform 和 download_id，或 items")
+        return await cancel_single_download(request.platform, request.download_id)
+    
+    groups = group_download_refs(request.items)
+    logger.info(f"批量取消下载任务: {sum(len(ids) for ids in groups.values())} 个, 平台: {list(groups)}")
+    
+    from downloads_view import get_downloads_view
+    view = get_downloads_view()
+    
+    canceled = 0
+    failed: List[Dict[str, str]] = []
+    for platform, download_ids in groups.items():
+        plugin = plugin_manager.get_download_plugin(platform)
+        if not plugin:
+            failed.extend({"platform": platform, "download_id": i, "reason": "平台不存在"} for i in download_ids)
+            continue
+        
+        try:
+            results = await plugin.cancel_batch(download_ids)
+        except Exception as e:
+            logger.error(f"批量取消 {platform} 任务失败: {e}", exc_info=True)
+            results = {}
+        
+        done = [i for i in download_ids if results.get(i)]
+        failed.extend({"platform": platform, "download_id": i, "reason": "取消失败"}
+                      for i in download_ids if not results.get(i))
+        canceled += len(done)
+        if done:
+            await mark_tasks_canceled(plugin, done)
+            await view.refresh_platform(platform)
+    
+    logger.info(f"✓ 批量取消完成: 成功 {canceled} 个, 失败 {len(failed)} 个")
+    return {
+        "status": "success" if not failed else "partial",
+        "canceled": canceled,
+        "failed": failed
+    }
+
+
+async def cancel_single_download(platform: str, download_id: str):
+    logger.info(f"取消下载任务: platform={platform}, id={download_id}")
     
     try:
         # 获取插件
-        plugin = plugin_manager.get_download_plugin(request.platform)
+        plugin = plugin_manager.get_download_plugin(platform)
         if not plugin:
-            raise HTTPException(status_code=404, detail=f"Platform {request.platform} not found")
+            raise HTTPException(status_code=404, detail=f"Platform {platform} not found")
         
         # 调用插件取消
-        success = await plugin.cancel(request.download_id)
+        success = await plugin.cancel(download_id)
         
         if success:
-            logger.info(f"✓ 任务已取消: {request.platform}/{request.download_id}")
+            logger.info(f"✓ 任务已取消: {platform}/{download_id}")
+            await mark_tasks_canceled(plugin, [download_id])
+            # 立即刷新该平台的下载记录视图
+            from downloads_view import get_downloads_view
+            await get_downloads_view().refresh_platform(platform)
             return {"status": "success"}
         else:
             raise HTTPException(status_code=500, detail="Failed to cancel download")
-            
+    
     except HTTPException:
         raise
     except Exception as e:
@@ -415,6 +813,165 @@ async def cancel_download(request: CancelDownloadRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/api/downloads/retry")
+async def retry_downloads(request: RetryDownloadRequest):
+    """批量重试下载任务（失败、已取消或已完成的任务）
+    
+    按平台分组，插件先通过后端原生的批量接口清理平台上的旧记录，
+    然后把对应的本地任务重新置为 queued，由调度器放行后重新提交；
+    平台上有记录但本地没有的任务（如直接在平台上添加的）按记录的链接和标题新建任务。
+    
+    Args:
+        items: [{platform, download_id}]
+    """
+    from database import get_async_database
+    from download_scheduler import get_scheduler, SLOT_STATUSES, QUEUED_STATUS, DEFAULT_PRIORITY
+    from downloads_view import get_downloads_view
+    db = get_async_database()
+    view = get_downloads_view()
+    
+    groups = group_download_refs(request.items)
+    logger.info(f"批量重试下载任务: {sum(len(ids) for ids in groups.values())} 个, 平台: {list(groups)}")
+    
+    retried: List[str] = []
+    skipped: List[Dict[str, str]] = []
+    for platform, download_ids in groups.items():
+        plugin = plugin_manager.get_download_plugin(platform)
+        if not plugin:
+            skipped.extend({"platform": platform, "download_id": i, "reason": "平台不存在"} for i in download_ids)
+            continue
+        
+        local = await find_platform_tasks(plugin, download_ids, (QUEUED_STATUS,) + SLOT_STATUSES + ('paused',) + RETRYABLE_STATUSES)
+        records = {}
+        if any(i not in local for i in download_ids):
+            platform_info = await view.get_platform(platform)
+            records = {str(d.get('id')): d for d in (platform_info or {}).get('downloads', [])}
+        
+        candidates = []
+        for download_id in download_ids:
+            task = local.get(download_id)
+            if task is not None and task['status'] not in RETRYABLE_STATUSES:
+                skipped.append({"platform": platform, "download_id": download_id, "reason": "任务正在进行中"})
+            elif task is None and not records.get(download_id, {}).get('url'):
+                skipped.append({"platform": platform, "download_id": download_id, "reason": "未找到任务"})
+            else:
+                candidates.append(download_id)
+        if not candidates:
+            continue
+        
+        try:
+            ready = await plugin.prepare_retry(candidates)
+        except Exception as e:
+            logger.error(f"清理 {platform} 旧任务失败: {e}", exc_info=True)
+            ready = {}
+        
+        updates: Dict[str, Dict[str, Any]] = {}
+        new_tasks: List[Dict[str, Any]] = []
+        for download_id in candidates:
+            if not ready.get(download_id):
+                skipped.append({"platform": platform, "download_id": download_id, "reason": "无法清理平台上的旧任务"})
+                continue
+            
+            task = local.get(download_id)
+            if task is not None:
+                metadata = {k: v for k, v in (task.get('metadata') or {}).items() if k not in RETRY_RESET_KEYS}
+                # 重置提交次数和错误，重试的任务重新获得完整的提交重试次数
+                updates[task['id']] = {'status': QUEUED_STATUS, 'progress': 0.0, 'metadata': metadata, 'platform_id': None,
+                                       'attempts': 0, 'error': None}
+            else:
+                record = records[download_id]
+                task = DownloadTask(
+                    id=str(uuid.uuid4()),
+                    url=record.get('url') or '',
+                    title=record.get('title') or '',
+                    status=QUEUED_STATUS,
+                    plugin_name=plugin.name,
+                    save_path=plugin.config.get('download_path', '/downloads'),
+                    metadata={'priority': DEFAULT_PRIORITY}
+                ).model_dump()
+                new_tasks.append(task)
+            retried.append(task['id'])
+        
+        if updates:
+            await db.update_tasks(updates)
+        if new_tasks:
+            await db.add_tasks(new_tasks)
+        if updates or new_tasks:
+            await view.refresh_platform(platform)
+    
+    if retried:
+        get_scheduler().notify()
+    
+    logger.info(f"✓ 批量重试: 重新排队 {len(retried)} 个, 跳过 {len(skipped)} 个")
+    return {
+        "status": "success" if not skipped else "partial",
+        "retried": retried,
+        "skipped": skipped
+    }
+
+
+# ==================== 下载任务 API ====================
+
+@app.get("/api/tasks")
+async def list_tasks(status: Optional[str] = None, limit: int = 50, cursor: Optional[str] = None,
+                     fields: Optional[str] = None):
+    """列出本地记录的下载任务（按创建时间倒序，基于游标分页）
+    
+    Args:
+        status: 状态过滤，多个状态用逗号分隔 (queued/pending/submitting/downloading/completed/failed/canceled)
+        limit: 每页数量（1-500）
+        cursor: 上一页返回的 next_cursor
+        fields: 返回的字段，多个用逗号分隔；为空时返回全部字段
+    """
+    from database import get_async_database
+    statuses = [s.strip() for s in status.split(',') if s.strip()] if status else None
+    columns = [f.strip() for f in fields.split(',') if f.strip()] if fields else None
+    
+    try:
+        result = await get_async_database().list_tasks(
+            statuses,
+            limit=max(1, min(limit, 500)),
+            cursor=cursor,
+            columns=columns
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return {
+        "tasks": [dict(task) for task in result['tasks']],
+        "next_cursor": result['next_cursor']
+    }
+
+
+# ==================== 存储 API ====================
+
+@app.get("/api/storage/stats")
+async def get_storage_stats():
+    """数据库存储统计（文件大小、空闲页、各状态任务数、归档任务数）和最近一次维护结果"""
+    from database import get_async_database
+    from db_maintenance import get_maintenance
+    maintenance = get_maintenance()
+    
+    stats = await get_async_database().get_storage_stats()
+    return {
+        **stats,
+        "retention_days": maintenance.retention_days,
+        "archive_retention_days": maintenance.archive_retention_days,
+        "last_maintenance": maintenance.last_run
+    }
+
+
+@app.post("/api/storage/maintenance")
+async def run_storage_maintenance(full_vacuum: bool = False):
+    """立即执行一次数据库维护（归档过期任务、optimize、增量 VACUUM）
+    
+    full_vacuum 为 true 时，尚未启用增量 VACUUM 的旧数据库先执行一次完整 VACUUM 转换（期间阻塞写入）。
+    """
+    from db_maintenance import get_maintenance
+    logger.info(f"手动执行数据库维护 (full_vacuum={full_vacuum})")
+    return await get_maintenance().run_once(full_vacuum=full_vacuum)
+
+
 # ==================== 插件管理 API ====================
 
 class InstallPluginRequest(BaseModel):
@@ -508,7 +1065,7 @@ async def install_plugin(request: InstallPluginRequest):
                 "hot_loaded": False,
                 "message": "插件安装成功，请重启服务以加载插件"
             }
-        
+    
     except HTTPException:
         raise
     except Exception as e:
@@ -566,7 +1123,7 @@ async def delete_plugin(request: DeletePluginRequest):
                 "hot_unloaded": False,
                 "message": "插件删除成功，请重启服务以生效"
             }
-        
+    
     except HTTPException:
         raise
     except Exception as e:
@@ -588,7 +1145,7 @@ async def reload_plugins():
             "fail_count": fail_count,
             "message": f"插件重新加载完成: 成功 {success_count}, 失败 {fail_count}"
         }
-        
+    
     except Exception as e:
         logger.error(f"重新加载插件失败: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
@@ -628,7 +1185,7 @@ async def export_config():
             "config": config_data,
             "timestamp": __import__('datetime').datetime.now().isoformat()
         }
-        
+    
     except Exception as e:
         logger.error(f"导出配置失败: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
@@ -693,7 +1250,7 @@ async def import_config(request: ImportConfigRequest):
             "reloaded_count": reload_count,
             "message": f"配置导入成功，已更新 {reload_count} 个插件配置"
         }
-        
+    
     except Exception as e:
         logger.error(f"导入配置失败: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
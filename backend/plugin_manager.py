@@ -2,6 +2,7 @@ from typing import Dict, List, Any, Optional
 from base_plugin import SearchPlugin, DownloadPlugin, ParserPlugin
 from config_storage import get_config_storage
 from logger import get_logger
+import asyncio
 import importlib
 import sys
 import os
@@ -29,6 +30,9 @@ class PluginManager:
             logger.info(f"已加载插件配置: {plugin.name}")
     
     def register_download_plugin(self, plugin: DownloadPlugin):
+        replaced = self.download_plugins.get(plugin.name)
+        if replaced is not None and replaced is not plugin:
+            self._close_later(replaced)
         self.download_plugins[plugin.name] = plugin
         logger.info(f"✓ 注册下载插件: {plugin.name} v{plugin.version}")
         
@@ -122,20 +126,29 @@ class PluginManager:
             logger.info(f"插件配置已保存: {plugin_type}/{plugin_name}")
     
     def get_suitable_download_plugin(self, url: str) -> Optional[DownloadPlugin]:
+        """根据URL选择下载插件
+        
+        先按链接类型筛选支持该协议的插件，再优先选择已启用的插件，
+        同为启用/禁用时选择 get_url_priority() 最高的插件。
+        """
         if url.startswith("magnet:") or url.endswith(".torrent"):
-            for plugin in self.download_plugins.values():
-                if "magnet" in plugin.supported_protocols or "torrent" in plugin.supported_protocols:
-                    return plugin
+            protocols = ("magnet", "torrent")
         elif ".m3u8" in url:
-            for plugin in self.download_plugins.values():
-                if "m3u8" in plugin.supported_protocols:
-                    return plugin
+            protocols = ("m3u8",)
         else:
-            for plugin in self.download_plugins.values():
-                if "http" in plugin.supported_protocols or "https" in plugin.supported_protocols:
-                    return plugin
+            protocols = ("http", "https")
+        
+        candidates = [
+            plugin for plugin in self.download_plugins.values()
+            if any(protocol in plugin.supported_protocols for protocol in protocols)
+        ]
+        if not candidates:
+            return None
         
-        return None
+        return max(candidates, key=lambda plugin: (
+            self.config_storage.is_enabled("download", plugin.name),
+            plugin.get_url_priority(url)
+        ))
     
     def get_active_parsers(self) -> List[ParserPlugin]:
         """获取所有启用的解析器插件"""
@@ -198,6 +211,22 @@ class PluginManager:
         except Exception as e:
             logger.warning(f"配置迁移失败（可能是首次运行）: {e}")
     
+    def _close_later(self, plugin: DownloadPlugin):
+        """在后台关闭被卸载或替换的下载插件（没有运行中的事件循环时跳过）"""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        asyncio.ensure_future(plugin.close())
+    
+    async def close_download_plugins(self):
+        """关闭所有下载插件（服务停止时调用）"""
+        for plugin in list(self.download_plugins.values()):
+            try:
+                await plugin.close()
+            except Exception as e:
+                logger.warning(f"关闭下载插件失败: {plugin.name} - {e}")
+    
     def unregister_plugin(self, plugin_type: str, plugin_name: str) -> bool:
         """注销插件（用于热卸载）"""
         try:
@@ -208,7 +237,7 @@ class PluginManager:
                     return True
             elif plugin_type == "download":
                 if plugin_name in self.download_plugins:
-                    del self.download_plugins[plugin_name]
+                    self._close_later(self.download_plugins.pop(plugin_name))
                     logger.info(f"✓ 注销下载插件: {plugin_name}")
                     return True
             elif plugin_type == "parser":
@@ -285,8 +314,10 @@ class PluginManager:
         download_names = list(self.download_plugins.keys())
         parser_names = list(self.parser_plugins.keys())
         
-        # 清空插件
+        # 清空插件（下载插件释放连接等资源）
         self.search_plugins.clear()
+        for plugin in self.download_plugins.values():
+            self._close_later(plugin)
         self.download_plugins.clear()
         self.parser_plugins.clear()
         
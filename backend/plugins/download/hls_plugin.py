@@ -0,0 +1,668 @@
+"""
+HLS (m3u8) 下载插件
+直接在本服务内下载 m3u8 视频，不依赖外部下载器：
+解析 master/media 播放列表并选择码率，按主机限制并发下载分片，支持 AES-128 解密；
+分片完成情况记录在位图中，服务重启后从断点继续；全部完成后流式合并为 .ts（可选用 ffmpeg 转为 .mp4）。
+"""
+from typing import List, Optional, Dict, Any
+from urllib.parse import urljoin, urlsplit
+from collections import deque
+from base_plugin import DownloadPlugin
+from models import ConfigField, DownloadTask
+from logger import get_logger
+import httpx
+import asyncio
+import json
+import os
+import re
+import shutil
+import time
+
+try:
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+except ImportError:  # 可选依赖，仅加密的流需要
+    Cipher = None
+
+logger = get_logger(__name__)
+
+# 任务状态文件目录（与数据库同在 data 目录下）
+STATE_DIR = os.path.join("data", "hls")
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+                  '(KHTML, like Gecko) Chrome/120.0 Safari/537.36'
+}
+
+_ATTR_RE = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+
+
+class HLSError(Exception):
+    """HLS 播放列表解析或下载错误"""
+    pass
+
+
+def parse_attributes(value: str) -> Dict[str, str]:
+    """解析 m3u8 标签属性列表，如 BANDWIDTH=800000,RESOLUTION=1280x720"""
+    return {key: val.strip('"') for key, val in _ATTR_RE.findall(value)}
+
+
+def parse_master_playlist(text: str, base_url: str) -> List[Dict[str, Any]]:
+    """解析 master 播放列表，返回码率列表 [{'uri', 'bandwidth', 'height'}]；不是 master 列表时返回空列表"""
+    variants = []
+    pending = None
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith('#EXT-X-STREAM-INF:'):
+            attrs = parse_attributes(line.split(':', 1)[1])
+            resolution = attrs.get('RESOLUTION', '')
+            height = int(resolution.split('x')[1]) if 'x' in resolution else 0
+            pending = {'bandwidth': int(attrs.get('BANDWIDTH', 0) or 0), 'height': height}
+        elif line and not line.startswith('#') and pending is not None:
+            pending['uri'] = urljoin(base_url, line)
+            variants.append(pending)
+            pending = None
+    return variants
+
+
+def parse_media_playlist(text: str, base_url: str) -> List[Dict[str, Any]]:
+    """解析 media 播放列表，返回分片列表
+    
+    每个分片: {'uri', 'sequence', 'key': {'method', 'uri', 'iv'} 或 None, 'range': (length, offset) 或 None}
+    EXT-X-MAP 指定的初始化分片作为第一个分片返回。
+    """
+    if not text.lstrip().startswith('#EXTM3U'):
+        raise HLSError("不是有效的 m3u8 播放列表")
+    
+    segments = []
+    sequence = 0
+    key = None
+    byte_range = None
+    next_offset = 0
+    
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith('#EXT-X-MEDIA-SEQUENCE:'):
+            sequence = int(line.split(':', 1)[1])
+        elif line.startswith('#EXT-X-KEY:'):
+            attrs = parse_attributes(line.split(':', 1)[1])
+            method = attrs.get('METHOD', 'NONE')
+            if method == 'NONE':
+                key = None
+            elif method == 'AES-128':
+                key = {'method': method, 'uri': urljoin(base_url, attrs.get('URI', '')), 'iv': attrs.get('IV')}
+            else:
+                raise HLSError(f"不支持的加密方式: {method}")
+        elif line.startswith('#EXT-X-MAP:'):
+            attrs = parse_attributes(line.split(':', 1)[1])
+            if not any(s.get('init') for s in segments):
+                segments.append({'uri': urljoin(base_url, attrs['URI']), 'sequence': None,
+                                 'key': None, 'range': None, 'init': True})
+        elif line.startswith('#EXT-X-BYTERANGE:'):
+            length, _, offset = line.split(':', 1)[1].partition('@')
+            offset = int(offset) if offset else next_offset
+            byte_range = (int(length), offset)
+            next_offset = offset + int(length)
+        elif not line.startswith('#'):
+            segments.append({'uri': urljoin(base_url, line), 'sequence': sequence,
+                             'key': key, 'range': byte_range})
+            sequence += 1
+            byte_range = None
+    
+    if not any(not s.get('init') for s in segments):
+        raise HLSError("播放列表中没有分片")
+    return segments
+
+
+def select_variant(variants: List[Dict[str, Any]], quality: str) -> Dict[str, Any]:
+    """按画质配置选择码率：best/worst，或 1080p 等（不超过该高度的最高码率）"""
+    ordered = sorted(variants, key=lambda v: (v['height'], v['bandwidth']))
+    if quality == 'worst':
+        return ordered[0]
+    if quality.endswith('p') and quality[:-1].isdigit():
+        limit = int(quality[:-1])
+        fitting = [v for v in ordered if v['height'] and v['height'] <= limit]
+        if fitting:
+            return fitting[-1]
+        return ordered[0]
+    return ordered[-1]
+
+
+class HLSJob:
+    """单个 HLS 下载任务（状态持久化到 data/hls/<id>.json）"""
+    
+    def __init__(self, job_id: str, url: str, title: str, output: str, created_at: Optional[float] = None):
+        self.id = job_id
+        self.url = url
+        self.title = title
+        self.output = output  # 合并后的文件路径（不含扩展名）
+        self.created_at = created_at or time.time()
+        self.status = 'pending'
+        self.error: Optional[str] = None
+        self.segments: List[Dict[str, Any]] = []
+        self.bitmap = bytearray()  # 每个分片一个字节，1 表示已下载
+        self.result_file: Optional[str] = None
+        
+        self.task: Optional[asyncio.Task] = None
+        self._samples: deque = deque(maxlen=50)  # (时间, 字节数)，用于计算速度
+        self._bytes_done = 0  # 本次运行下载的字节数和分片数
+        self._segments_done = 0
+        self._saved_at = 0.0
+    
+    @property
+    def parts_dir(self) -> str:
+        return f"{self.output}.parts"
+    
+    @property
+    def state_path(self) -> str:
+        return os.path.join(STATE_DIR, f"{self.id}.json")
+    
+    @property
+    def bitmap_path(self) -> str:
+        return os.path.join(STATE_DIR, f"{self.id}.bitmap")
+    
+    def segment_path(self, index: int) -> str:
+        return os.path.join(self.parts_dir, f"{index:06d}.seg")
+    
+    @property
+    def done_count(self) -> int:
+        return sum(self.bitmap)
+    
+    @property
+    def progress(self) -> float:
+        if self.status == 'completed':
+            return 100.0
+        if not self.segments:
+            return 0.0
+        return self.done_count * 100.0 / len(self.segments)
+    
+    def record_bytes(self, size: int):
+        self._bytes_done += size
+        self._segments_done += 1
+        self._samples.append((time.monotonic(), self._bytes_done))
+    
+    def speed(self) -> float:
+        """最近 10 秒的平均下载速度（字节/秒）"""
+        now = time.monotonic()
+        while self._samples and now - self._samples[0][0] > 10:
+            self._samples.popleft()
+        if self.status != 'downloading' or len(self._samples) < 2:
+            return 0.0
+        (t0, b0), (t1, b1) = self._samples[0], self._samples[-1]
+        return (b1 - b0) / (now - t0) if now > t0 else 0.0
+    
+    def eta(self) -> Optional[float]:
+        """按已下载分片的平均大小估算剩余时间（秒）"""
+        speed = self.speed()
+        if not speed or not self._segments_done:
+            return None
+        remaining = len(self.segments) - self.done_count
+        return remaining * (self._bytes_done / self._segments_done) / speed
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'id': self.id,
+            'url': self.url,
+            'title': self.title,
+            'output': self.output,
+            'created_at': self.created_at,
+            'status': self.status,
+            'error': self.error,
+            'segments': self.segments,
+            'result_file': self.result_file
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'HLSJob':
+        job = cls(data['id'], data['url'], data['title'], data['output'], data.get('created_at'))
+        job.status = data.get('status', 'pending')
+        job.error = data.get('error')
+        job.segments = data.get('segments') or []
+        job.result_file = data.get('result_file')
+        job.bitmap = bytearray(len(job.segments))
+        try:
+            with open(job.bitmap_path, 'rb') as f:
+                saved = f.read()
+            if len(saved) == len(job.segments):
+                job.bitmap = bytearray(saved)
+        except FileNotFoundError:
+            pass
+        return job
+    
+    @staticmethod
+    def _write_atomic(path: str, data: bytes):
+        """先写临时文件再替换，避免中断时损坏"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    
+    def save(self):
+        """写入任务状态文件（分片列表等，只在状态变化时写入）和分片位图"""
+        os.makedirs(STATE_DIR, exist_ok=True)
+        self._write_atomic(self.state_path, json.dumps(self.to_dict(), ensure_ascii=False).encode('utf-8'))
+        self.save_bitmap()
+    
+    def save_bitmap(self, force: bool = True):
+        """写入分片位图；force=False 时每秒最多写一次"""
+        now = time.monotonic()
+        if not force and now - self._saved_at < 1.0:
+            return
+        self._saved_at = now
+        self._write_atomic(self.bitmap_path, bytes(self.bitmap))
+    
+    def remove_state(self):
+        for path in (self.state_path, self.bitmap_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+class HLSDownloadPlugin(DownloadPlugin):
+
+    def __init__(self):
+        super().__init__()
+        self._client: Optional[httpx.AsyncClient] = None
+        self._jobs: Dict[str, HLSJob] = {}
+        self._host_limits: Dict[str, asyncio.Semaphore] = {}
+        self._keys: Dict[str, bytes] = {}  # 密钥URI -> 密钥
+        self._key_lock = asyncio.Lock()  # 并发的分片只下载一次同一个密钥
+        self._resumed = False
+    
+    @property
+    def name(self) -> str:
+        return "hls"
+    
+    @property
+    def version(self) -> str:
+        return "1.0.0"
+    
+    @property
+    def description(self) -> str:
+        return "内置 HLS 下载器，并发下载 m3u8 分片，支持 AES-128 解密和断点续传"
+    
+    @property
+    def supported_protocols(self) -> List[str]:
+        return ["m3u8"]
+    
+    def get_url_priority(self, url: str) -> int:
+        """m3u8 链接优先使用内置下载器（多分片并发），而不是 Metube"""
+        return 10 if ".m3u8" in url else 0
+    
+    def get_config_schema(self) -> List[ConfigField]:
+        return [
+            ConfigField(
+                name="download_path",
+                label="下载路径",
+                type="text",
+                default="/downloads",
+                required=True
+            ),
+            ConfigField(
+                name="default_quality",
+                label="默认画质",
+                type="select",
+                options=["best", "1080p", "720p", "480p", "worst"],
+                default="best",
+                description="master 播放列表包含多个码率时的选择方式"
+            ),
+            ConfigField(
+                name="concurrency",
+                label="单任务并发分片数",
+                type="number",
+                default=8
+            ),
+            ConfigField(
+                name="per_host_connections",
+                label="每个主机最大连接数",
+                type="number",
+                default=8,
+                description="所有任务共享，避免对同一 CDN 发起过多连接"
+            ),
+            ConfigField(
+                name="retries",
+                label="分片重试次数",
+                type="number",
+                default=3
+            ),
+            ConfigField(
+                name="output_format",
+                label="输出格式",
+                type="select",
+                options=["ts", "mp4"],
+                default="ts",
+                description="mp4 需要系统安装 ffmpeg，转换失败时保留 .ts 文件"
+            )
+        ] + self._scheduling_config_fields()
+    
+    def get_web_ui_url(self) -> str:
+        return ""
+    
+    def _get_client(self) -> httpx.AsyncClient:
+        """获取共享的 httpx 客户端（连接池复用）"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=30.0,
+                follow_redirects=True,
+                headers=DEFAULT_HEADERS,
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=40)
+            )
+        return self._client
+    
+    def _host_limit(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        semaphore = self._host_limits.get(host)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self._get_config_int('per_host_connections', 8))
+            self._host_limits[host] = semaphore
+        return semaphore
+    
+    async def _fetch(self, url: str, headers: Optional[Dict[str, str]] = None) -> bytes:
+        """下载一个资源（受每主机连接数限制，失败按指数退避重试）"""
+        retries = self._get_config_int('retries', 3)
+        for attempt in range(retries + 1):
+            try:
+                async with self._host_limit(url):
+                    response = await self._get_client().get(url, headers=headers)
+                    response.raise_for_status()
+                    return response.content
+            except httpx.HTTPError as e:
+                if attempt >= retries:
+                    raise HLSError(f"下载失败: {url} - {e}") from e
+                await asyncio.sleep(2 ** attempt)
+    
+    # ---- 任务管理 ----
+    
+    def _ensure_resumed(self):
+        """首次使用时加载状态文件，并恢复未完成的任务"""
+        if self._resumed:
+            return
+        self._resumed = True
+        if not os.path.isdir(STATE_DIR):
+            return
+        
+        resumed = 0
+        for filename in os.listdir(STATE_DIR):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(STATE_DIR, filename), encoding='utf-8') as f:
+                    job = HLSJob.from_dict(json.load(f))
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"[HLS] 读取任务状态失败: {filename} - {e}")
+                continue
+            self._jobs[job.id] = job
+            if job.status in ('pending', 'downloading'):
+                self._start(job)
+                resumed += 1
+        if resumed:
+            logger.info(f"[HLS] 恢复 {resumed} 个未完成的下载任务")
+    
+    def _start(self, job: HLSJob):
+        job.task = asyncio.create_task(self._run(job))
+    
+    async def download(self, task: DownloadTask) -> bool:
+        self._ensure_resumed()
+        
+        from database import get_async_database
+        db = get_async_database()
+        
+        logger.info(f"[HLS] 开始下载任务: {task.title}")
+        logger.debug(f"[HLS] URL: {task.url}")
+        
+        # 失败的任务重新提交时复用已下载的分片
+        job = self._jobs.get(task.id)
+        if job is None:
+            save_dir = task.save_path or self.config.get('download_path', '/downloads')
+            safe_title = "".join(c for c in task.title if c.isalnum() or c in (' ', '-', '_', '.')).strip()
+            output = os.path.join(save_dir, safe_title or task.id)
+            if any(j.output == output for j in self._jobs.values() if j.id != task.id):
+                output = f"{output}_{task.id[:8]}"
+            
+            job = HLSJob(task.id, task.url, task.title, output)
+            try:
+                job.save()
+            except OSError as e:
+                logger.error(f"[HLS] 保存任务状态失败: {e}")
+                await db.update_task(task.id, {'status': 'failed'})
+                return False
+            self._jobs[job.id] = job
+        
+        if job.status != 'completed' and (job.task is None or job.task.done()):
+            self._start(job)
+        
+        metadata = task.metadata.copy() if task.metadata else {}
+        metadata['platform_id'] = job.id
+        await db.update_task(task.id, {
+            'status': 'downloading',
+            'metadata': metadata,
+            'platform_id': self.get_platform_id(metadata)
+        })
+        return True
+    
+    async def _run(self, job: HLSJob):
+        try:
+            if not job.segments:
+                job.segments = await self._load_playlist(job.url)
+                job.bitmap = bytearray(len(job.segments))
+            
+            job.status = 'downloading'
+            job.error = None
+            job.save()
+            os.makedirs(job.parts_dir, exist_ok=True)
+            
+            # 状态文件中已完成但分片文件丢失的，重新下载
+            for index in range(len(job.segments)):
+                if job.bitmap[index] and not os.path.exists(job.segment_path(index)):
+                    job.bitmap[index] = 0
+            
+            missing = [i for i in range(len(job.segments)) if not job.bitmap[i]]
+            logger.info(f"[HLS] {job.title}: 共 {len(job.segments)} 个分片，待下载 {len(missing)} 个")
+            
+            queue: asyncio.Queue = asyncio.Queue()
+            for index in missing:
+                queue.put_nowait(index)
+            
+            workers = [
+                asyncio.create_task(self._segment_worker(job, queue))
+                for _ in range(max(1, min(self._get_config_int('concurrency', 8), len(missing))))
+            ]
+            try:
+                await asyncio.gather(*workers)
+            finally:
+                # 一个分片失败时取消其余的下载，等待它们退出后再处理错误，避免之后仍在写入分片和位图
+                for worker in workers:
+                    worker.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+            
+            job.save_bitmap()
+            job.result_file = await self._merge(job)
+            job.status = 'completed'
+            job.segments = []
+            job.bitmap = bytearray()
+            job.save()
+            logger.info(f"[HLS] ✓ 下载完成: {job.result_file}")
+        
+        except asyncio.CancelledError:
+            if job.status == 'downloading':
+                job.save_bitmap()
+            raise
+        except Exception as e:
+            job.status = 'failed'
+            job.error = str(e)
+            job.save()
+            logger.error(f"[HLS] ✗ 下载失败: {job.title} - {e}")
+    
+    async def _load_playlist(self, url: str) -> List[Dict[str, Any]]:
+        """获取播放列表；master 列表按画质配置选择码率后再获取 media 列表"""
+        text = (await self._fetch(url)).decode('utf-8', errors='replace')
+        variants = parse_master_playlist(text, url)
+        if variants:
+            variant = select_variant(variants, self.config.get('default_quality', 'best'))
+            logger.info(f"[HLS] 选择码率: {variant['height']}p, {variant['bandwidth']} bps")
+            url = variant['uri']
+            text = (await self._fetch(url)).decode('utf-8', errors='replace')
+        return parse_media_playlist(text, url)
+    
+    async def _segment_worker(self, job: HLSJob, queue: asyncio.Queue):
+        while not queue.empty():
+            index = queue.get_nowait()
+            data = await self._fetch_segment(job.segments[index])
+            
+            path = job.segment_path(index)
+            await asyncio.to_thread(HLSJob._write_atomic, path, data)
+            
+            job.bitmap[index] = 1
+            job.record_bytes(len(data))
+            job.save_bitmap(force=False)
+    
+    async def _fetch_segment(self, segment: Dict[str, Any]) -> bytes:
+        headers = None
+        if segment.get('range'):
+            length, offset = segment['range']
+            headers = {'Range': f"bytes={offset}-{offset + length - 1}"}
+        data = await self._fetch(segment['uri'], headers)
+        
+        key = segment.get('key')
+        if key:
+            data = await self._decrypt(data, key, segment['sequence'])
+        return data
+    
+    async def _decrypt(self, data: bytes, key_info: Dict[str, Any], sequence: int) -> bytes:
+        """AES-128-CBC 解密；未指定 IV 时使用分片序号"""
+        if Cipher is None:
+            raise HLSError("加密的 HLS 流需要安装 cryptography（见 hls_requirements.txt）")
+        
+        key = self._keys.get(key_info['uri'])
+        if key is None:
+            async with self._key_lock:
+                key = self._keys.get(key_info['uri'])
+                if key is None:
+                    key = await self._fetch(key_info['uri'])
+                    if len(key) != 16:
+                        raise HLSError(f"无效的 AES-128 密钥长度: {len(key)}")
+                    self._keys[key_info['uri']] = key
+        
+        if key_info.get('iv'):
+            iv = bytes.fromhex(key_info['iv'][2:] if key_info['iv'].lower().startswith('0x') else key_info['iv'])
+        else:
+            iv = sequence.to_bytes(16, 'big')
+        
+        decryptor = Cipher(algorithms.AES(key), modes.CBC(iv)).decryptor()
+        plain = decryptor.update(data) + decryptor.finalize()
+        # 去除 PKCS7 填充
+        pad = plain[-1] if plain else 0
+        if 0 < pad <= 16 and plain.endswith(bytes([pad]) * pad):
+            plain = plain[:-pad]
+        return plain
+    
+    async def _merge(self, job: HLSJob) -> str:
+        """按顺序把分片流式写入输出文件，完成后删除分片目录；需要时用 ffmpeg 转为 mp4"""
+        ts_file = f"{job.output}.ts"
+        await asyncio.to_thread(self._concat, job, ts_file)
+        
+        if self.config.get('output_format', 'ts') != 'mp4':
+            return ts_file
+        
+        if not shutil.which('ffmpeg'):
+            logger.warning("[HLS] 未找到 ffmpeg，保留 .ts 文件")
+            return ts_file
+        
+        mp4_file = f"{job.output}.mp4"
+        process = await asyncio.create_subprocess_exec(
+            'ffmpeg', '-y', '-loglevel', 'error', '-i', ts_file, '-c', 'copy', mp4_file,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE
+        )
+        _, stderr = await process.communicate()
+        if process.returncode != 0:
+            logger.warning(f"[HLS] ffmpeg 转换失败，保留 .ts 文件: {stderr.decode(errors='replace')[:200]}")
+            return ts_file
+        
+        os.remove(ts_file)
+        return mp4_file
+    
+    @staticmethod
+    def _concat(job: HLSJob, target: str):
+        tmp_path = f"{target}.tmp"
+        with open(tmp_path, 'wb') as out:
+            for index in range(len(job.segments)):
+                with open(job.segment_path(index), 'rb') as part:
+                    shutil.copyfileobj(part, out, 1024 * 1024)
+        os.replace(tmp_path, target)
+        shutil.rmtree(job.parts_dir, ignore_errors=True)
+    
+    # ---- 查询与取消 ----
+    
+    async def get_progress(self, platform_id: str) -> dict:
+        """获取下载进度和状态
+        
+        Returns:
+            dict: {'progress': float, 'status': str, 'error': str, 'speed': str, 'eta': str}
+        """
+        self._ensure_resumed()
+        
+        job = self._jobs.get(platform_id)
+        if job is None:
+            return {
+                'progress': 0.0,
+                'status': 'unknown',
+                'error': 'Task not found',
+                'speed': '',
+                'eta': ''
+            }
+        
+        status = job.status if job.status in ('pending', 'downloading', 'completed', 'failed') else 'unknown'
+        return {
+            'progress': job.progress,
+            'status': status,
+            'error': job.error,
+            'speed': self._format_speed(job.speed()),
+            'eta': self._format_eta(job.eta())
+        }
+    
+    async def cancel(self, platform_id: str) -> bool:
+        """取消任务并删除分片和状态文件（已完成任务只删除记录，保留下载的文件）"""
+        self._ensure_resumed()
+        
+        job = self._jobs.pop(platform_id, None)
+        if job is None:
+            logger.warning(f"[HLS] 任务不存在，无法取消: {platform_id}")
+            return False
+        
+        logger.info(f"[HLS] 取消任务: {job.title}")
+        job.status = 'canceled'
+        if job.task and not job.task.done():
+            job.task.cancel()
+            await asyncio.gather(job.task, return_exceptions=True)
+        
+        shutil.rmtree(job.parts_dir, ignore_errors=True)
+        job.remove_state()
+        return True
+    
+    async def get_downloads(self) -> List[Dict[str, Any]]:
+        """获取所有下载记录"""
+        self._ensure_resumed()
+        
+        downloads = []
+        for job in self._jobs.values():
+            speed = job.speed()
+            eta = job.eta()
+            downloads.append({
+                'id': job.id,
+                'platform': self.name,
+                'title': job.title,
+                'url': job.url,
+                'status': job.status,
+                'progress': round(job.progress, 1),
+                'speed': self._format_speed(speed),
+                'eta': self._format_eta(eta),
+                'speed_bps': speed,
+                'eta_seconds': eta,
+                'created_at': job.created_at,
+                'error': job.error,
+                'file': job.result_file
+            })
+        return downloads
@@ -0,0 +1,627 @@
+"""
+HTTP 多连接下载插件
+直接下载 mp4/mkv 等文件链接：探测服务器是否支持 Range 请求，支持时把文件切分为多个块，
+通过连接池并发下载并按偏移写入预分配的文件；块完成情况持久化，服务重启后断点续传，
+完成后校验文件长度。不支持 Range 的服务器退化为单连接下载。
+"""
+from typing import List, Optional, Dict, Any, Tuple
+from urllib.parse import urlsplit, unquote
+from collections import deque
+from base_plugin import DownloadPlugin
+from models import ConfigField, DownloadTask
+from logger import get_logger
+import httpx
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+
+logger = get_logger(__name__)
+
+# 任务状态文件目录（与数据库同在 data 目录下）
+STATE_DIR = os.path.join("data", "http")
+
+# 直接下载的媒体/文件扩展名，这类链接优先使用本插件
+DIRECT_EXTENSIONS = (
+    '.mp4', '.mkv', '.avi', '.mov', '.webm', '.flv', '.m4v', '.wmv', '.ts',
+    '.mp3', '.m4a', '.flac', '.zip', '.rar', '.7z', '.iso'
+)
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+                  '(KHTML, like Gecko) Chrome/120.0 Safari/537.36'
+}
+
+
+class HTTPDownloadError(Exception):
+    """HTTP 下载错误"""
+    pass
+
+
+def _pwrite(fd: int, data: bytes, offset: int, lock: threading.Lock):
+    """按偏移写入文件（不支持 os.pwrite 的平台用锁保护 seek + write）"""
+    if hasattr(os, 'pwrite'):
+        while data:
+            written = os.pwrite(fd, data, offset)
+            data = data[written:]
+            offset += written
+        return
+    with lock:
+        os.lseek(fd, offset, os.SEEK_SET)
+        while data:
+            written = os.write(fd, data)
+            data = data[written:]
+
+
+class HTTPJob:
+    """单个 HTTP 下载任务（状态持久化到 data/http/<id>.json，块位图在 <id>.chunks）"""
+    
+    def __init__(self, job_id: str, url: str, title: str, save_dir: str, created_at: Optional[float] = None):
+        self.id = job_id
+        self.url = url
+        self.title = title
+        self.save_dir = save_dir
+        self.created_at = created_at or time.time()
+        self.status = 'pending'
+        self.error: Optional[str] = None
+        self.filename: Optional[str] = None
+        self.total_size: Optional[int] = None
+        self.ranges = False  # 服务器是否支持 Range
+        self.etag: Optional[str] = None
+        self.last_modified: Optional[str] = None
+        self.chunk_size = 0
+        self.chunks = bytearray()  # 每块一个字节，1 表示已下载
+        
+        self.task: Optional[asyncio.Task] = None
+        self.bytes_written = 0  # 单连接模式下已写入的字节数
+        self.write_lock = threading.Lock()
+        self._samples: deque = deque(maxlen=100)
+        self._bytes_done = 0
+        self._chunk_bytes: Dict[int, int] = {}  # 正在下载的块本次已接收的字节数
+        self._saved_at = 0.0
+    
+    @property
+    def state_path(self) -> str:
+        return os.path.join(STATE_DIR, f"{self.id}.json")
+    
+    @property
+    def chunks_path(self) -> str:
+        return os.path.join(STATE_DIR, f"{self.id}.chunks")
+    
+    @property
+    def target(self) -> str:
+        return os.path.join(self.save_dir, self.filename or self.id)
+    
+    @property
+    def part_path(self) -> str:
+        return f"{self.target}.part"
+    
+    def chunk_range(self, index: int) -> Tuple[int, int]:
+        """第 index 块的字节范围 [start, end]"""
+        start = index * self.chunk_size
+        return start, min(self.total_size, start + self.chunk_size) - 1
+    
+    @property
+    def downloaded(self) -> int:
+        if self.status == 'completed':
+            return self.total_size or 0
+        if not self.ranges:
+            return self.bytes_written
+        done = 0
+        for index, flag in enumerate(self.chunks):
+            if flag:
+                start, end = self.chunk_range(index)
+                done += end - start + 1
+        return done
+    
+    @property
+    def progress(self) -> float:
+        if self.status == 'completed':
+            return 100.0
+        if not self.total_size:
+            return 0.0
+        return min(100.0, self.downloaded * 100.0 / self.total_size)
+    
+    def record_bytes(self, size: int, index: Optional[int] = None):
+        self._bytes_done += size
+        self._samples.append((time.monotonic(), self._bytes_done))
+        if index is not None:
+            self._chunk_bytes[index] = self._chunk_bytes.get(index, 0) + size
+    
+    def mark_chunk_done(self, index: int):
+        self.chunks[index] = 1
+        self._chunk_bytes.pop(index, None)
+    
+    def reset_chunk(self, index: int):
+        """块下载失败重试前扣除已计入速度的字节，重试时不重复计算"""
+        size = self._chunk_bytes.pop(index, 0)
+        if size:
+            self.record_bytes(-size)
+    
+    def speed(self) -> float:
+        """最近 10 秒的平均下载速度（字节/秒）"""
+        now = time.monotonic()
+        while self._samples and now - self._samples[0][0] > 10:
+            self._samples.popleft()
+        if self.status != 'downloading' or len(self._samples) < 2:
+            return 0.0
+        (t0, b0), (_, b1) = self._samples[0], self._samples[-1]
+        return max(0.0, (b1 - b0) / (now - t0)) if now > t0 else 0.0
+    
+    def eta(self) -> Optional[float]:
+        speed = self.speed()
+        if not speed or not self.total_size:
+            return None
+        return (self.total_size - self.downloaded) / speed
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'id': self.id,
+            'url': self.url,
+            'title': self.title,
+            'save_dir': self.save_dir,
+            'created_at': self.created_at,
+            'status': self.status,
+            'error': self.error,
+            'filename': self.filename,
+            'total_size': self.total_size,
+            'ranges': self.ranges,
+            'etag': self.etag,
+            'last_modified': self.last_modified,
+            'chunk_size': self.chunk_size
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'HTTPJob':
+        job = cls(data['id'], data['url'], data['title'], data['save_dir'], data.get('created_at'))
+        for key in ('status', 'error', 'filename', 'total_size', 'ranges', 'etag', 'last_modified', 'chunk_size'):
+            if key in data:
+                setattr(job, key, data[key])
+        try:
+            with open(job.chunks_path, 'rb') as f:
+                job.chunks = bytearray(f.read())
+        except FileNotFoundError:
+            pass
+        return job
+    
+    @staticmethod
+    def _write_atomic(path: str, data: bytes):
+        """先写临时文件再替换，避免中断时损坏"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    
+    def save(self):
+        """写入任务状态文件（只在状态变化时写入）和块位图"""
+        os.makedirs(STATE_DIR, exist_ok=True)
+        self._write_atomic(self.state_path, json.dumps(self.to_dict(), ensure_ascii=False).encode('utf-8'))
+        self.save_chunks()
+    
+    def save_chunks(self, force: bool = True):
+        """写入块位图；force=False 时每秒最多写一次"""
+        now = time.monotonic()
+        if not force and now - self._saved_at < 1.0:
+            return
+        self._saved_at = now
+        self._write_atomic(self.chunks_path, bytes(self.chunks))
+    
+    def remove_state(self):
+        for path in (self.state_path, self.chunks_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+class HTTPDownloadPlugin(DownloadPlugin):
+
+    def __init__(self):
+        super().__init__()
+        self._client: Optional[httpx.AsyncClient] = None
+        self._jobs: Dict[str, HTTPJob] = {}
+        self._resumed = False
+    
+    @property
+    def name(self) -> str:
+        return "http"
+    
+    @property
+    def version(self) -> str:
+        return "1.0.0"
+    
+    @property
+    def description(self) -> str:
+        return "内置 HTTP 多连接下载器，适用于 mp4/mkv 等直接文件链接，支持断点续传"
+    
+    @property
+    def supported_protocols(self) -> List[str]:
+        return ["http", "https"]
+    
+    def get_url_priority(self, url: str) -> int:
+        """直接文件链接优先于 Metube 等通用下载器，其他网页链接排在最后"""
+        path = urlsplit(url).path.lower()
+        return 10 if path.endswith(DIRECT_EXTENSIONS) else -10
+    
+    def get_config_schema(self) -> List[ConfigField]:
+        return [
+            ConfigField(
+                name="download_path",
+                label="下载路径",
+                type="text",
+                default="/downloads",
+                required=True
+            ),
+            ConfigField(
+                name="connections",
+                label="单任务连接数",
+                type="number",
+                default=4,
+                description="服务器支持 Range 时同时下载的块数"
+            ),
+            ConfigField(
+                name="chunk_size_mb",
+                label="分块大小（MB）",
+                type="number",
+                default=8,
+                description="断点续传的最小单位，未完成的块重启后重新下载"
+            ),
+            ConfigField(
+                name="retries",
+                label="重试次数",
+                type="number",
+                default=3
+            )
+        ] + self._scheduling_config_fields()
+    
+    def get_web_ui_url(self) -> str:
+        return ""
+    
+    def _get_client(self) -> httpx.AsyncClient:
+        """获取共享的 httpx 客户端（连接池复用）"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(30.0, connect=10.0),
+                follow_redirects=True,
+                headers=DEFAULT_HEADERS,
+                limits=httpx.Limits(max_connections=64, max_keepalive_connections=32)
+            )
+        return self._client
+    
+    # ---- 任务管理 ----
+    
+    def _ensure_resumed(self):
+        """首次使用时加载状态文件，并恢复未完成的任务"""
+        if self._resumed:
+            return
+        self._resumed = True
+        if not os.path.isdir(STATE_DIR):
+            return
+        
+        resumed = 0
+        for filename in os.listdir(STATE_DIR):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(STATE_DIR, filename), encoding='utf-8') as f:
+                    job = HTTPJob.from_dict(json.load(f))
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"[HTTP] 读取任务状态失败: {filename} - {e}")
+                continue
+            self._jobs[job.id] = job
+            if job.status in ('pending', 'downloading'):
+                self._start(job)
+                resumed += 1
+        if resumed:
+            logger.info(f"[HTTP] 恢复 {resumed} 个未完成的下载任务")
+    
+    def _start(self, job: HTTPJob):
+        job.task = asyncio.create_task(self._run(job))
+    
+    async def download(self, task: DownloadTask) -> bool:
+        self._ensure_resumed()
+        
+        from database import get_async_database
+        db = get_async_database()
+        
+        logger.info(f"[HTTP] 开始下载任务: {task.title}")
+        logger.debug(f"[HTTP] URL: {task.url}")
+        
+        # 失败的任务重新提交时复用已下载的块
+        job = self._jobs.get(task.id)
+        if job is None:
+            save_dir = task.save_path or self.config.get('download_path', '/downloads')
+            job = HTTPJob(task.id, task.url, task.title, save_dir)
+            try:
+                job.save()
+            except OSError as e:
+                logger.error(f"[HTTP] 保存任务状态失败: {e}")
+                await db.update_task(task.id, {'status': 'failed'})
+                return False
+            self._jobs[job.id] = job
+        
+        if job.status != 'completed' and (job.task is None or job.task.done()):
+            self._start(job)
+        
+        metadata = task.metadata.copy() if task.metadata else {}
+        metadata['platform_id'] = job.id
+        await db.update_task(task.id, {
+            'status': 'downloading',
+            'metadata': metadata,
+            'platform_id': self.get_platform_id(metadata)
+        })
+        return True
+    
+    async def _run(self, job: HTTPJob):
+        try:
+            await self._prepare(job)
+            job.status = 'downloading'
+            job.error = None
+            job.save()
+            
+            if job.ranges:
+                await self._download_ranges(job)
+            else:
+                await self._download_single(job)
+            
+            # 校验文件长度后改为正式文件名
+            size = os.path.getsize(job.part_path)
+            if job.total_size is not None and size != job.total_size:
+                raise HTTPDownloadError(f"文件长度不符: 期望 {job.total_size}, 实际 {size}")
+            os.replace(job.part_path, job.target)
+            
+            job.status = 'completed'
+            job.total_size = size
+            job.chunks = bytearray()
+            job.save()
+            logger.info(f"[HTTP] ✓ 下载完成: {job.target}")
+        
+        except asyncio.CancelledError:
+            if job.status == 'downloading':
+                job.save_chunks()
+            raise
+        except Exception as e:
+            job.status = 'failed'
+            job.error = str(e)
+            job.save()
+            logger.error(f"[HTTP] ✗ 下载失败: {job.title} - {e}")
+    
+    async def _probe(self, url: str) -> httpx.Response:
+        """用 Range: bytes=0-0 探测文件大小和 Range 支持（只读取响应头）"""
+        request = self._get_client().build_request('GET', url, headers={'Range': 'bytes=0-0'})
+        response = await self._get_client().send(request, stream=True)
+        await response.aclose()
+        response.raise_for_status()
+        return response
+    
+    async def _prepare(self, job: HTTPJob):
+        """探测文件信息；续传时文件在服务器上发生变化则从头下载"""
+        response = await self._probe(job.url)
+        headers = response.headers
+        
+        ranges = response.status_code == 206
+        if ranges:
+            total = headers.get('content-range', '').rpartition('/')[2]
+            total_size = int(total) if total.isdigit() else None
+            ranges = total_size is not None
+        else:
+            length = headers.get('content-length')
+            total_size = int(length) if length and length.isdigit() else None
+        
+        etag = headers.get('etag')
+        last_modified = headers.get('last-modified')
+        
+        if job.filename:
+            changed = (job.total_size != total_size or job.etag != etag
+                       or job.last_modified != last_modified or job.ranges != ranges)
+            if not changed and ranges and os.path.exists(job.part_path):
+                return
+            logger.info(f"[HTTP] 服务器文件已变化或不支持续传，重新下载: {job.title}")
+        
+        job.filename = self._choose_filename(job, response)
+        job.total_size = total_size
+        job.ranges = ranges
+        job.etag = etag
+        job.last_modified = last_modified
+        
+        if ranges:
+            chunk_size = max(1, self._get_config_int('chunk_size_mb', 8)) * 1024 * 1024
+            job.chunk_size = chunk_size
+            job.chunks = bytearray((total_size + chunk_size - 1) // chunk_size)
+        else:
+            job.chunk_size = 0
+            job.chunks = bytearray()
+        
+        os.makedirs(job.save_dir, exist_ok=True)
+        await asyncio.to_thread(self._preallocate, job.part_path, total_size if ranges else 0)
+        logger.info(f"[HTTP] {job.filename}: 大小 {total_size}, Range {'支持' if ranges else '不支持'}")
+    
+    @staticmethod
+    def _preallocate(path: str, size: int):
+        with open(path, 'wb') as f:
+            if size:
+                if hasattr(os, 'posix_fallocate'):
+                    try:
+                        os.posix_fallocate(f.fileno(), 0, size)
+                        return
+                    except OSError:
+                        pass
+                f.truncate(size)
+    
+    def _choose_filename(self, job: HTTPJob, response: httpx.Response) -> str:
+        """文件名：任务标题 + 服务器文件名（Content-Disposition 或 URL 路径）的扩展名"""
+        remote = ''
+        disposition = response.headers.get('content-disposition', '')
+        match = re.search(r"filename\*=UTF-8''([^;]+)", disposition, re.IGNORECASE) or \
+            re.search(r'filename="?([^";]+)"?', disposition, re.IGNORECASE)
+        if match:
+            remote = unquote(match.group(1))
+        if not remote:
+            remote = unquote(os.path.basename(urlsplit(str(response.url)).path))
+        remote = os.path.basename(remote)
+        
+        ext = os.path.splitext(remote)[1]
+        safe_title = "".join(c for c in job.title if c.isalnum() or c in (' ', '-', '_', '.')).strip()
+        filename = f"{safe_title}{ext}" if safe_title else (remote or job.id)
+        
+        if any(j.filename == filename and j.save_dir == job.save_dir
+               for j in self._jobs.values() if j.id != job.id):
+            base, ext = os.path.splitext(filename)
+            filename = f"{base}_{job.id[:8]}{ext}"
+        return filename
+    
+    async def _download_ranges(self, job: HTTPJob):
+        """多连接按块下载，按偏移写入预分配的文件"""
+        missing = [i for i, done in enumerate(job.chunks) if not done]
+        logger.info(f"[HTTP] {job.filename}: 共 {len(job.chunks)} 块，待下载 {len(missing)} 块")
+        
+        queue: asyncio.Queue = asyncio.Queue()
+        for index in missing:
+            queue.put_nowait(index)
+        
+        fd = os.open(job.part_path, os.O_WRONLY | getattr(os, 'O_BINARY', 0))
+        try:
+            connections = max(1, min(self._get_config_int('connections', 4), len(missing)))
+            workers = [asyncio.create_task(self._chunk_worker(job, queue, fd)) for _ in range(connections)]
+            try:
+                await asyncio.gather(*workers)
+            finally:
+                for worker in workers:
+                    worker.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+        finally:
+            os.close(fd)
+        job.save_chunks()
+    
+    async def _chunk_worker(self, job: HTTPJob, queue: asyncio.Queue, fd: int):
+        retries = self._get_config_int('retries', 3)
+        while not queue.empty():
+            index = queue.get_nowait()
+            for attempt in range(retries + 1):
+                try:
+                    await self._fetch_chunk(job, index, fd)
+                    break
+                except (httpx.HTTPError, HTTPDownloadError) as e:
+                    job.reset_chunk(index)
+                    if attempt >= retries:
+                        raise HTTPDownloadError(f"下载第 {index} 块失败: {e}") from e
+                    logger.debug(f"[HTTP] 第 {index} 块下载失败，重试: {e}")
+                    await asyncio.sleep(2 ** attempt)
+            job.mark_chunk_done(index)
+            job.save_chunks(force=False)
+    
+    async def _fetch_chunk(self, job: HTTPJob, index: int, fd: int):
+        start, end = job.chunk_range(index)
+        headers = {'Range': f"bytes={start}-{end}"}
+        if job.etag:
+            headers['If-Range'] = job.etag
+        
+        async with self._get_client().stream('GET', job.url, headers=headers) as response:
+            if response.status_code != 206:
+                raise HTTPDownloadError(f"服务器未返回分块内容: HTTP {response.status_code}")
+            
+            offset = start
+            buffer = bytearray()
+            async for data in response.aiter_bytes():
+                buffer += data
+                job.record_bytes(len(data), index)
+                if len(buffer) >= 1024 * 1024:
+                    await asyncio.to_thread(_pwrite, fd, bytes(buffer), offset, job.write_lock)
+                    offset += len(buffer)
+                    buffer.clear()
+            if buffer:
+                await asyncio.to_thread(_pwrite, fd, bytes(buffer), offset, job.write_lock)
+                offset += len(buffer)
+        
+        if offset != end + 1:
+            raise HTTPDownloadError(f"分块长度不符: 期望 {end - start + 1}, 实际 {offset - start}")
+    
+    async def _download_single(self, job: HTTPJob):
+        """服务器不支持 Range 时单连接顺序下载（无法续传）"""
+        job.bytes_written = 0
+        with open(job.part_path, 'wb') as f:
+            async with self._get_client().stream('GET', job.url) as response:
+                response.raise_for_status()
+                async for data in response.aiter_bytes(1024 * 1024):
+                    await asyncio.to_thread(f.write, data)
+                    job.bytes_written += len(data)
+                    job.record_bytes(len(data))
+    
+    # ---- 查询与取消 ----
+    
+    async def get_progress(self, platform_id: str) -> dict:
+        """获取下载进度和状态
+        
+        Returns:
+            dict: {'progress': float, 'status': str, 'error': str, 'speed': str, 'eta': str}
+        """
+        self._ensure_resumed()
+        
+        job = self._jobs.get(platform_id)
+        if job is None:
+            return {
+                'progress': 0.0,
+                'status': 'unknown',
+                'error': 'Task not found',
+                'speed': '',
+                'eta': ''
+            }
+        
+        status = job.status if job.status in ('pending', 'downloading', 'completed', 'failed') else 'unknown'
+        return {
+            'progress': job.progress,
+            'status': status,
+            'error': job.error,
+            'speed': self._format_speed(job.speed()),
+            'eta': self._format_eta(job.eta())
+        }
+    
+    async def cancel(self, platform_id: str) -> bool:
+        """取消任务并删除未完成的文件和状态文件（已完成任务只删除记录，保留下载的文件）"""
+        self._ensure_resumed()
+        
+        job = self._jobs.pop(platform_id, None)
+        if job is None:
+            logger.warning(f"[HTTP] 任务不存在，无法取消: {platform_id}")
+            return False
+        
+        logger.info(f"[HTTP] 取消任务: {job.title}")
+        job.status = 'canceled'
+        if job.task and not job.task.done():
+            job.task.cancel()
+            await asyncio.gather(job.task, return_exceptions=True)
+        
+        if job.filename:
+            try:
+                os.remove(job.part_path)
+            except FileNotFoundError:
+                pass
+        job.remove_state()
+        return True
+    
+    async def get_downloads(self) -> List[Dict[str, Any]]:
+        """获取所有下载记录"""
+        self._ensure_resumed()
+        
+        downloads = []
+        for job in self._jobs.values():
+            speed = job.speed()
+            eta = job.eta()
+            downloads.append({
+                'id': job.id,
+                'platform': self.name,
+                'title': job.title,
+                'url': job.url,
+                'status': job.status,
+                'progress': round(job.progress, 1),
+                'speed': self._format_speed(speed),
+                'eta': self._format_eta(eta),
+                'speed_bps': speed,
+                'eta_seconds': eta,
+                'created_at': job.created_at,
+                'error': job.error,
+                'file': job.target if job.status == 'completed' else None
+            })
+        return downloads
@@ -1,14 +1,238 @@
-from typing import List, Optional
+from typing import List, Optional, Dict, Tuple, Any
 from base_plugin import DownloadPlugin
+from backend_pool import InstancePool, BackendInstance, DEFAULT_INSTANCE, ROUTING_STRATEGIES
 from models import ConfigField, DownloadTask
 from logger import get_logger
+from urllib.parse import urlsplit
 import httpx
 import asyncio
 import json
+import time
+
+try:
+    import socketio
+except ImportError:  # 可选依赖，未安装时轮询 /history
+    socketio = None
 
 logger = get_logger(__name__)
 
+
+class MetubeHistorySnapshot:
+    """Metube /history 快照
+    
+    对 queue 和 done 列表按 id 和 url 建立索引，单个任务查询为 O(1)。
+    """
+    
+    def __init__(self, metube_url: str, data: Dict[str, Any]):
+        self.metube_url = metube_url
+        self.fetched_at = time.monotonic()
+        self.queue: List[Dict[str, Any]] = data.get('queue', [])
+        self.done: List[Dict[str, Any]] = data.get('done', [])
+        
+        # key(id 或 url) -> (where, download)
+        # 先索引 done 再索引 queue，同一个 key 同时存在时以 queue 为准
+        self._index: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+        # (custom_name_prefix, url) -> download，用于关联我们提交的任务
+        self._prefix_index: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        for where, downloads in (('done', self.done), ('queue', self.queue)):
+            for download in downloads:
+                for key in (download.get('id'), download.get('url')):
+                    if key:
+                        self._index[key] = (where, download)
+                prefix = download.get('custom_name_prefix')
+                if prefix:
+                    self._prefix_index[(prefix, download.get('url', ''))] = download
+    
+    def age(self) -> float:
+        """快照年龄（秒）"""
+        return time.monotonic() - self.fetched_at
+    
+    def find(self, key: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """按 id 或 url 查找任务，返回 (where, download)"""
+        return self._index.get(key)
+    
+    def find_by_prefix(self, custom_name_prefix: str, url: str) -> Optional[Dict[str, Any]]:
+        """按提交时生成的 custom_name_prefix 和 url 查找任务"""
+        return self._prefix_index.get((custom_name_prefix, url))
+
+
+class MetubeEventMirror:
+    """Metube socket.io 事件流镜像
+    
+    订阅 Metube 的 added/updated/completed/canceled/cleared/all 事件，在内存中维护
+    与 /history 相同结构的任务表。连接断开后按指数退避重连，每次连接成功后
+    重新获取一次 /history 作为基准，再重放获取期间收到的事件。
+    """
+    
+    def __init__(self, metube_url: str, fetch_history, max_backoff: float = 60.0):
+        self.metube_url = metube_url
+        self._fetch_history = fetch_history  # async (metube_url) -> /history 返回的 dict
+        self.max_backoff = max_backoff
+        
+        # 任务表：Metube 以 url 作为任务的键
+        self.queue: Dict[str, Dict[str, Any]] = {}
+        self.done: Dict[str, Dict[str, Any]] = {}
+        self.connected = False
+        self.synced = False  # 已完成连接后的 /history 同步，任务表可用
+        
+        self._buffer: Optional[List[Tuple[str, Any]]] = None  # 同步期间收到的事件
+        self._snapshot: Optional[MetubeHistorySnapshot] = None
+        self._task: Optional[asyncio.Task] = None
+        self._disconnected: Optional[asyncio.Event] = None  # 当前连接的断开信号
+    
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+    
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self.connected = False
+        self.synced = False
+    
+    def snapshot(self) -> MetubeHistorySnapshot:
+        """以快照形式读取任务表（任务表变化后重建）"""
+        if self._snapshot is None:
+            self._snapshot = MetubeHistorySnapshot(self.metube_url, {
+                'queue': list(self.queue.values()),
+                'done': list(self.done.values())
+            })
+        return self._snapshot
+    
+    def _socketio_target(self) -> Tuple[str, str]:
+        """Metube 地址 -> (连接地址, socketio_path)，支持带路径前缀的部署"""
+        parts = urlsplit(self.metube_url)
+        prefix = parts.path.strip('/')
+        return f"{parts.scheme}://{parts.netloc}", f"{prefix}/socket.io" if prefix else "socket.io"
+    
+    async def _run(self):
+        backoff = 1.0
+        url, path = self._socketio_target()
+        
+        while True:
+            client = socketio.AsyncClient(reconnection=False)
+            disconnected = asyncio.Event()
+            self._disconnected = disconnected
+            client.on('disconnect', lambda *args: disconnected.set())
+            for event in ('added', 'updated', 'completed', 'canceled', 'cleared', 'all'):
+                client.on(event, self._make_handler(event))
+            
+            try:
+                await client.connect(url, socketio_path=path, wait_timeout=10)
+                self.connected = True
+                await self._resync()
+                logger.info(f"[Metube] 事件流已连接: {self.metube_url} (queue={len(self.queue)}, done={len(self.done)})")
+                backoff = 1.0
+                await disconnected.wait()
+                logger.warning(f"[Metube] 事件流断开: {self.metube_url}")
+            except asyncio.CancelledError:
+                await client.disconnect()
+                raise
+            except Exception as e:
+                logger.debug(f"[Metube] 事件流连接失败: {self.metube_url} - {e}")
+            finally:
+                self.connected = False
+                self.synced = False
+            
+            try:
+                await client.disconnect()
+            except Exception:
+                pass
+            
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, self.max_backoff)
+    
+    def _make_handler(self, event: str):
+        def handler(*args):
+            data = args[0] if args else None
+            if self._buffer is not None:
+                self._buffer.append((event, data))
+            self._handle(event, data)
+        return handler
+    
+    def _handle(self, event: str, data: Any) -> bool:
+        """应用事件；数据格式错误时丢弃任务表，改为轮询 /history，并断开连接以便重连后重新同步"""
+        try:
+            self._apply(event, data)
+            return True
+        except (TypeError, ValueError, AttributeError, KeyError) as e:
+            logger.warning(f"[Metube] 事件数据格式错误，改为轮询 /history 并重新连接: "
+                           f"{self.metube_url} {event} {str(data)[:200]} - {e}")
+            self.synced = False
+            self.queue, self.done = {}, {}
+            self._snapshot = None
+            if self._disconnected is not None:
+                self._disconnected.set()
+            return False
+    
+    async def _resync(self):
+        """以 /history 为基准重建任务表，并重放同步期间收到的事件"""
+        self._buffer = []
+        try:
+            history = await self._fetch_history(self.metube_url)
+            self._load(history.get('queue', []), history.get('done', []))
+            replayed = all(self._handle(event, data) for event, data in self._buffer)
+        finally:
+            self._buffer = None
+        self.synced = replayed and not (self._disconnected is not None and self._disconnected.is_set())
+    
+    def _load(self, queue: List[Dict[str, Any]], done: List[Dict[str, Any]]):
+        # 先建好两个表再替换，数据格式错误时不留下一半的任务表
+        queue = {download.get('url'): download for download in queue}
+        done = {download.get('url'): download for download in done}
+        self.queue, self.done = queue, done
+        self._snapshot = None
+    
+    def _apply(self, event: str, data: Any):
+        """应用一个事件（Metube 的事件数据是 JSON 字符串）"""
+        if isinstance(data, (str, bytes)):
+            try:
+                data = json.loads(data)
+            except ValueError:
+                pass
+        
+        if event == 'all':
+            # 连接时推送的全量数据：[[(url, info), ...], [(url, info), ...]]
+            if not isinstance(data, list) or len(data) != 2:
+                raise ValueError("all 事件应为 [queue, done]")
+            queue, done = data
+            self._load([info for _, info in queue], [info for _, info in done])
+            return
+        
+        if event in ('added', 'updated', 'completed'):
+            if not isinstance(data, dict) or not data.get('url'):
+                raise ValueError(f"{event} 事件应为包含 url 的任务")
+        elif not isinstance(data, str):
+            raise ValueError(f"{event} 事件应为任务的 url")
+        
+        if event in ('added', 'updated'):
+            self.queue[data.get('url')] = data
+        elif event == 'completed':
+            self.queue.pop(data.get('url'), None)
+            self.done[data.get('url')] = data
+        elif event == 'canceled':
+            self.queue.pop(data, None)
+        elif event == 'cleared':
+            self.done.pop(data, None)
+        self._snapshot = None
+
+
 class MetubeDownloadPlugin(DownloadPlugin):
+
+    def __init__(self):
+        super().__init__()
+        self._client: Optional[httpx.AsyncClient] = None
+        # 按 Metube 地址缓存 /history 快照
+        self._history: Dict[str, MetubeHistorySnapshot] = {}
+        self._history_fetch: Dict[str, asyncio.Future] = {}
+        self._history_generation: Dict[str, int] = {}
+        self._pool = InstancePool("Metube")
+        # 按 Metube 地址维护事件流镜像
+        self._mirrors: Dict[str, MetubeEventMirror] = {}
+        self._socketio_warned = False
+        # 后台关联任务（保持引用，避免被垃圾回收）
+        self._background_tasks = set()
     
     @property
     def name(self) -> str:
@@ -34,7 +258,27 @@ class MetubeDownloadPlugin(DownloadPlugin):
                 type="text",
                 default="http://localhost:8081",
                 required=True,
-                description="Metube API 地址"
+                description="Metube API 地址（未配置实例列表时使用）"
+            ),
+            ConfigField(
+                name="instances",
+                label="Metube 实例列表",
+                type="list",
+                default=[],
+                description="多个 Metube 实例时按路由策略分配新任务，不可用的实例暂时剔除；为空时只使用上面的服务地址",
+                fields=[
+                    {"name": "name", "label": "实例名称", "type": "text", "default": ""},
+                    {"name": "url", "label": "服务地址", "type": "text", "default": ""},
+                    {"name": "enabled", "label": "启用", "type": "boolean", "default": True}
+                ]
+            ),
+            ConfigField(
+                name="routing",
+                label="路由策略",
+                type="select",
+                options=ROUTING_STRATEGIES,
+                default="least_active",
+                description="least_active: 活动任务最少的实例；throughput: 实测吞吐量最高的实例"
             ),
             ConfigField(
                 name="default_quality",
@@ -49,269 +293,386 @@ class MetubeDownloadPlugin(DownloadPlugin):
                 type="text",
                 default="/downloads",
                 required=True
+            ),
+            ConfigField(
+                name="history_ttl",
+                label="历史缓存时间（秒）",
+                type="number",
+                default=2,
+                description="同一时间窗口内的进度查询共享一次 /history 请求"
+            ),
+            ConfigField(
+                name="event_stream",
+                label="订阅事件流",
+                type="boolean",
+                default=True,
+                description="通过 Metube 的 socket.io 事件流实时维护任务表，不再轮询 /history（需要安装 python-socketio）"
+            )
+        ] + self._scheduling_config_fields()
+    
+    def _get_metube_url(self) -> str:
+        """获取Metube URL并移除末尾的斜杠"""
+        return self.config.get('metube_url', 'http://localhost:8081').rstrip('/')
+    
+    def _get_pool(self) -> InstancePool:
+        """按当前配置更新实例池，并在需要时后台执行健康检查"""
+        specs = []
+        for index, item in enumerate(self.config.get('instances') or []):
+            if not item.get('enabled', True) or not item.get('url'):
+                continue
+            name = str(item.get('name') or f"metube{index + 1}").replace('|', '_')
+            specs.append((name, item['url'].rstrip('/'), {}))
+        if not specs:
+            specs = [(DEFAULT_INSTANCE, self._get_metube_url(), {})]
+        
+        self._pool.configure(specs)
+        self._update_mirrors()
+        self._pool.maybe_check(self._check_instance)
+        return self._pool
+    
+    def _update_mirrors(self):
+        """为每个实例启动事件流镜像，停止已移除实例的镜像"""
+        urls = set()
+        if self._get_config_bool('event_stream', True):
+            if socketio is not None:
+                urls = {instance.url for instance in self._pool.instances.values()}
+            elif not self._socketio_warned:
+                self._socketio_warned = True
+                logger.warning("[Metube] 未安装 python-socketio，改为轮询 /history（见 metube_requirements.txt）")
+        
+        for url in list(self._mirrors):
+            if url not in urls:
+                self._mirrors.pop(url).stop()
+        for url in urls:
+            if url not in self._mirrors:
+                mirror = MetubeEventMirror(url, self._request_history)
+                self._mirrors[url] = mirror
+                mirror.start()
+    
+    async def _check_instance(self, instance: BackendInstance):
+        """健康检查：能获取 /history 即为可用（复用缓存的快照）"""
+        await self._get_history(instance.url)
+    
+    def _choose_instance(self, task: DownloadTask) -> BackendInstance:
+        """为任务选择实例：重新提交的任务沿用已分配的实例，否则按路由策略选择"""
+        pool = self._get_pool()
+        assigned = (task.metadata or {}).get('instance')
+        if assigned in pool.instances and pool.instances[assigned].healthy:
+            return pool.instances[assigned]
+        return pool.choose(self.config.get('routing', 'least_active'))
+    
+    def _get_client(self) -> httpx.AsyncClient:
+        """获取共享的 httpx 客户端（连接池复用，禁用代理）"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(timeout=10.0, follow_redirects=True, trust_env=False)
+        return self._client
+    
+    async def _request_history(self, metube_url: str) -> Dict[str, Any]:
+        response = await self._get_client().get(f"{metube_url}/history")
+        response.raise_for_status()
+        return response.json()
+    
+    async def _fetch_history(self, metube_url: str, generation: int) -> MetubeHistorySnapshot:
+        snapshot = MetubeHistorySnapshot(metube_url, await self._request_history(metube_url))
+        # 请求期间快照被置为失效时，不覆盖
+        if generation == self._history_generation.get(metube_url, 0):
+            self._history[metube_url] = snapshot
+        logger.debug(f"[Metube] 刷新历史快照: queue={len(snapshot.queue)}, done={len(snapshot.done)}")
+        return snapshot
+    
+    async def _get_history(self, metube_url: Optional[str] = None) -> MetubeHistorySnapshot:
+        """获取 Metube 实例的 /history 快照（默认为未配置实例列表时的服务地址）
+        
+        事件流镜像已同步时直接读取镜像的任务表；否则轮询 /history：
+        快照在 history_ttl 秒内复用，过期后由第一个调用者发起请求，
+        同时到达的其他调用者等待同一个请求的结果（single-flight）。
+        """
+        metube_url = metube_url or self._get_metube_url()
+        
+        mirror = self._mirrors.get(metube_url)
+        if mirror is not None and mirror.synced:
+            return mirror.snapshot()
+        ttl = self._get_config_float('history_ttl', 2.0)
+        
+        snapshot = self._history.get(metube_url)
+        if snapshot and snapshot.age() < ttl:
+            return snapshot
+        
+        fetch = self._history_fetch.get(metube_url)
+        if fetch is None or fetch.done():
+            fetch = asyncio.ensure_future(
+                self._fetch_history(metube_url, self._history_generation.get(metube_url, 0))
             )
-        ]
+            self._history_fetch[metube_url] = fetch
+        
+        # shield: 单个调用者被取消时不影响共享请求
+        return await asyncio.shield(fetch)
+    
+    def _invalidate_history(self, metube_url: str):
+        """任务增删后使该实例的快照失效"""
+        self._history.pop(metube_url, None)
+        self._history_fetch.pop(metube_url, None)
+        self._history_generation[metube_url] = self._history_generation.get(metube_url, 0) + 1
     
     async def download(self, task: DownloadTask) -> bool:
-        # 获取Metube URL并移除末尾的斜杠
-        metube_url = self.config.get('metube_url', 'http://localhost:8081').rstrip('/')
+        instance = self._choose_instance(task)
+        metube_url = instance.url
         
         logger.info(f"[Metube] 开始下载任务: {task.title}")
         logger.debug(f"[Metube] 任务ID: {task.id}")
         logger.debug(f"[Metube] URL: {task.url}")
-        logger.debug(f"[Metube] Metube服务地址: {metube_url}")
+        logger.debug(f"[Metube] Metube服务地址: {metube_url} (实例 {instance.name})")
         
         # 获取数据库实例
-        from database import get_database
-        db = get_database()
+        from database import get_async_database
+        db = get_async_database()
         
-        # 配置httpx客户端，禁用代理
-        async with httpx.AsyncClient(timeout=30.0, follow_redirects=True, trust_env=False) as client:
+        client = self._get_client()
+        try:
+            # 生成文件名：时间戳_视频名称
+            from datetime import datetime
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            # 清理文件名中的非法字符
+            safe_title = "".join(c for c in task.title if c.isalnum() or c in (' ', '-', '_', '.')).strip()
+            custom_filename = f"{timestamp}_{safe_title}"
+            
+            # 构建payload - Metube API格式
+            payload = {
+                "url": task.url,
+                "quality": self.config.get('default_quality', 'best'),
+                "custom_name_prefix": custom_filename  # 自定义文件名
+            }
+            
+            # 如果配置了下载路径，添加folder参数
+            download_path = self.config.get('download_path', '')
+            if download_path and download_path != '/downloads':
+                payload["folder"] = download_path
+            
+            logger.debug(f"[Metube] 自定义文件名: {custom_filename}")
+            
+            logger.debug(f"[Metube] 请求payload: {payload}")
+            logger.debug(f"[Metube] 请求URL: {metube_url}/add")
+            
+            # 发送POST请求
+            response = await client.post(
+                f"{metube_url}/add",
+                json=payload,
+                headers={"Content-Type": "application/json"},
+                timeout=30.0
+            )
+            self._invalidate_history(metube_url)
+            self._pool.mark_success(instance.name)
+            
+            logger.debug(f"[Metube] 响应状态码: {response.status_code}")
+            logger.debug(f"[Metube] 响应头: {dict(response.headers)}")
+            
+            # 记录完整响应内容
+            response_text = response.text
+            logger.debug(f"[Metube] 响应内容（完整）: {response_text}")
+            
+            # 检查HTTP状态码
+            if response.status_code != 200:
+                logger.error(f"[Metube] HTTP错误: {response.status_code}")
+                logger.error(f"[Metube] 响应内容: {response_text}")
+                return False
+            
+            # 尝试解析JSON响应
             try:
-                # 生成文件名：时间戳_视频名称
-                from datetime import datetime
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                # 清理文件名中的非法字符
-                safe_title = "".join(c for c in task.title if c.isalnum() or c in (' ', '-', '_', '.')).strip()
-                custom_filename = f"{timestamp}_{safe_title}"
-                
-                # 构建payload - Metube API格式
-                payload = {
-                    "url": task.url,
-                    "quality": self.config.get('default_quality', 'best'),
-                    "custom_name_prefix": custom_filename  # 自定义文件名
-                }
-                
-                # 如果配置了下载路径，添加folder参数
-                download_path = self.config.get('download_path', '')
-                if download_path and download_path != '/downloads':
-                    payload["folder"] = download_path
+                result = response.json()
+                logger.debug(f"[Metube] JSON响应: {result}")
                 
-                logger.debug(f"[Metube] 自定义文件名: {custom_filename}")
-                
-                logger.debug(f"[Metube] 请求payload: {payload}")
-                logger.debug(f"[Metube] 请求URL: {metube_url}/add")
-                
-                # 发送POST请求
-                response = await client.post(
-                    f"{metube_url}/add",
-                    json=payload,
-                    headers={"Content-Type": "application/json"}
-                )
-                
-                logger.debug(f"[Metube] 响应状态码: {response.status_code}")
-                logger.debug(f"[Metube] 响应头: {dict(response.headers)}")
-                
-                # 记录完整响应内容
-                response_text = response.text
-                logger.debug(f"[Metube] 响应内容（完整）: {response_text}")
-                
-                # 检查HTTP状态码
-                if response.status_code != 200:
-                    logger.error(f"[Metube] HTTP错误: {response.status_code}")
-                    logger.error(f"[Metube] 响应内容: {response_text}")
-                    return False
-                
-                # 尝试解析JSON响应
-                try:
-                    result = response.json()
-                    logger.debug(f"[Metube] JSON响应: {result}")
-                    
-                    # 检查status字段
-                    status = result.get('status')
-                    if status == 'error':
-                        error_msg = result.get('msg', '未知错误')
-                        logger.error(f"[Metube] 下载失败: {error_msg}")
-                        
-                        # 提供更友好的错误提示
-                        if 'Unable to download' in error_msg:
-                            logger.error(f"[Metube] 提示: 视频源可能不可访问或需要特殊处理")
-                        elif 'Connection' in error_msg:
-                            logger.error(f"[Metube] 提示: 网络连接问题，请检查Metube服务器的网络")
-                        
-                        return False
+                # 检查status字段
+                status = result.get('status')
+                if status == 'error':
+                    error_msg = result.get('msg', '未知错误')
+                    logger.error(f"[Metube] 下载失败: {error_msg}")
                     
-                    elif status == 'ok' or status == 'success':
-                        logger.info(f"[Metube] ✓ 下载任务添加成功: {task.id}")
-                        
-                        # Metube 的 /add 接口通常不直接返回任务 ID
-                        # 我们使用 URL 作为标识符，稍后通过 /history 查询实际 ID
-                        metube_id = result.get('id', task.url)
-                        
-                        # 如果没有返回 ID，等待一下然后查询
-                        if metube_id == task.url:
-                            logger.debug(f"[Metube] 未返回任务ID，等待后查询...")
-                            await asyncio.sleep(1)  # 等待任务出现在队列中
-                            
-                            # 通过 URL 查询任务 ID
-                            progress_info = await self.get_progress(task.url)
-                            if progress_info.get('status') != 'unknown':
-                                # 从 /history 响应中获取实际的任务 ID
-                                # 注意：我们需要再次查询以获取完整信息
-                                try:
-                                    history_response = await client.get(f"{metube_url}/history")
-                                    if history_response.status_code == 200:
-                                        history_data = history_response.json()
-                                        for download in history_data.get('queue', []):
-                                            if download.get('url') == task.url:
-                                                metube_id = download.get('id', task.url)
-                                                logger.info(f"[Metube] 查询到任务ID: {metube_id}")
-                                                break
-                                except Exception as e:
-                                    logger.warning(f"[Metube] 查询任务ID失败: {e}")
-                        
-                        logger.info(f"[Metube] Metube任务标识: {metube_id}")
-                        
-                        # 合并现有metadata
-                        metadata = task.metadata.copy() if task.metadata else {}
-                        metadata['metube_id'] = metube_id
-                        
-                        db.update_task(task.id, {
-                            'status': 'downloading',
-                            'metadata': metadata
-                        })
-                        return True
+                    # 提供更友好的错误提示
+                    if 'Unable to download' in error_msg:
+                        logger.error(f"[Metube] 提示: 视频源可能不可访问或需要特殊处理")
+                    elif 'Connection' in error_msg:
+                        logger.error(f"[Metube] 提示: 网络连接问题，请检查Metube服务器的网络")
                     
-                    else:
-                        # 没有明确的status字段，检查是否有错误信息
-                        if 'error' in result or 'msg' in result:
-                            logger.warning(f"[Metube] 响应包含可能的错误: {result}")
-                        
-                        # 如果没有明确的错误，认为成功
-                        logger.info(f"[Metube] 下载任务已提交: {task.id}")
-                        
-                        # 使用 URL 作为标识符
-                        metadata = task.metadata.copy() if task.metadata else {}
-                        metadata['metube_id'] = task.url
-                        
-                        db.update_task(task.id, {
-                            'status': 'downloading',
-                            'metadata': metadata
-                        })
-                        return True
+                    return False
                 
-                except ValueError as e:
-                    # 不是JSON响应
-                    logger.warning(f"[Metube] 响应不是JSON格式: {e}")
-                    logger.debug(f"[Metube] 原始响应: {response_text[:500]}")
-                    
-                    # 检查响应内容是否包含错误关键词
-                    if 'error' in response_text.lower() or 'fail' in response_text.lower():
-                        logger.error(f"[Metube] 响应包含错误信息")
-                        return False
-                    
-                    # 如果HTTP 200且没有明显错误，认为成功
-                    logger.info(f"[Metube] 任务已提交（非JSON响应）: {task.id}")
+                elif status == 'ok' or status == 'success':
+                    logger.info(f"[Metube] ✓ 下载任务添加成功: {task.id}")
                     
-                    # 使用 URL 作为标识符
-                    metadata = task.metadata.copy() if task.metadata else {}
-                    metadata['metube_id'] = task.url
-                    
-                    db.update_task(task.id, {
-                        'status': 'downloading',
-                        'metadata': metadata
-                    })
+                    # Metube 的 /add 接口通常不直接返回任务 ID
+                    # 先使用 URL 作为标识符，稍后在后台通过 custom_name_prefix 关联实际 ID
+                    await self._mark_submitted(task, instance, result.get('id'), custom_filename)
                     return True
+                
+                else:
+                    # 没有明确的status字段，检查是否有错误信息
+                    if 'error' in result or 'msg' in result:
+                        logger.warning(f"[Metube] 响应包含可能的错误: {result}")
                     
-            except httpx.TimeoutException as e:
-                logger.error(f"[Metube] ✗ 请求超时: {e}")
-                logger.error(f"[Metube] 提示: 增加超时时间或检查网络")
-                db.update_task(task.id, {'status': 'failed'})
-                return False
-            
-            except httpx.ConnectError as e:
-                logger.error(f"[Metube] ✗ 连接失败: {e}")
-                logger.error(f"[Metube] 提示: 请检查Metube服务是否运行在 {metube_url}")
-                logger.error(f"[Metube] 提示: 可以访问 {metube_url} 验证服务状态")
-                db.update_task(task.id, {'status': 'failed'})
-                return False
+                    # 如果没有明确的错误，认为成功
+                    logger.info(f"[Metube] 下载任务已提交: {task.id}")
+                    await self._mark_submitted(task, instance, None, custom_filename)
+                    return True
             
+            except ValueError as e:
+                # 不是JSON响应
+                logger.warning(f"[Metube] 响应不是JSON格式: {e}")
+                logger.debug(f"[Metube] 原始响应: {response_text[:500]}")
+                
+                # 检查响应内容是否包含错误关键词
+                if 'error' in response_text.lower() or 'fail' in response_text.lower():
+                    logger.error(f"[Metube] 响应包含错误信息")
+                    return False
+                
+                # 如果HTTP 200且没有明显错误，认为成功
+                logger.info(f"[Metube] 任务已提交（非JSON响应）: {task.id}")
+                await self._mark_submitted(task, instance, None, custom_filename)
+                return True
+        
+        except httpx.TimeoutException as e:
+            logger.error(f"[Metube] ✗ 请求超时: {e}")
+            logger.error(f"[Metube] 提示: 增加超时时间或检查网络")
+            self._pool.mark_failure(instance.name, f"请求超时: {e}")
+            await db.update_task(task.id, {'status': 'failed'})
+            return False
+        
+        except httpx.ConnectError as e:
+            logger.error(f"[Metube] ✗ 连接失败: {e}")
+            logger.error(f"[Metube] 提示: 请检查Metube服务是否运行在 {metube_url}")
+            logger.error(f"[Metube] 提示: 可以访问 {metube_url} 验证服务状态")
+            self._pool.mark_failure(instance.name, f"连接失败: {e}")
+            await db.update_task(task.id, {'status': 'failed'})
+            return False
+        
+        except Exception as e:
+            logger.error(f"[Metube] ✗ 下载异常: {e}", exc_info=True)
+            await db.update_task(task.id, {'status': 'failed'})
+            return False
+    
+    async def _mark_submitted(self, task: DownloadTask, instance: BackendInstance,
+                              metube_id: Optional[str], custom_filename: str):
+        """记录已提交的任务和所在实例；未返回 ID 时在后台关联，不阻塞提交"""
+        from database import get_async_database
+        
+        # 合并现有metadata
+        metadata = task.metadata.copy() if task.metadata else {}
+        metadata['metube_id'] = metube_id or task.url
+        metadata['metube_prefix'] = custom_filename
+        metadata['instance'] = instance.name
+        
+        await get_async_database().update_task(task.id, {
+            'status': 'downloading',
+            'metadata': metadata,
+            'platform_id': self.get_platform_id(metadata)
+        })
+        logger.info(f"[Metube] Metube任务标识: {metadata['metube_id']}")
+        
+        if not metube_id:
+            background_task = asyncio.create_task(
+                self._correlate_task(task.id, instance.url, task.url, custom_filename)
+            )
+            self._background_tasks.add(background_task)
+            background_task.add_done_callback(self._background_tasks.discard)
+    
+    async def _correlate_task(self, task_id: str, metube_url: str, url: str, custom_filename: str,
+                              attempts: int = 30, interval: float = 1.0):
+        """在后台通过 custom_name_prefix 关联 Metube 任务 ID 并写回数据库
+        
+        同一个 URL 被重复提交时，按 URL 匹配会关联到错误的任务；
+        custom_name_prefix 由我们为每次提交单独生成，可以准确区分。
+        """
+        from database import get_async_database
+        db = get_async_database()
+        
+        for _ in range(attempts):
+            await asyncio.sleep(interval)
+            try:
+                download = (await self._get_history(metube_url)).find_by_prefix(custom_filename, url)
             except Exception as e:
-                logger.error(f"[Metube] ✗ 下载异常: {e}", exc_info=True)
-                db.update_task(task.id, {'status': 'failed'})
-                return False
+                logger.debug(f"[Metube] 关联任务ID时查询失败: {e}")
+                continue
+            
+            if download is None:
+                continue
+            
+            metube_id = download.get('id') or url
+            task = await db.get_task(task_id)
+            if task is None:
+                return
+            
+            metadata = task.get('metadata') or {}
+            if metadata.get('metube_id') != metube_id:
+                metadata['metube_id'] = metube_id
+                await db.update_task(task_id, {'metadata': metadata, 'platform_id': self.get_platform_id(metadata)})
+            logger.info(f"[Metube] 查询到任务ID: {task_id} -> {metube_id}")
+            return
+        
+        logger.warning(f"[Metube] 未能关联任务ID，继续使用URL作为标识: {task_id}")
     
-    async def get_progress(self, metube_id: str) -> dict:
-        """获取下载进度和状态（通过 /history API）
+    async def get_progress(self, platform_id: str) -> dict:
+        """获取下载进度和状态（通过任务所在实例的 /history 快照）
         
         Args:
-            metube_id: Metube平台的任务ID（可能是URL）
-            
+            platform_id: Metube平台的任务ID（可能是URL），多实例时带有实例名前缀
+        
         Returns:
             dict: {'progress': float, 'status': str, 'error': str, 'where': str}
         """
-        metube_url = self.config.get('metube_url', 'http://localhost:8081').rstrip('/')
-        
-        logger.debug(f"[Metube] 查询任务进度: {metube_id}")
+        logger.debug(f"[Metube] 查询任务进度: {platform_id}")
+        instance, metube_id = self._get_pool().split_id(platform_id)
         
         try:
-            async with httpx.AsyncClient(timeout=10.0, trust_env=False) as client:
-                # 使用 /history 接口查询所有任务
-                response = await client.get(f"{metube_url}/history")
-                if response.status_code == 200:
-                    data = response.json()
-                    
-                    # 检查队列中的任务（正在下载或等待中）
-                    queue = data.get('queue', [])
-                    for download in queue:
-                        # 匹配 ID 或 URL
-                        if download.get('id') == metube_id or download.get('url') == metube_id:
-                            # Metube 的 percent 字段是百分比（0-100），但可能是 null
-                            progress = download.get('percent')
-                            if progress is None:
-                                progress = 0.0
-                            
-                            # 获取任务状态
-                            task_status = download.get('status', 'downloading')
-                            
-                            # 根据状态判断
-                            if task_status == 'pending':
-                                status = 'pending'
-                            elif task_status == 'downloading':
-                                status = 'downloading'
-                            else:
-                                status = 'downloading'
-                            
-                            logger.debug(f"[Metube] 任务 {metube_id} 状态: {task_status}, 进度: {progress:.1f}%")
-                            
-                            return {
-                                'progress': progress,
-                                'status': status,
-                                'error': None,
-                                'speed': download.get('speed') or '',
-                                'eta': download.get('eta') or '',
-                                'where': 'queue',  # 标记任务位置，用于删除
-                                'title': download.get('title', '')
-                            }
-                    
-                    # 检查已完成的任务
-                    done = data.get('done', [])
-                    for download in done:
-                        if download.get('id') == metube_id or download.get('url') == metube_id:
-                            logger.debug(f"[Metube] 任务 {metube_id} 已完成")
-                            return {
-                                'progress': 100.0,
-                                'status': 'completed',
-                                'error': None,
-                                'speed': '',
-                                'eta': '',
-                                'where': 'done',
-                                'title': download.get('title', '')
-                            }
-                    
-                    # 任务不在任何列表中，可能已被删除或未找到
-                    logger.warning(f"[Metube] 未找到任务: {metube_id}")
-                    return {
-                        'progress': 0.0,
-                        'status': 'unknown',
-                        'error': 'Task not found in Metube',
-                        'speed': '',
-                        'eta': '',
-                        'where': None
-                    }
-                else:
-                    logger.error(f"[Metube] API 请求失败: {response.status_code}")
-                            
+            found = (await self._get_history(instance.url)).find(metube_id)
+            
+            if found is None:
+                # 任务不在任何列表中，可能已被删除或未找到
+                logger.warning(f"[Metube] 未找到任务: {metube_id}")
+                return {
+                    'progress': 0.0,
+                    'status': 'unknown',
+                    'error': 'Task not found in Metube',
+                    'speed': '',
+                    'eta': '',
+                    'where': None
+                }
+            
+            where, download = found
+            
+            if where == 'queue':
+                # 队列中的任务（正在下载或等待中）
+                # Metube 的 percent 字段是百分比（0-100），但可能是 null
+                progress = download.get('percent')
+                if progress is None:
+                    progress = 0.0
+                
+                # 获取任务状态
+                task_status = download.get('status', 'downloading')
+                status = 'pending' if task_status == 'pending' else 'downloading'
+                
+                logger.debug(f"[Metube] 任务 {metube_id} 状态: {task_status}, 进度: {progress:.1f}%")
+                
+                return {
+                    'progress': progress,
+                    'status': status,
+                    'error': None,
+                    'speed': download.get('speed') or '',
+                    'eta': download.get('eta') or '',
+                    'where': 'queue',  # 标记任务位置，用于删除
+                    'title': download.get('title', '')
+                }
+            
+            # done 列表中的任务（已完成或失败）
+            status, progress, error = self._done_state(download)
+            logger.debug(f"[Metube] 任务 {metube_id} 已结束: {status}")
+            return {
+                'progress': progress,
+                'status': status,
+                'error': error,
+                'speed': '',
+                'eta': '',
+                'where': 'done',
+                'title': download.get('title', '')
+            }
+        
         except Exception as e:
             logger.error(f"[Metube] 获取进度失败: {e}", exc_info=True)
         
@@ -324,107 +685,190 @@ class MetubeDownloadPlugin(DownloadPlugin):
             'where': None
         }
     
-    async def cancel(self, metube_id: str) -> bool:
+    def get_platform_id(self, metadata: Dict[str, Any]) -> Optional[str]:
+        metube_id = metadata.get('metube_id')
+        if not metube_id:
+            return None
+        return self._pool.compose_id(metadata.get('instance'), metube_id)
+    
+    async def cancel(self, platform_id: str) -> bool:
         """取消/删除下载任务
         
         Args:
-            metube_id: Metube平台的任务ID（可能是URL）
-            
+            platform_id: Metube平台的任务ID（可能是URL），多实例时带有实例名前缀
+        
         Returns:
             bool: 是否成功取消
         """
-        metube_url = self.config.get('metube_url', 'http://localhost:8081').rstrip('/')
+        results = await self.cancel_batch([platform_id])
+        return results.get(platform_id, False)
+    
+    async def cancel_batch(self, platform_ids: List[str]) -> Dict[str, bool]:
+        """批量取消/删除下载任务
         
-        logger.info(f"[Metube] 取消任务: {metube_id}")
+        每个实例只读取一次 /history 快照确定任务在 queue 还是 done 中，
+        再按 where 分组，每组一次 /delete 请求（ids 为任务列表）。
+        """
+        return await self._delete(platform_ids, ('queue', 'done'))
+    
+    async def prepare_retry(self, platform_ids: List[str]) -> Dict[str, bool]:
+        """重新提交前从 done 列表中删除旧的（失败或已完成的）记录，正在下载的任务不能重试"""
+        results = await self._delete(platform_ids, ('done',))
+        pool = self._get_pool()
+        for platform_id in platform_ids:
+            if not results.get(platform_id):
+                # 不在 Metube 中的任务（已被删除）可以直接重新提交
+                instance, metube_id = pool.split_id(platform_id)
+                snapshot = await self._get_history(instance.url)
+                results[platform_id] = snapshot.find(metube_id) is None
+        return results
+    
+    async def _delete(self, platform_ids: List[str], wheres: Tuple[str, ...]) -> Dict[str, bool]:
+        """从 wheres 指定的列表中删除任务，返回 {platform_id: 是否已删除}"""
+        results = {platform_id: False for platform_id in platform_ids}
         
-        try:
-            async with httpx.AsyncClient(timeout=10.0, trust_env=False) as client:
-                # 首先查询任务在哪个列表中（queue 或 done）
-                progress_info = await self.get_progress(metube_id)
-                where = progress_info.get('where', 'queue')
-                
-                if where is None:
-                    logger.warning(f"[Metube] 任务不存在，无法取消: {metube_id}")
-                    return False
-                
-                # 使用正确的 Payload 格式删除任务
-                # 必须包含 ids（列表）和 where（'queue' 或 'done'）
-                payload = {
-                    "ids": [metube_id],
-                    "where": where
-                }
-                
-                logger.debug(f"[Metube] 删除请求: {payload}")
+        pool = self._get_pool()
+        groups: Dict[str, List[Tuple[str, str]]] = {}
+        for platform_id in platform_ids:
+            instance, metube_id = pool.split_id(platform_id)
+            groups.setdefault(instance.name, []).append((platform_id, metube_id))
+        
+        for name, items in groups.items():
+            instance = pool.instances[name]
+            metube_url = instance.url
+            
+            try:
+                snapshot = await self._get_history(metube_url)
                 
-                response = await client.post(
-                    f"{metube_url}/delete",
-                    json=payload
-                )
+                # where -> [(platform_id, Metube 中任务的键)]；Metube 以 url 作为任务的键
+                by_where: Dict[str, List[Tuple[str, str]]] = {}
+                for platform_id, metube_id in items:
+                    found = snapshot.find(metube_id)
+                    if found is None:
+                        logger.warning(f"[Metube] 任务不存在，无法删除: {metube_id}")
+                        continue
+                    where, download = found
+                    if where in wheres:
+                        by_where.setdefault(where, []).append((platform_id, download.get('url') or metube_id))
                 
-                if response.status_code == 200:
-                    logger.info(f"[Metube] ✓ 任务取消成功: {metube_id} (from {where})")
-                    return True
-                else:
-                    logger.error(f"[Metube] 取消任务失败: {response.status_code}")
-                    logger.error(f"[Metube] 响应内容: {response.text}")
-                    return False
+                for where, entries in by_where.items():
+                    # 必须包含 ids（列表）和 where（'queue' 或 'done'）
+                    payload = {"ids": [key for _, key in entries], "where": where}
+                    logger.info(f"[Metube] 删除 {len(entries)} 个任务 (from {where}, 实例 {name})")
+                    logger.debug(f"[Metube] 删除请求: {payload}")
                     
-        except Exception as e:
-            logger.error(f"[Metube] ✗ 取消任务异常: {e}", exc_info=True)
-            return False
+                    response = await self._get_client().post(f"{metube_url}/delete", json=payload)
+                    self._invalidate_history(metube_url)
+                    
+                    if response.status_code == 200:
+                        for platform_id, _ in entries:
+                            results[platform_id] = True
+                    else:
+                        logger.error(f"[Metube] 删除任务失败: {response.status_code}")
+                        logger.error(f"[Metube] 响应内容: {response.text}")
+            
+            except Exception as e:
+                logger.error(f"[Metube] ✗ 删除任务异常 ({name}): {e}", exc_info=True)
+        
+        return results
     
     async def get_downloads(self) -> list:
-        """获取Metube平台的所有下载记录"""
-        metube_url = self.config.get('metube_url', 'http://localhost:8081').rstrip('/')
-        
+        """获取所有 Metube 实例的下载记录，同时更新各实例的负载统计"""
         logger.debug(f"[Metube] 获取下载列表")
         
+        pool = self._get_pool()
+        results = await asyncio.gather(
+            *(self._get_instance_downloads(instance) for instance in list(pool.instances.values()))
+        )
+        downloads = [download for result in results for download in result]
+        
+        logger.info(f"[Metube] 获取到 {len(downloads)} 条下载记录")
+        return downloads
+    
+    async def _get_instance_downloads(self, instance: BackendInstance) -> list:
+        """获取单个实例的下载记录；实例不可用时记录失败并返回空列表"""
         downloads = []
         
         try:
-            async with httpx.AsyncClient(timeout=10.0, trust_env=False) as client:
-                response = await client.get(f"{metube_url}/history")
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    
-                    # 处理队列中的任务（正在下载或等待）
-                    for download in data.get('queue', []):
-                        downloads.append({
-                            'id': download.get('id', download.get('url')),
-                            'platform': self.name,
-                            'title': download.get('title', '未知标题'),
-                            'url': download.get('url', ''),
-                            'status': self._map_status(download.get('status', 'downloading')),
-                            'progress': download.get('percent') or 0.0,
-                            'speed': download.get('speed', ''),
-                            'eta': download.get('eta', ''),
-                            'created_at': None  # Metube不提供创建时间
-                        })
-                    
-                    # 处理已完成的任务
-                    for download in data.get('done', []):
-                        downloads.append({
-                            'id': download.get('id', download.get('url')),
-                            'platform': self.name,
-                            'title': download.get('title', '未知标题'),
-                            'url': download.get('url', ''),
-                            'status': 'completed',
-                            'progress': 100.0,
-                            'speed': '',
-                            'eta': '',
-                            'created_at': None
-                        })
-                    
-                    logger.info(f"[Metube] 获取到 {len(downloads)} 条下载记录")
-                else:
-                    logger.error(f"[Metube] 获取下载列表失败: {response.status_code}")
-                    
+            snapshot = await self._get_history(instance.url)
+        except httpx.HTTPStatusError as e:
+            logger.error(f"[Metube] 获取下载列表失败 ({instance.name}): {e.response.status_code}")
+            self._pool.mark_failure(instance.name, f"HTTP {e.response.status_code}")
+            return downloads
+        except httpx.TransportError as e:
+            logger.warning(f"[Metube] 无法连接实例 {instance.name} ({instance.url}): {e}")
+            self._pool.mark_failure(instance.name, str(e) or type(e).__name__)
+            return downloads
+        
         except Exception as e:
-            logger.error(f"[Metube] 获取下载列表异常: {e}", exc_info=True)
+            logger.error(f"[Metube] 获取下载列表异常 ({instance.name}): {e}", exc_info=True)
+            self._pool.mark_failure(instance.name, str(e) or type(e).__name__)
+            return downloads
+        
+        self._pool.mark_success(instance.name)
+        self._pool.report_load(
+            instance.name,
+            len(snapshot.queue),
+            sum(download.get('speed') or 0 for download in snapshot.queue)
+        )
+        
+        # 处理队列中的任务（正在下载或等待）
+        for download in snapshot.queue:
+            downloads.append({
+                'id': self._pool.compose_id(instance.name, download.get('id', download.get('url'))),
+                'platform': self.name,
+                'title': download.get('title', '未知标题'),
+                'url': download.get('url', ''),
+                'status': self._map_status(download.get('status', 'downloading')),
+                'progress': download.get('percent') or 0.0,
+                'speed': self._format_speed(download.get('speed')),
+                'eta': self._format_eta(download.get('eta')),
+                'speed_bps': download.get('speed') or 0,
+                'eta_seconds': download.get('eta'),
+                'instance': instance.name,
+                'created_at': self._created_at(download)
+            })
+        
+        # 处理已结束的任务（已完成或失败）
+        for download in snapshot.done:
+            status, progress, error = self._done_state(download)
+            downloads.append({
+                'id': self._pool.compose_id(instance.name, download.get('id', download.get('url'))),
+                'platform': self.name,
+                'title': download.get('title', '未知标题'),
+                'url': download.get('url', ''),
+                'status': status,
+                'error': error,
+                'progress': progress,
+                'speed': '',
+                'eta': '',
+                'speed_bps': 0,
+                'eta_seconds': None,
+                'instance': instance.name,
+                'created_at': self._created_at(download)
+            })
         
         return downloads
     
+    @staticmethod
+    def _created_at(download: Dict[str, Any]) -> Optional[float]:
+        """任务的创建时间（Unix时间戳，秒）；Metube 的 timestamp 字段为添加任务时的纳秒时间戳"""
+        try:
+            return int(download['timestamp']) / 1e9
+        except (KeyError, TypeError, ValueError):
+            return None
+    
+    @staticmethod
+    def _done_state(download: Dict[str, Any]) -> Tuple[str, float, Optional[str]]:
+        """done 列表中任务的 (状态, 进度, 错误信息)
+        
+        Metube 把下载失败的任务也移入 done 列表（status 为 error，错误信息在 msg 中）。
+        """
+        if download.get('status') == 'error':
+            error = download.get('msg') or download.get('error') or 'Download failed'
+            return 'failed', download.get('percent') or 0.0, error
+        return 'completed', 100.0, None
+    
     def _map_status(self, metube_status: str) -> str:
         """映射Metube状态到统一状态"""
         status_map = {
@@ -435,6 +879,12 @@ class MetubeDownloadPlugin(DownloadPlugin):
         }
         return status_map.get(metube_status, 'downloading')
     
+    def get_backend_instances(self) -> List[Dict[str, Any]]:
+        pool = self._get_pool()
+        if list(pool.instances) == [DEFAULT_INSTANCE]:
+            return []
+        return [instance.to_dict() for instance in pool.instances.values()]
+    
     def get_web_ui_url(self) -> str:
         """获取Metube的Web UI地址"""
-        return self.config.get('metube_url', 'http://localhost:8081').rstrip('/')
+        return self._get_metube_url()
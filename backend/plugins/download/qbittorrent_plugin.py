@@ -1,12 +1,112 @@
-from typing import List
+from typing import List, Dict, Tuple, Any, Optional
 from base_plugin import DownloadPlugin
+from backend_pool import InstancePool, BackendInstance, DEFAULT_INSTANCE, ROUTING_STRATEGIES
 from models import ConfigField, DownloadTask
+from torrent_utils import magnet_infohash, source_url_for, torrent_infohash, BencodeError
 from logger import get_logger
 import httpx
+import asyncio
+import time
 
 logger = get_logger(__name__)
 
+# 单次 torrents/info 查询的种子数（hashes 参数放在 URL 中）
+INFO_BATCH_SIZE = 100
+# 下载 .torrent 文件的大小上限
+MAX_TORRENT_SIZE = 10 * 1024 * 1024
+
+
+class QBittorrentLoginError(Exception):
+    """qBittorrent 登录失败"""
+    pass
+
+
+class QBittorrentSession:
+    """qBittorrent 持久会话
+    
+    复用同一个 httpx 客户端保存 SID Cookie，只有在请求返回 403（会话过期）时才重新登录。
+    并发请求通过锁共享登录过程，一批同时过期的请求只会触发一次重新登录。
+    """
+    
+    def __init__(self, host: str, username: str, password: str):
+        self.host = host
+        self.username = username
+        self.password = password
+        self.client = httpx.AsyncClient(base_url=host, timeout=30.0)
+        self._lock = asyncio.Lock()
+        self._generation = 0  # 每次登录成功后递增
+        self._logged_in = False
+        
+        # 本地种子表：由 sync/maindata 增量同步，hash -> 种子信息
+        self.torrents: Dict[str, Dict[str, Any]] = {}
+        self.rid = 0
+        self.synced_at = 0.0
+        self.sync_lock = asyncio.Lock()
+    
+    async def _login(self, seen_generation: int):
+        """登录（若其他协程已在 seen_generation 之后完成登录则直接复用）"""
+        async with self._lock:
+            if self._logged_in and self._generation != seen_generation:
+                return
+            
+            logger.debug(f"[qBittorrent] 登录: {self.host}")
+            response = await self.client.post(
+                "/api/v2/auth/login",
+                data={"username": self.username, "password": self.password}
+            )
+            
+            # qBittorrent 登录失败时也可能返回 200 + "Fails."
+            if response.status_code != 200 or response.text.strip() == 'Fails.':
+                self._logged_in = False
+                raise QBittorrentLoginError(f"登录失败: {response.status_code} {response.text.strip()}")
+            
+            self._generation += 1
+            self._logged_in = True
+            logger.info(f"[qBittorrent] ✓ 登录成功: {self.host}")
+    
+    async def request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        """发送请求，会话过期时自动重新登录并重试一次"""
+        generation = self._generation
+        if not self._logged_in:
+            await self._login(generation)
+            generation = self._generation
+        
+        response = await self.client.request(method, path, **kwargs)
+        if response.status_code == 403:
+            logger.debug(f"[qBittorrent] 会话已过期，重新登录: {self.host}")
+            await self._login(generation)
+            response = await self.client.request(method, path, **kwargs)
+        
+        return response
+    
+    def apply_maindata(self, data: Dict[str, Any]):
+        """应用 sync/maindata 返回的数据（全量或增量）"""
+        torrents = data.get('torrents', {})
+        
+        if data.get('full_update'):
+            self.torrents = {}
+        
+        for torrent_hash, fields in torrents.items():
+            torrent = self.torrents.setdefault(torrent_hash, {'hash': torrent_hash})
+            torrent.update(fields)
+        
+        for torrent_hash in data.get('torrents_removed', []):
+            self.torrents.pop(torrent_hash, None)
+        
+        self.rid = data.get('rid', self.rid)
+        self.synced_at = time.monotonic()
+    
+    async def close(self):
+        await self.client.aclose()
+
+
 class QBittorrentDownloadPlugin(DownloadPlugin):
+
+    def __init__(self):
+        super().__init__()
+        # 按 (host, username) 复用会话
+        self._sessions: Dict[Tuple[str, str], QBittorrentSession] = {}
+        self._pool = InstancePool("qBittorrent")
     
     @property
     def name(self) -> str:
@@ -57,224 +157,504 @@ class QBittorrentDownloadPlugin(DownloadPlugin):
                 label="分类",
                 type="text",
                 default=""
+            ),
+            ConfigField(
+                name="tags",
+                label="标签",
+                type="text",
+                default="JustDownload",
+                description="提交的种子添加的标签（多个用逗号分隔），便于在 qBittorrent 中区分"
+            ),
+            ConfigField(
+                name="sync_interval",
+                label="同步间隔（秒）",
+                type="number",
+                default=1,
+                description="该时间内的查询复用本地种子表，不再请求 qBittorrent"
+            ),
+            ConfigField(
+                name="instances",
+                label="qBittorrent 实例列表",
+                type="list",
+                default=[],
+                description="多个 qBittorrent 实例时按路由策略分配新任务，不可用的实例暂时剔除；为空时只使用上面的地址",
+                fields=[
+                    {"name": "name", "label": "实例名称", "type": "text", "default": ""},
+                    {"name": "host", "label": "地址", "type": "text", "default": ""},
+                    {"name": "username", "label": "用户名", "type": "text", "default": "admin"},
+                    {"name": "password", "label": "密码", "type": "password", "default": ""},
+                    {"name": "enabled", "label": "启用", "type": "boolean", "default": True}
+                ]
+            ),
+            ConfigField(
+                name="routing",
+                label="路由策略",
+                type="select",
+                options=ROUTING_STRATEGIES,
+                default="least_active",
+                description="least_active: 活动任务最少的实例；throughput: 实测吞吐量最高的实例"
             )
+        ] + self._scheduling_config_fields()
+    
+    def _get_pool(self) -> InstancePool:
+        """按当前配置更新实例池，并在需要时后台执行健康检查"""
+        specs = []
+        for index, item in enumerate(self.config.get('instances') or []):
+            if not item.get('enabled', True) or not item.get('host'):
+                continue
+            name = str(item.get('name') or f"qb{index + 1}").replace('|', '_')
+            specs.append((name, item['host'].rstrip('/'), {
+                'username': item.get('username') or 'admin',
+                'password': item.get('password') or ''
+            }))
+        if not specs:
+            specs = [(DEFAULT_INSTANCE, self.config.get('host', 'http://localhost:8080').rstrip('/'), {
+                'username': self.config.get('username', 'admin'),
+                'password': self.config.get('password', '')
+            })]
+        
+        self._pool.configure(specs)
+        self._prune_sessions()
+        self._pool.maybe_check(self._check_instance)
+        return self._pool
+    
+    def _prune_sessions(self):
+        """关闭不再属于任何已配置实例的会话（实例被移除、地址或用户名变更）"""
+        configured = {
+            (instance.url, instance.options.get('username', 'admin'))
+            for instance in self._pool.instances.values()
+        }
+        for key in [key for key in self._sessions if key not in configured]:
+            session = self._sessions.pop(key)
+            logger.debug(f"[qBittorrent] 关闭会话: {session.host} ({session.username})")
+            asyncio.ensure_future(session.close())
+    
+    async def close(self):
+        """关闭所有会话"""
+        sessions = list(self._sessions.values())
+        self._sessions.clear()
+        await asyncio.gather(*(session.close() for session in sessions), return_exceptions=True)
+    
+    async def _check_instance(self, instance: BackendInstance):
+        """健康检查：登录并查询 qBittorrent 版本"""
+        response = await self._get_session(instance).request("GET", "/api/v2/app/version", timeout=10.0)
+        response.raise_for_status()
+    
+    def _choose_instance(self, tasks: List[DownloadTask]) -> BackendInstance:
+        """为任务选择实例：重新提交的任务沿用已分配的实例，否则按路由策略选择"""
+        pool = self._get_pool()
+        assigned = (tasks[0].metadata or {}).get('instance') if len(tasks) == 1 else None
+        if assigned in pool.instances and pool.instances[assigned].healthy:
+            return pool.instances[assigned]
+        return pool.choose(self.config.get('routing', 'least_active'), count=len(tasks))
+    
+    def _get_session(self, instance: Optional[BackendInstance] = None) -> QBittorrentSession:
+        """获取实例对应的持久会话（默认为未配置实例列表时的地址）"""
+        instance = instance or self._get_pool().get(DEFAULT_INSTANCE)
+        host = instance.url
+        username = instance.options.get('username', 'admin')
+        password = instance.options.get('password', '')
+        
+        key = (host, username)
+        session = self._sessions.get(key)
+        if session is None:
+            session = QBittorrentSession(host, username, password)
+            self._sessions[key] = session
+        elif session.password != password:
+            # 密码变更后下次 403 时使用新密码登录
+            session.password = password
+        return session
+    
+    def _invalidate_sync(self, instance: BackendInstance):
+        """添加/删除种子后，下次查询立即同步"""
+        self._get_session(instance).synced_at = 0.0
+    
+    def _submitted_updates(self, task: DownloadTask, instance: BackendInstance,
+                           infohash: Optional[str]) -> Dict[str, Any]:
+        """提交成功后的任务更新：记录所在实例和种子 hash"""
+        metadata = task.metadata.copy() if task.metadata else {}
+        metadata['instance'] = instance.name
+        updates = {'status': 'downloading', 'metadata': metadata}
+        if infohash:
+            metadata['torrent_hash'] = infohash
+            metadata['infohash'] = infohash
+            updates['source_url'] = source_url_for(task.url, infohash)
+        else:
+            logger.warning(f"[qBittorrent] 无法计算种子 hash，任务进度将无法查询: {task.url}")
+        updates['platform_id'] = self.get_platform_id(metadata)
+        return updates
+    
+    async def _resolve_torrent(self, task: DownloadTask) -> Tuple[Optional[str], Optional[bytes]]:
+        """在本地计算任务的 infohash，返回 (infohash, 种子文件内容)
+        
+        磁力链接从 xt=urn:btih 解析；.torrent 链接优先使用创建任务时去重计算的 infohash，
+        否则下载种子文件计算，并把文件直接上传给 qBittorrent（不再让 qBittorrent 下载一次）。
+        """
+        infohash = (task.metadata or {}).get('infohash') or magnet_infohash(task.url)
+        if infohash:
+            return infohash.lower(), None
+        if not task.url.startswith(('http://', 'https://')):
+            return None, None
+        
+        try:
+            async with httpx.AsyncClient(timeout=30.0, follow_redirects=True) as client:
+                response = await client.get(task.url)
+            response.raise_for_status()
+            if len(response.content) > MAX_TORRENT_SIZE:
+                raise BencodeError(f"种子文件过大: {len(response.content)} 字节")
+            return torrent_infohash(response.content), response.content
+        except (httpx.HTTPError, BencodeError) as e:
+            logger.warning(f"[qBittorrent] 下载种子文件失败，交给 qBittorrent 处理: {task.url} - {e}")
+            return None, None
+    
+    def _add_request(self, items: List[Tuple[DownloadTask, Optional[bytes]]]) -> Dict[str, Any]:
+        """构建 torrents/add 请求：链接放在 urls 中，已下载的种子文件以 multipart 上传"""
+        data = {
+            "savepath": self.config.get('download_path', '/downloads/torrents'),
+            "category": self.config.get('category', ''),
+            "tags": self.config.get('tags', 'JustDownload')
+        }
+        urls = [task.url for task, content in items if content is None]
+        if urls:
+            data["urls"] = "\n".join(urls)
+        
+        files = [
+            ('torrents', (f"{task.id}.torrent", content, 'application/x-bittorrent'))
+            for task, content in items if content is not None
         ]
+        return {'data': data, 'files': files} if files else {'data': data}
     
     async def download(self, task: DownloadTask) -> bool:
-        host = self.config.get('host', 'http://localhost:8080')
-        
         # 获取数据库实例
-        from database import get_database
-        db = get_database()
+        from database import get_async_database
+        db = get_async_database()
         
         logger.info(f"[qBittorrent] 开始下载任务: {task.title}")
         logger.debug(f"[qBittorrent] 任务ID: {task.id}")
         logger.debug(f"[qBittorrent] URL: {task.url}")
         
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            try:
-                login_response = await client.post(
-                    f"{host}/api/v2/auth/login",
-                    data={
-                        "username": self.config.get('username', 'admin'),
-                        "password": self.config.get('password', '')
-                    }
-                )
-                
-                if login_response.status_code != 200:
-                    logger.error(f"[qBittorrent] 登录失败")
-                    db.update_task(task.id, {'status': 'failed'})
-                    return False
-                
-                add_response = await client.post(
-                    f"{host}/api/v2/torrents/add",
-                    data={
-                        "urls": task.url,
-                        "savepath": self.config.get('download_path', '/downloads/torrents'),
-                        "category": self.config.get('category', '')
-                    }
-                )
-                
-                if add_response.status_code == 200:
-                    logger.info(f"[qBittorrent] ✓ 下载任务添加成功: {task.id}")
-                    db.update_task(task.id, {'status': 'downloading'})
-                    return True
-                else:
-                    logger.error(f"[qBittorrent] 添加任务失败: {add_response.status_code}")
-                    db.update_task(task.id, {'status': 'failed'})
-                    return False
-                    
-            except Exception as e:
-                logger.error(f"[qBittorrent] ✗ 下载异常: {e}", exc_info=True)
-                db.update_task(task.id, {'status': 'failed'})
+        instance = self._choose_instance([task])
+        logger.debug(f"[qBittorrent] 实例: {instance.name} ({instance.url})")
+        
+        try:
+            infohash, content = await self._resolve_torrent(task)
+            logger.debug(f"[qBittorrent] infohash: {infohash}")
+            
+            session = self._get_session(instance)
+            add_response = await session.request(
+                "POST",
+                "/api/v2/torrents/add",
+                **self._add_request([(task, content)])
+            )
+            
+            self._pool.mark_success(instance.name)
+            if add_response.status_code == 200 and add_response.text.strip() != 'Fails.':
+                self._invalidate_sync(instance)
+                logger.info(f"[qBittorrent] ✓ 下载任务添加成功: {task.id}")
+                await db.update_task(task.id, self._submitted_updates(task, instance, infohash))
+                return True
+            else:
+                logger.error(f"[qBittorrent] 添加任务失败: {add_response.status_code}")
+                await db.update_task(task.id, {'status': 'failed'})
                 return False
+        
+        except QBittorrentLoginError as e:
+            logger.error(f"[qBittorrent] {e}")
+            self._pool.mark_failure(instance.name, str(e))
+            await db.update_task(task.id, {'status': 'failed'})
+            return False
+        
+        except httpx.TransportError as e:
+            logger.error(f"[qBittorrent] ✗ 无法连接 {instance.url}: {e}")
+            self._pool.mark_failure(instance.name, str(e) or type(e).__name__)
+            await db.update_task(task.id, {'status': 'failed'})
+            return False
+        
+        except Exception as e:
+            logger.error(f"[qBittorrent] ✗ 下载异常: {e}", exc_info=True)
+            await db.update_task(task.id, {'status': 'failed'})
+            return False
+    
+    async def download_batch(self, tasks: List[DownloadTask]) -> Dict[str, bool]:
+        """批量提交：链接以换行分隔放在 urls 中、种子文件以 multipart 上传，一次请求提交全部任务"""
+        from database import get_async_database
+        db = get_async_database()
+        
+        if not tasks:
+            return {}
+        
+        logger.info(f"[qBittorrent] 批量提交 {len(tasks)} 个下载任务")
+        
+        instance = self._choose_instance(tasks)
+        resolved = await asyncio.gather(*(self._resolve_torrent(task) for task in tasks))
+        
+        success = False
+        try:
+            add_response = await self._get_session(instance).request(
+                "POST",
+                "/api/v2/torrents/add",
+                **self._add_request([(task, content) for task, (_, content) in zip(tasks, resolved)])
+            )
+            
+            # 全部添加失败时 qBittorrent 返回 "Fails."
+            success = add_response.status_code == 200 and add_response.text.strip() != 'Fails.'
+            self._pool.mark_success(instance.name)
+            if not success:
+                logger.error(f"[qBittorrent] 批量添加任务失败: {add_response.status_code} {add_response.text.strip()}")
+        
+        except (QBittorrentLoginError, httpx.TransportError) as e:
+            logger.error(f"[qBittorrent] 批量提交到 {instance.name} 失败: {e}")
+            self._pool.mark_failure(instance.name, str(e) or type(e).__name__)
+        
+        except Exception as e:
+            logger.error(f"[qBittorrent] ✗ 批量下载异常: {e}", exc_info=True)
+        
+        if success:
+            self._invalidate_sync(instance)
+            await db.update_tasks({
+                task.id: self._submitted_updates(task, instance, infohash)
+                for task, (infohash, _) in zip(tasks, resolved)
+            })
+            logger.info(f"[qBittorrent] ✓ 批量添加成功: {len(tasks)} 个任务 (实例 {instance.name})")
+        else:
+            await db.update_tasks({task.id: {'status': 'failed'} for task in tasks})
+        
+        return {task.id: success for task in tasks}
     
     async def get_progress(self, torrent_hash: str) -> dict:
-        """获取下载进度
+        """获取下载进度（与批量查询相同：本地种子表在同步间隔内时直接读取，否则按 hash 查询）
         
         Args:
             torrent_hash: qBittorrent的种子hash
-            
+        
         Returns:
             dict: {'progress': float, 'status': str, 'error': str}
         """
-        host = self.config.get('host', 'http://localhost:8080')
+        results = await self.get_progress_batch([torrent_hash])
+        return results.get(torrent_hash, {'progress': 0.0, 'status': 'unknown', 'error': None})
+    
+    async def _sync(self, instance: BackendInstance) -> Dict[str, Dict[str, Any]]:
+        """通过 sync/maindata 增量同步本地种子表
         
-        try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                # 登录
-                await client.post(
-                    f"{host}/api/v2/auth/login",
-                    data={
-                        "username": self.config.get('username', 'admin'),
-                        "password": self.config.get('password', '')
+        每次请求携带上次返回的 rid，qBittorrent 只返回变化的字段；
+        返回 full_update 时整体替换本地表。同步间隔内的并发调用复用同一次同步结果。
+        """
+        session = self._get_session(instance)
+        interval = self._get_config_float('sync_interval', 1.0)
+        
+        async with session.sync_lock:
+            if time.monotonic() - session.synced_at < interval:
+                return session.torrents
+            
+            response = await session.request(
+                "GET",
+                "/api/v2/sync/maindata",
+                params={"rid": session.rid},
+                timeout=10.0
+            )
+            response.raise_for_status()
+            data = response.json()
+            session.apply_maindata(data)
+            
+            if data.get('full_update'):
+                logger.debug(f"[qBittorrent] 全量同步: {len(session.torrents)} 个种子, rid={session.rid}")
+            else:
+                logger.debug(f"[qBittorrent] 增量同步: {len(data.get('torrents', {}))} 个变化, rid={session.rid}")
+        
+        return session.torrents
+    
+    async def _query_torrents(self, instance: BackendInstance, torrent_hashes: List[str]) -> Dict[str, Dict[str, Any]]:
+        """按 hash 查询种子（torrents/info?hashes=a|b|c）
+        
+        本地种子表在同步间隔内时直接读取，只查询表中没有的 hash（上次同步后添加的种子）；
+        否则只查询这些 hash，不必列出 qBittorrent 中的所有种子。查询结果同时更新本地种子表。
+        """
+        session = self._get_session(instance)
+        torrents = {}
+        if time.monotonic() - session.synced_at < self._get_config_float('sync_interval', 1.0):
+            torrents = {h: session.torrents[h] for h in torrent_hashes if h in session.torrents}
+            torrent_hashes = [h for h in torrent_hashes if h not in torrents]
+        
+        for start in range(0, len(torrent_hashes), INFO_BATCH_SIZE):
+            response = await session.request(
+                "GET",
+                "/api/v2/torrents/info",
+                params={"hashes": "|".join(torrent_hashes[start:start + INFO_BATCH_SIZE])},
+                timeout=10.0
+            )
+            response.raise_for_status()
+            for torrent in response.json():
+                torrents[torrent['hash']] = torrent
+                session.torrents.setdefault(torrent['hash'], {}).update(torrent)
+        return torrents
+    
+    async def get_progress_batch(self, platform_ids: List[str]) -> Dict[str, dict]:
+        """批量获取下载进度（按实例分组，每个实例一次按 hash 查询）"""
+        results = {}
+        if not platform_ids:
+            return results
+        
+        pool = self._get_pool()
+        groups: Dict[str, List[Tuple[str, str]]] = {}
+        for platform_id in platform_ids:
+            instance, torrent_hash = pool.split_id(platform_id)
+            groups.setdefault(instance.name, []).append((platform_id, torrent_hash.lower()))
+        
+        for name, items in groups.items():
+            try:
+                torrents = await self._query_torrents(pool.instances[name], [h for _, h in items])
+            except Exception as e:
+                logger.error(f"[qBittorrent] 获取进度失败 ({name}): {e}")
+                continue
+            
+            for platform_id, torrent_hash in items:
+                torrent = torrents.get(torrent_hash)
+                if torrent:
+                    results[platform_id] = {
+                        'progress': torrent.get('progress', 0.0) * 100,
+                        'status': self._map_status(torrent.get('state', 'unknown')),
+                        'error': None
                     }
-                )
-                
-                # 获取种子信息
-                response = await client.get(
-                    f"{host}/api/v2/torrents/info",
-                    params={"hashes": torrent_hash}
-                )
-                
-                if response.status_code == 200:
-                    torrents = response.json()
-                    if torrents:
-                        torrent = torrents[0]
-                        progress = torrent.get('progress', 0.0) * 100
-                        state = torrent.get('state', 'unknown')
-                        
-                        # 映射qBittorrent状态
-                        status_map = {
-                            'downloading': 'downloading',
-                            'uploading': 'completed',
-                            'pausedDL': 'paused',
-                            'pausedUP': 'completed',
-                            'error': 'failed',
-                            'missingFiles': 'failed',
-                            'queuedDL': 'pending',
-                            'queuedUP': 'completed'
-                        }
-                        
-                        status = status_map.get(state, 'downloading')
-                        
-                        return {
-                            'progress': progress,
-                            'status': status,
-                            'error': None
-                        }
-                        
-        except Exception as e:
-            logger.error(f"[qBittorrent] 获取进度失败: {e}")
         
-        return {'progress': 0.0, 'status': 'unknown', 'error': None}
+        return results
     
-    async def cancel(self, torrent_hash: str) -> bool:
+    def get_platform_id(self, metadata: Dict[str, Any]) -> Optional[str]:
+        torrent_hash = metadata.get('torrent_hash')
+        if not torrent_hash:
+            return None
+        return self._pool.compose_id(metadata.get('instance'), torrent_hash)
+    
+    async def cancel(self, platform_id: str) -> bool:
         """取消/删除下载任务
         
         Args:
-            torrent_hash: qBittorrent的种子hash
-            
+            platform_id: qBittorrent的种子hash，多实例时带有实例名前缀
+        
         Returns:
             bool: 是否成功取消
         """
-        host = self.config.get('host', 'http://localhost:8080')
+        results = await self.cancel_batch([platform_id])
+        return results.get(platform_id, False)
+    
+    async def cancel_batch(self, platform_ids: List[str]) -> Dict[str, bool]:
+        """批量取消：每个实例一次 torrents/delete 请求（hashes=a|b|c），同时删除文件"""
+        return await self._delete(platform_ids, delete_files=True)
+    
+    async def prepare_retry(self, platform_ids: List[str]) -> Dict[str, bool]:
+        """重新提交前删除旧种子但保留文件，重新添加后 qBittorrent 校验已下载的数据并继续"""
+        return await self._delete(platform_ids, delete_files=False)
+    
+    async def _delete(self, platform_ids: List[str], delete_files: bool) -> Dict[str, bool]:
+        results = {platform_id: False for platform_id in platform_ids}
         
-        logger.info(f"[qBittorrent] 取消任务: {torrent_hash}")
+        pool = self._get_pool()
+        groups: Dict[str, List[Tuple[str, str]]] = {}
+        for platform_id in platform_ids:
+            instance, torrent_hash = pool.split_id(platform_id)
+            groups.setdefault(instance.name, []).append((platform_id, torrent_hash))
         
-        try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                # 登录
-                await client.post(
-                    f"{host}/api/v2/auth/login",
-                    data={
-                        "username": self.config.get('username', 'admin'),
-                        "password": self.config.get('password', '')
-                    }
-                )
-                
-                # 删除种子
-                response = await client.post(
-                    f"{host}/api/v2/torrents/delete",
+        for name, items in groups.items():
+            instance = pool.instances[name]
+            logger.info(f"[qBittorrent] 删除 {len(items)} 个种子 (实例 {name}, 删除文件: {delete_files})")
+            
+            try:
+                response = await self._get_session(instance).request(
+                    "POST",
+                    "/api/v2/torrents/delete",
                     data={
-                        "hashes": torrent_hash,
-                        "deleteFiles": "true"
-                    }
+                        "hashes": "|".join(torrent_hash for _, torrent_hash in items),
+                        "deleteFiles": "true" if delete_files else "false"
+                    },
+                    timeout=10.0
                 )
                 
                 if response.status_code == 200:
-                    logger.info(f"[qBittorrent] ✓ 任务取消成功: {torrent_hash}")
-                    return True
+                    self._invalidate_sync(instance)
+                    for platform_id, _ in items:
+                        results[platform_id] = True
                 else:
-                    logger.error(f"[qBittorrent] 取消任务失败: {response.status_code}")
-                    return False
-                    
-        except Exception as e:
-            logger.error(f"[qBittorrent] ✗ 取消任务异常: {e}", exc_info=True)
-            return False
+                    logger.error(f"[qBittorrent] 删除种子失败: {response.status_code}")
+            
+            except Exception as e:
+                logger.error(f"[qBittorrent] ✗ 删除种子异常 ({name}): {e}", exc_info=True)
+        
+        return results
     
     async def get_downloads(self) -> list:
-        """获取qBittorrent平台的所有下载记录"""
-        host = self.config.get('host', 'http://localhost:8080')
-        
+        """获取所有 qBittorrent 实例的下载记录，同时更新各实例的负载统计"""
         logger.debug(f"[qBittorrent] 获取下载列表")
         
+        pool = self._get_pool()
+        results = await asyncio.gather(
+            *(self._get_instance_downloads(instance) for instance in list(pool.instances.values()))
+        )
+        downloads = [download for result in results for download in result]
+        
+        logger.info(f"[qBittorrent] 获取到 {len(downloads)} 条下载记录")
+        return downloads
+    
+    async def _get_instance_downloads(self, instance: BackendInstance) -> list:
+        """获取单个实例的下载记录（从本地种子表读取）；实例不可用时记录失败并返回空列表"""
         downloads = []
         
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                # 登录
-                login_response = await client.post(
-                    f"{host}/api/v2/auth/login",
-                    data={
-                        "username": self.config.get('username', 'admin'),
-                        "password": self.config.get('password', '')
-                    }
-                )
-                
-                if login_response.status_code != 200:
-                    logger.error(f"[qBittorrent] 登录失败")
-                    return downloads
-                
-                # 获取所有种子
-                response = await client.get(f"{host}/api/v2/torrents/info")
-                
-                if response.status_code == 200:
-                    torrents = response.json()
-                    
-                    for torrent in torrents:
-                        # 映射状态
-                        state = torrent.get('state', 'unknown')
-                        status = self._map_status(state)
-                        
-                        # 计算进度（qBittorrent返回0-1的小数）
-                        progress = torrent.get('progress', 0.0) * 100
-                        
-                        # 格式化速度
-                        speed = self._format_speed(torrent.get('dlspeed', 0))
-                        
-                        # 格式化ETA
-                        eta = self._format_eta(torrent.get('eta', 0))
-                        
-                        downloads.append({
-                            'id': torrent.get('hash'),
-                            'platform': self.name,
-                            'title': torrent.get('name', '未知标题'),
-                            'url': torrent.get('magnet_uri', ''),
-                            'status': status,
-                            'progress': progress,
-                            'speed': speed,
-                            'eta': eta,
-                            'created_at': torrent.get('added_on')  # Unix时间戳
-                        })
-                    
-                    logger.info(f"[qBittorrent] 获取到 {len(downloads)} 条下载记录")
-                else:
-                    logger.error(f"[qBittorrent] 获取下载列表失败: {response.status_code}")
-                    
+            torrents = await self._sync(instance)
+        
+        except QBittorrentLoginError as e:
+            logger.error(f"[qBittorrent] {e}")
+            self._pool.mark_failure(instance.name, str(e))
+            return downloads
+        
+        except httpx.HTTPStatusError as e:
+            logger.error(f"[qBittorrent] 获取下载列表失败 ({instance.name}): {e.response.status_code}")
+            self._pool.mark_failure(instance.name, f"HTTP {e.response.status_code}")
+            return downloads
+        
+        except httpx.TransportError as e:
+            logger.warning(f"[qBittorrent] 无法连接实例 {instance.name} ({instance.url}): {e}")
+            self._pool.mark_failure(instance.name, str(e) or type(e).__name__)
+            return downloads
+        
         except Exception as e:
-            logger.error(f"[qBittorrent] 获取下载列表异常: {e}", exc_info=True)
+            logger.error(f"[qBittorrent] 获取下载列表异常 ({instance.name}): {e}", exc_info=True)
+            self._pool.mark_failure(instance.name, str(e) or type(e).__name__)
+            return downloads
+        
+        self._pool.mark_success(instance.name)
         
+        active = 0
+        total_speed = 0
+        for torrent in torrents.values():
+            # 映射状态
+            state = torrent.get('state', 'unknown')
+            status = self._map_status(state)
+            
+            # 计算进度（qBittorrent返回0-1的小数）
+            progress = torrent.get('progress', 0.0) * 100
+            
+            speed_bps = torrent.get('dlspeed', 0) or 0
+            eta_seconds = torrent.get('eta', 0) or 0
+            
+            if status in ('downloading', 'pending'):
+                active += 1
+                total_speed += speed_bps
+            
+            downloads.append({
+                'id': self._pool.compose_id(instance.name, torrent.get('hash')),
+                'platform': self.name,
+                'title': torrent.get('name', '未知标题'),
+                'url': torrent.get('magnet_uri', ''),
+                'status': status,
+                'progress': progress,
+                'speed': self._format_speed(speed_bps),
+                'eta': self._format_eta(eta_seconds),
+                'speed_bps': speed_bps,
+                'eta_seconds': eta_seconds if 0 < eta_seconds < 8640000 else None,
+                'instance': instance.name,
+                'created_at': torrent.get('added_on')  # Unix时间戳
+            })
+        
+        self._pool.report_load(instance.name, active, total_speed)
         return downloads
     
     def _map_status(self, qb_state: str) -> str:
@@ -296,33 +676,11 @@ class QBittorrentDownloadPlugin(DownloadPlugin):
         }
         return status_map.get(qb_state, 'downloading')
     
-    def _format_speed(self, speed_bytes: int) -> str:
-        """格式化速度（字节/秒 -> 可读格式）"""
-        if speed_bytes == 0:
-            return ''
-        
-        units = ['B/s', 'KB/s', 'MB/s', 'GB/s']
-        unit_index = 0
-        speed = float(speed_bytes)
-        
-        while speed >= 1024 and unit_index < len(units) - 1:
-            speed /= 1024
-            unit_index += 1
-        
-        return f"{speed:.1f} {units[unit_index]}"
-    
-    def _format_eta(self, eta_seconds: int) -> str:
-        """格式化ETA（秒 -> 可读格式）"""
-        if eta_seconds <= 0 or eta_seconds == 8640000:  # 8640000 表示无限大
-            return ''
-        
-        hours = eta_seconds // 3600
-        minutes = (eta_seconds % 3600) // 60
-        
-        if hours > 0:
-            return f"{hours}h {minutes}m"
-        else:
-            return f"{minutes}m"
+    def get_backend_instances(self) -> List[Dict[str, Any]]:
+        pool = self._get_pool()
+        if list(pool.instances) == [DEFAULT_INSTANCE]:
+            return []
+        return [instance.to_dict() for instance in pool.instances.values()]
     
     def get_web_ui_url(self) -> str:
         """获取qBittorrent的Web UI地址"""
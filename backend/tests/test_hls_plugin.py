@@ -0,0 +1,180 @@
+"""HLS 下载插件测试（本地 HTTP 服务器）
+
+运行（在 backend 目录下）:
+    python -m pytest tests/test_hls_plugin.py
+"""
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+except ImportError:  # 加密分片需要可选依赖 cryptography
+    raise unittest.SkipTest("需要安装 cryptography（见 hls_requirements.txt）")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from plugins.download import hls_plugin
+from plugins.download.hls_plugin import HLSDownloadPlugin, HLSJob
+
+KEY = bytes(range(16))
+IV = bytes(range(16, 32))
+SEGMENTS = [bytes([i]) * (1000 + i * 37) for i in range(4)]  # 明文分片内容
+
+
+def encrypt(data: bytes, iv: bytes) -> bytes:
+    pad = 16 - len(data) % 16
+    encryptor = Cipher(algorithms.AES(KEY), modes.CBC(iv)).encryptor()
+    return encryptor.update(data + bytes([pad]) * pad) + encryptor.finalize()
+
+
+MASTER = """#EXTM3U
+#EXT-X-STREAM-INF:BANDWIDTH=400000,RESOLUTION=640x360
+360/index.m3u8
+#EXT-X-STREAM-INF:BANDWIDTH=1500000,RESOLUTION=1280x720
+720/index.m3u8
+#EXT-X-STREAM-INF:BANDWIDTH=4000000,RESOLUTION=1920x1080
+1080/index.m3u8
+"""
+
+# 分片 0、1 不加密；分片 2 使用指定的 IV；分片 3 未指定 IV，使用分片序号
+MEDIA = f"""#EXTM3U
+#EXT-X-TARGETDURATION:4
+#EXT-X-MEDIA-SEQUENCE:0
+#EXTINF:4.0,
+seg0.ts
+#EXTINF:4.0,
+seg1.ts
+#EXT-X-KEY:METHOD=AES-128,URI="key.bin",IV=0x{IV.hex()}
+#EXTINF:4.0,
+seg2.ts
+#EXT-X-KEY:METHOD=AES-128,URI="key.bin"
+#EXTINF:4.0,
+seg3.ts
+#EXT-X-ENDLIST
+"""
+
+FILES = {
+    '/master.m3u8': MASTER.encode(),
+    '/720/index.m3u8': MEDIA.encode(),
+    '/720/key.bin': KEY,
+    '/720/seg0.ts': SEGMENTS[0],
+    '/720/seg1.ts': SEGMENTS[1],
+    '/720/seg2.ts': encrypt(SEGMENTS[2], IV),
+    '/720/seg3.ts': encrypt(SEGMENTS[3], (3).to_bytes(16, 'big')),
+}
+
+
+class PlaylistHandler(BaseHTTPRequestHandler):
+    """返回 FILES 中的内容并记录请求的路径，其他路径返回 404"""
+    
+    protocol_version = 'HTTP/1.1'
+    
+    def do_GET(self):
+        with self.server.lock:
+            self.server.requests.append(self.path)
+        body = FILES.get(self.path)
+        if body is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        pass
+
+
+class HLSPluginTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self._state_dir = hls_plugin.STATE_DIR
+        hls_plugin.STATE_DIR = os.path.join(self.tmp.name, 'state')
+        
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), PlaylistHandler)
+        self.server.lock = threading.Lock()
+        self.server.requests = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/master.m3u8"
+        
+        self.plugin = HLSDownloadPlugin()
+        self.plugin.config = {'default_quality': '720p', 'concurrency': 3, 'retries': 0, 'output_format': 'ts'}
+    
+    async def asyncTearDown(self):
+        await self.plugin._get_client().aclose()
+    
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        hls_plugin.STATE_DIR = self._state_dir
+        self.tmp.cleanup()
+    
+    def new_job(self, job_id: str) -> HLSJob:
+        return HLSJob(job_id, self.url, 'video', os.path.join(self.tmp.name, job_id))
+    
+    def read_result(self, job: HLSJob) -> bytes:
+        with open(job.result_file, 'rb') as f:
+            return f.read()
+    
+    async def test_select_variant_decrypt_and_concat(self):
+        job = self.new_job('job-full')
+        await self.plugin._run(job)
+        
+        self.assertEqual(job.status, 'completed', job.error)
+        self.assertEqual(job.result_file, f"{job.output}.ts")
+        self.assertEqual(self.read_result(job), b''.join(SEGMENTS))
+        self.assertFalse(os.path.exists(job.parts_dir))
+        
+        requests = self.server.requests
+        self.assertIn('/720/index.m3u8', requests)
+        self.assertNotIn('/360/index.m3u8', requests)
+        self.assertNotIn('/1080/index.m3u8', requests)
+        # 同一个密钥只下载一次
+        self.assertEqual(requests.count('/720/key.bin'), 1)
+    
+    async def test_resume_from_bitmap(self):
+        job = self.new_job('job-resume')
+        job.segments = await self.plugin._load_playlist(self.url)
+        job.bitmap = bytearray(len(job.segments))
+        os.makedirs(job.parts_dir)
+        for index in (0, 2):
+            with open(job.segment_path(index), 'wb') as f:
+                f.write(SEGMENTS[index])
+            job.bitmap[index] = 1
+        job.save()
+        
+        # 模拟重启：从状态文件恢复任务
+        resumed = HLSJob.from_dict(job.to_dict())
+        self.assertEqual(list(resumed.bitmap), [1, 0, 1, 0])
+        self.server.requests.clear()
+        
+        await self.plugin._run(resumed)
+        
+        self.assertEqual(resumed.status, 'completed', resumed.error)
+        self.assertEqual(self.read_result(resumed), b''.join(SEGMENTS))
+        fetched = sorted(path for path in self.server.requests if path.endswith('.ts'))
+        self.assertEqual(fetched, ['/720/seg1.ts', '/720/seg3.ts'])
+    
+    async def test_failed_segment_stops_workers(self):
+        job = self.new_job('job-failed')
+        job.segments = await self.plugin._load_playlist(self.url)
+        job.segments[1]['uri'] = job.segments[1]['uri'].replace('seg1.ts', 'missing.ts')
+        job.bitmap = bytearray(len(job.segments))
+        
+        await self.plugin._run(job)
+        
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('missing.ts', job.error)
+        self.assertEqual(job.bitmap[1], 0)
+        self.assertFalse(os.path.exists(f"{job.output}.ts"))
+
+
+if __name__ == '__main__':
+    unittest.main()
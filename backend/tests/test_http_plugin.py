@@ -0,0 +1,124 @@
+"""HTTP 多连接下载插件测试（本地 HTTP 服务器）
+
+运行（在 backend 目录下）:
+    python -m pytest tests/test_http_plugin.py
+"""
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from plugins.download import http_plugin
+from plugins.download.http_plugin import HTTPDownloadPlugin, HTTPJob
+
+CHUNK = 1024 * 1024
+CONTENT = bytes(i % 251 for i in range(CHUNK * 5 // 2))  # 3 块，最后一块为半块
+ETAG = '"test-etag"'
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """支持 Range 的文件服务；fail_once 中的起始偏移第一次请求时只发送一半内容后断开连接"""
+    
+    protocol_version = 'HTTP/1.1'
+    
+    def do_GET(self):
+        server = self.server
+        header = self.headers.get('Range', '')
+        start, _, end = header[len('bytes='):].partition('-')
+        start, end = int(start), min(int(end), len(CONTENT) - 1)
+        with server.lock:
+            server.ranges.append((start, end))
+            fail = start in server.fail_once
+            server.fail_once.discard(start)
+        
+        body = CONTENT[start:end + 1]
+        self.send_response(206)
+        self.send_header('Content-Range', f"bytes {start}-{end}/{len(CONTENT)}")
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', ETAG)
+        self.end_headers()
+        if fail:
+            self.wfile.write(body[:len(body) // 2])
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        pass
+
+
+class HTTPPluginTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self._state_dir = http_plugin.STATE_DIR
+        http_plugin.STATE_DIR = os.path.join(self.tmp.name, 'state')
+        
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), RangeHandler)
+        self.server.lock = threading.Lock()
+        self.server.ranges = []
+        self.server.fail_once = set()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/video.mp4"
+        
+        self.plugin = HTTPDownloadPlugin()
+        self.plugin.config = {'chunk_size_mb': 1, 'connections': 2, 'retries': 2}
+    
+    async def asyncTearDown(self):
+        await self.plugin._get_client().aclose()
+    
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        http_plugin.STATE_DIR = self._state_dir
+        self.tmp.cleanup()
+    
+    def chunk_requests(self):
+        """块请求的起始偏移（不含探测请求 bytes=0-0）"""
+        return [start for start, end in self.server.ranges if (start, end) != (0, 0)]
+    
+    def read_target(self, job: HTTPJob) -> bytes:
+        with open(job.target, 'rb') as f:
+            return f.read()
+    
+    async def test_download_ranges(self):
+        job = HTTPJob('job-full', self.url, 'video', self.tmp.name)
+        await self.plugin._run(job)
+        
+        self.assertEqual(job.status, 'completed', job.error)
+        self.assertEqual(self.read_target(job), CONTENT)
+        self.assertEqual(sorted(self.chunk_requests()), [0, CHUNK, 2 * CHUNK])
+    
+    async def test_resume_skips_finished_chunks(self):
+        job = HTTPJob('job-resume', self.url, 'video', self.tmp.name)
+        await self.plugin._prepare(job)
+        with open(job.part_path, 'r+b') as f:
+            f.write(CONTENT[:CHUNK])
+        job.mark_chunk_done(0)
+        job.save()
+        self.server.ranges.clear()
+        
+        await self.plugin._run(job)
+        
+        self.assertEqual(job.status, 'completed', job.error)
+        self.assertEqual(self.read_target(job), CONTENT)
+        self.assertEqual(sorted(self.chunk_requests()), [CHUNK, 2 * CHUNK])
+    
+    async def test_chunk_retry(self):
+        self.server.fail_once.add(CHUNK)
+        job = HTTPJob('job-retry', self.url, 'video', self.tmp.name)
+        await self.plugin._run(job)
+        
+        self.assertEqual(job.status, 'completed', job.error)
+        self.assertEqual(self.read_target(job), CONTENT)
+        self.assertEqual(self.chunk_requests().count(CHUNK), 2)
+        # 重试前扣除失败请求已接收的字节，速度统计的字节数等于文件大小
+        self.assertEqual(job._bytes_done, len(CONTENT))
+
+
+if __name__ == '__main__':
+    unittest.main()
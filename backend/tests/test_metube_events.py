@@ -0,0 +1,146 @@
+"""Metube 事件流镜像测试（本地 socket.io 服务器模拟 Metube）
+
+运行（在 backend 目录下）:
+    python -m pytest tests/test_metube_events.py
+"""
+import asyncio
+import json
+import os
+import sys
+import unittest
+
+try:
+    import socketio
+    from aiohttp import web
+except ImportError:  # 事件流需要可选依赖 python-socketio 和 aiohttp
+    raise unittest.SkipTest("需要安装 python-socketio 和 aiohttp（见 metube_requirements.txt）")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from plugins.download.metube_plugin import MetubeDownloadPlugin
+
+HISTORY = {
+    'queue': [{'id': 'a', 'url': 'https://v/a', 'title': 'A', 'status': 'downloading', 'percent': 10.0}],
+    'done': [{'id': 'b', 'url': 'https://v/b', 'title': 'B', 'status': 'finished', 'timestamp': 1700000000500000000}],
+}
+
+
+async def wait_for(condition, timeout: float = 5.0):
+    """等待条件成立（轮询）"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not condition():
+        if loop.time() > deadline:
+            raise AssertionError("等待超时")
+        await asyncio.sleep(0.02)
+
+
+class MetubeEventsTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.sio = socketio.AsyncServer(async_mode='aiohttp')
+        self.sids = []
+        self.history_requests = 0
+        
+        @self.sio.event
+        async def connect(sid, environ):
+            self.sids.append(sid)
+        
+        async def history(request):
+            self.history_requests += 1
+            return web.json_response(HISTORY)
+        
+        app = web.Application()
+        self.sio.attach(app)
+        app.router.add_get('/history', history)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}"
+        
+        self.plugin = MetubeDownloadPlugin()
+        self.plugin.config = {'metube_url': self.url, 'event_stream': True, 'history_ttl': 0}
+        self.plugin._get_pool()
+        self.mirror = self.plugin._mirrors[self.url]
+        await wait_for(lambda: self.mirror.synced)
+    
+    async def asyncTearDown(self):
+        for mirror in self.plugin._mirrors.values():
+            task = mirror._task
+            mirror.stop()
+            if task is not None:
+                await asyncio.gather(task, return_exceptions=True)
+        await self.plugin._get_client().aclose()
+        await self.runner.cleanup()
+    
+    async def emit(self, event: str, data):
+        """以 Metube 的格式（JSON 字符串）推送事件"""
+        await self.sio.emit(event, json.dumps(data))
+    
+    async def test_initial_sync_from_history(self):
+        self.assertEqual(set(self.mirror.queue), {'https://v/a'})
+        self.assertEqual(set(self.mirror.done), {'https://v/b'})
+        # 已同步时读取镜像，不再请求 /history
+        requests = self.history_requests
+        snapshot = await self.plugin._get_history(self.url)
+        self.assertEqual(snapshot.find('a')[0], 'queue')
+        self.assertEqual(self.history_requests, requests)
+    
+    async def test_downloads_created_at(self):
+        # Metube 的 timestamp 为纳秒时间戳，转换为秒
+        downloads = {d['url']: d for d in await self.plugin.get_downloads()}
+        self.assertEqual(downloads['https://v/b']['created_at'], 1700000000.5)
+        self.assertIsNone(downloads['https://v/a']['created_at'])
+    
+    async def test_events(self):
+        await self.emit('added', {'id': 'c', 'url': 'https://v/c', 'title': 'C', 'status': 'pending'})
+        await wait_for(lambda: 'https://v/c' in self.mirror.queue)
+        
+        await self.emit('updated', {'id': 'c', 'url': 'https://v/c', 'title': 'C', 'status': 'downloading', 'percent': 50.0})
+        await wait_for(lambda: self.mirror.queue['https://v/c'].get('percent') == 50.0)
+        
+        await self.emit('completed', {'id': 'c', 'url': 'https://v/c', 'title': 'C', 'status': 'finished'})
+        await wait_for(lambda: 'https://v/c' in self.mirror.done)
+        self.assertNotIn('https://v/c', self.mirror.queue)
+        
+        await self.emit('canceled', 'https://v/a')
+        await wait_for(lambda: 'https://v/a' not in self.mirror.queue)
+        
+        await self.emit('all', [[['https://v/d', {'id': 'd', 'url': 'https://v/d', 'status': 'pending'}]], []])
+        await wait_for(lambda: set(self.mirror.queue) == {'https://v/d'})
+        self.assertEqual(self.mirror.done, {})
+        
+        snapshot = await self.plugin._get_history(self.url)
+        self.assertEqual(snapshot.find('d')[0], 'queue')
+        self.assertIsNone(snapshot.find('a'))
+    
+    async def test_malformed_event_falls_back_and_resyncs(self):
+        await self.emit('all', 1)
+        await wait_for(lambda: not self.mirror.synced)
+        
+        # 镜像不可用时轮询 /history
+        requests = self.history_requests
+        snapshot = await self.plugin._get_history(self.url)
+        self.assertEqual(snapshot.find('a')[0], 'queue')
+        self.assertEqual(self.history_requests, requests + 1)
+        
+        # 断开后重连，重新以 /history 为基准同步
+        await wait_for(lambda: self.mirror.synced and len(self.sids) == 2)
+        self.assertEqual(set(self.mirror.queue), {'https://v/a'})
+    
+    async def test_disconnect_falls_back_to_polling(self):
+        await self.sio.disconnect(self.sids[0])
+        await wait_for(lambda: not self.mirror.synced)
+        
+        requests = self.history_requests
+        snapshot = await self.plugin._get_history(self.url)
+        self.assertEqual(snapshot.find('b')[0], 'done')
+        self.assertEqual(self.history_requests, requests + 1)
+        
+        await wait_for(lambda: self.mirror.synced and len(self.sids) == 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
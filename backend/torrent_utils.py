@@ -0,0 +1,139 @@
+"""BT 种子工具
+
+在本地解析磁力链接和 .torrent 文件（bencode）得到 infohash，以及规范化下载 URL，
+无需经过下载平台即可识别同一个资源。
+"""
+import base64
+import hashlib
+import re
+from typing import Any, Optional, Tuple
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+_BTIH_RE = re.compile(r'urn:btih:([0-9a-zA-Z]+)', re.IGNORECASE)
+
+
+class BencodeError(ValueError):
+    """bencode 数据格式错误"""
+    pass
+
+
+def _decode(data: bytes, index: int) -> Tuple[Any, int]:
+    """从 index 处解码一个 bencode 值，返回 (值, 结束位置)"""
+    if index >= len(data):
+        raise BencodeError("数据意外结束")
+    
+    token = data[index:index + 1]
+    
+    if token == b'i':
+        end = data.index(b'e', index)
+        return int(data[index + 1:end]), end + 1
+    
+    if token == b'l':
+        index += 1
+        items = []
+        while data[index:index + 1] != b'e':
+            item, index = _decode(data, index)
+            items.append(item)
+        return items, index + 1
+    
+    if token == b'd':
+        index += 1
+        result = {}
+        while data[index:index + 1] != b'e':
+            key, index = _decode(data, index)
+            value, index = _decode(data, index)
+            result[key] = value
+        return result, index + 1
+    
+    if token.isdigit():
+        colon = data.index(b':', index)
+        length = int(data[index:colon])
+        start = colon + 1
+        if start + length > len(data):
+            raise BencodeError("字符串长度超出数据范围")
+        return data[start:start + length], start + length
+    
+    raise BencodeError(f"无效的 bencode 标记: {token!r}")
+
+
+def bdecode(data: bytes) -> Any:
+    """解码 bencode 数据"""
+    try:
+        value, end = _decode(data, 0)
+    except (IndexError, ValueError) as e:
+        raise BencodeError(f"bencode 解码失败: {e}") from e
+    return value
+
+
+def torrent_infohash(data: bytes) -> str:
+    """计算 .torrent 文件的 infohash（info 字典原始字节的 SHA-1，小写十六进制）"""
+    if data[:1] != b'd':
+        raise BencodeError("种子文件顶层不是字典")
+    
+    try:
+        index = 1
+        while data[index:index + 1] != b'e':
+            key, index = _decode(data, index)
+            start = index
+            _, index = _decode(data, index)
+            if key == b'info':
+                # 直接对原始字节求哈希，避免重新编码带来的差异
+                return hashlib.sha1(data[start:index]).hexdigest()
+    except (IndexError, ValueError) as e:
+        raise BencodeError(f"种子文件解析失败: {e}") from e
+    
+    raise BencodeError("种子文件缺少 info 字典")
+
+
+def magnet_infohash(url: str) -> Optional[str]:
+    """从磁力链接的 xt=urn:btih 中取出 infohash（支持 40 位十六进制和 32 位 base32），返回小写十六进制"""
+    if not url.lower().startswith('magnet:'):
+        return None
+    
+    match = _BTIH_RE.search(url)
+    if not match:
+        return None
+    
+    value = match.group(1)
+    if len(value) == 40 and re.fullmatch(r'[0-9a-fA-F]{40}', value):
+        return value.lower()
+    if len(value) == 32:
+        try:
+            return base64.b32decode(value.upper()).hex()
+        except ValueError:
+            return None
+    return None
+
+
+def normalize_url(url: str) -> str:
+    """规范化 URL：协议和主机小写、去掉默认端口和片段、查询参数排序"""
+    url = url.strip()
+    try:
+        parts = urlsplit(url)
+    except ValueError:
+        return url
+    
+    if parts.scheme not in ('http', 'https'):
+        return url
+    
+    host = (parts.hostname or '').lower()
+    port = parts.port
+    if port and not ((parts.scheme == 'http' and port == 80) or (parts.scheme == 'https' and port == 443)):
+        host = f"{host}:{port}"
+    
+    path = parts.path or '/'
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    
+    return urlunsplit((parts.scheme.lower(), host, path, query, ''))
+
+
+def source_url_for(url: str, infohash: Optional[str] = None) -> str:
+    """资源的规范化地址（下载任务表的 source_url 列，用于去重）
+    
+    BT 资源统一为只包含 infohash 的磁力链接（磁力链接和已知 infohash 的种子链接得到相同的地址），
+    其他资源为规范化的 URL。
+    """
+    infohash = magnet_infohash(url) or infohash
+    if infohash:
+        return f"magnet:?xt=urn:btih:{infohash.lower()}"
+    return normalize_url(url)